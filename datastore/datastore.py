@@ -1,6 +1,10 @@
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Set, Tuple
 import asyncio
+import os
+
+import numpy as np
+from loguru import logger
 
 from models.models import (
     Document,
@@ -10,37 +14,226 @@ from models.models import (
     QueryResult,
     QueryWithEmbedding,
 )
-from services.chunks import get_document_chunks
-from services.embeddings import get_embeddings
+from services.chunks import chunk_documents, embed_chunks, get_document_chunks_async, iter_document_chunk_windows
+from services.embeddings import get_cached_embeddings_async, get_query_embeddings_async
+from services.lexical_index import LexicalIndex, get_lexical_index
+from services.mmr import maximal_marginal_relevance
+from services.query_cache import get_query_cache, invalidate_query_cache
+from services.rank_fusion import reciprocal_rank_fusion
+
+UPSERT_STREAM_WINDOW_SIZE = int(os.environ.get("UPSERT_STREAM_WINDOW_SIZE", 256))  # Chunks per embed and insert window
+UPSERT_STREAM_QUEUE_SIZE = int(os.environ.get("UPSERT_STREAM_QUEUE_SIZE", 2))  # Windows buffered between pipeline stages
 
 
 class DataStore(ABC):
     async def upsert(
-        self, documents: List[Document], source_id: str, chunk_token_size: Optional[int] = None
+        self,
+        documents: List[Document],
+        source_id: str,
+        chunk_token_size: Optional[int] = None,
+        stream: Optional[bool] = None,
+        delta: Optional[bool] = None,
     ) -> List[str]:
         """
         Takes in a list of documents and inserts them into the database.
         First deletes all the existing vectors with the document id (if necessary, depends on the vector db), then inserts the new ones.
+        When delta is True, or None and UPSERT_DELTA is "true", only changed chunks are written by upsert_delta.
+        Otherwise, when stream is True, or None and UPSERT_STREAMING is "true", chunks are embedded and inserted in windows by upsert_stream.
+        Return a list of document ids.
+        Cached query results of the source_id are invalidated once the upsert finishes or fails.
+        """
+        try:
+            return await self._upsert_documents(documents, source_id, chunk_token_size, stream, delta)
+        finally:
+            invalidate_query_cache(source_id)
+
+    async def _upsert_documents(
+        self,
+        documents: List[Document],
+        source_id: str,
+        chunk_token_size: Optional[int],
+        stream: Optional[bool],
+        delta: Optional[bool],
+    ) -> List[str]:
+        if delta is None:
+            delta = os.environ.get("UPSERT_DELTA", "false").lower() == "true"
+        if delta:
+            return await self.upsert_delta(documents, source_id, chunk_token_size)
+
+        if stream is None:
+            stream = os.environ.get("UPSERT_STREAMING", "false").lower() == "true"
+        if stream:
+            return await self.upsert_stream(documents, source_id, chunk_token_size)
+
+        await self._delete_existing(documents, source_id)
+
+        chunks = await get_document_chunks_async(documents, chunk_token_size)
+
+        return await self._insert(chunks, source_id)
+
+    async def upsert_stream(
+        self,
+        documents: List[Document],
+        source_id: str,
+        chunk_token_size: Optional[int] = None,
+        window_size: int = UPSERT_STREAM_WINDOW_SIZE,
+    ) -> List[str]:
+        """
+        Upserts documents through a chunk, embed and insert pipeline that works on windows of window_size chunks.
+
+        The stages run concurrently and are connected by queues of UPSERT_STREAM_QUEUE_SIZE windows, so one
+        window is embedded while the previous one is inserted, and memory is bounded by the window size rather
+        than by the number of documents. Chunks of a document may be inserted over several _upsert calls.
+        Return a list of document ids.
+        """
+        await self._delete_existing(documents, source_id)
+
+        chunked: asyncio.Queue = asyncio.Queue(maxsize=UPSERT_STREAM_QUEUE_SIZE)
+        embedded: asyncio.Queue = asyncio.Queue(maxsize=UPSERT_STREAM_QUEUE_SIZE)
+        doc_ids: Dict[str, None] = {}
+
+        async def chunk_stage():
+            async for window in iter_document_chunk_windows(documents, chunk_token_size, window_size):
+                await chunked.put(window)
+            await chunked.put(None)
+
+        async def embed_stage():
+            while (window := await chunked.get()) is not None:
+                await embed_chunks([chunk for doc_chunks in window.values() for chunk in doc_chunks])
+                await embedded.put(window)
+            await embedded.put(None)
+
+        async def insert_stage():
+            while (window := await embedded.get()) is not None:
+                doc_ids.update(dict.fromkeys(await self._insert(window, source_id)))
+
+        tasks = [asyncio.create_task(stage()) for stage in (chunk_stage, embed_stage, insert_stage)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # If a stage failed, stop the others rather than leave them blocked on a full queue
+            for task in tasks:
+                task.cancel()
+
+        return list(doc_ids)
+
+    async def upsert_delta(
+        self, documents: List[Document], source_id: str, chunk_token_size: Optional[int] = None
+    ) -> List[str]:
+        """
+        Upserts documents by diffing their chunks against the chunks already stored for each document id.
+
+        Chunks get content hash ids (see services.chunks.get_content_chunk_ids), so a chunk that is already
+        stored under its id is left alone. Only new or changed chunks are embedded and inserted, and only stored
+        chunks that are no longer part of a document are deleted. Providers that do not implement _get_chunk_ids
+        fall back to deleting and re-inserting every chunk of the documents.
         Return a list of document ids.
         """
-        # Delete any existing vectors for documents with the input document ids
+        chunks, _ = await asyncio.to_thread(chunk_documents, documents, chunk_token_size, True)
+
+        try:
+            stored = await self._get_chunk_ids(source_id, [document.id for document in documents if document.id])
+        except NotImplementedError:
+            logger.info(f"{type(self).__name__} cannot list stored chunk ids, running a full upsert")
+            await self._delete_existing(documents, source_id)
+            await embed_chunks([chunk for doc_chunks in chunks.values() for chunk in doc_chunks])
+            return await self._insert(chunks, source_id)
+
+        new_chunks: Dict[str, List[DocumentChunk]] = {}
+        removed_ids: List[str] = []
+        for doc_id, doc_chunks in chunks.items():
+            stored_ids = stored.get(doc_id, set())
+            new_chunks[doc_id] = [chunk for chunk in doc_chunks if chunk.id not in stored_ids]
+            removed_ids.extend(stored_ids - {chunk.id for chunk in doc_chunks})
+
+        all_new = [chunk for doc_chunks in new_chunks.values() for chunk in doc_chunks]
+        total = sum(len(doc_chunks) for doc_chunks in chunks.values())
+        logger.info(
+            f"Delta upsert of {len(chunks)} documents: {len(all_new)} new or changed chunks, "
+            f"{total - len(all_new)} unchanged, {len(removed_ids)} removed"
+        )
+
+        # Insert before deleting so queries never see a document with some of its chunks missing
+        await embed_chunks(all_new)
+        doc_ids = await self._insert(new_chunks, source_id)
+        if removed_ids:
+            await self._delete_chunks(source_id, removed_ids)
+            lexical_index = get_lexical_index()
+            if lexical_index is not None:
+                await asyncio.to_thread(lexical_index.delete_chunks, source_id, removed_ids)
+
+        return doc_ids
+
+    async def _get_chunk_ids(self, source_id: str, document_ids: List[str]) -> Dict[str, Set[str]]:
+        """
+        Returns the ids of the chunks stored for each of the given document ids. Documents without stored
+        chunks may be left out. Providers that support delta upserts implement this and _delete_chunks.
+        """
+        raise NotImplementedError
+
+    async def _delete_chunks(self, source_id: str, chunk_ids: List[str]):
+        """
+        Removes the chunks with the given chunk ids.
+        """
+        raise NotImplementedError
+
+    async def _get_chunk_embeddings(self, source_id: str, chunk_ids: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Returns the stored vectors of the given chunk ids, for MMR. Chunks that are not stored may be left out.
+        Providers that cannot read their vectors back leave this unimplemented.
+        """
+        raise NotImplementedError
+
+    async def _delete_existing(self, documents: List[Document], source_id: str):
+        """
+        Deletes any existing vectors for documents with the input document ids, in one _delete_documents
+        call where the provider supports it and one delete call per document otherwise.
+        """
+        document_ids = list(dict.fromkeys(document.id for document in documents if document.id))
+        if not document_ids:
+            return
+
+        lexical_index = get_lexical_index()
+        if lexical_index is not None:
+            await asyncio.to_thread(lexical_index.delete_documents, source_id, document_ids)
+
+        try:
+            await self._delete_documents(source_id, document_ids)
+            return
+        except NotImplementedError:
+            pass
+
         await asyncio.gather(
             *[
-                self.delete(
+                self._delete(
                     source_id=source_id,
                     filter=DocumentMetadataFilter(
-                        document_id=document.id,
+                        document_id=document_id,
                     ),
                     delete_all=False,
                 )
-                for document in documents
-                if document.id
+                for document_id in document_ids
             ]
         )
 
-        chunks = get_document_chunks(documents, chunk_token_size)
+    async def _delete_documents(self, source_id: str, document_ids: List[str]):
+        """
+        Removes every chunk of the given documents in as few round trips as the provider allows.
+        Providers without a native bulk delete leave this unimplemented.
+        """
+        raise NotImplementedError
 
-        return await self._upsert(chunks, source_id)
+    async def _insert(self, chunks: Dict[str, List[DocumentChunk]], source_id: str) -> List[str]:
+        """
+        Inserts chunks with _upsert and, when HYBRID_SEARCH_ENABLED is "true", adds them to the lexical index.
+        Return a list of document ids.
+        """
+        doc_ids = await self._upsert(chunks, source_id)
+        lexical_index = get_lexical_index()
+        # Providers that fail to insert return no ids, keep the lexical index in line with them
+        if lexical_index is not None and doc_ids:
+            await asyncio.to_thread(lexical_index.add, source_id, chunks)
+        return doc_ids
 
     @abstractmethod
     async def _upsert(self, chunks: Dict[str, List[DocumentChunk]], source_id: str) -> List[str]:
@@ -54,17 +247,178 @@ class DataStore(ABC):
     async def query(self, queries: List[Query]) -> List[QueryResult]:
         """
         Takes in a list of queries and filters and returns a list of query results with matching document chunks and scores.
+        When QUERY_CACHE_ENABLED is "true", cached results are reused and only the remaining queries are run.
+        When HYBRID_SEARCH_ENABLED is "true", vector results are fused with BM25 results from the lexical index,
+        and scores are reciprocal rank fusion scores.
+        When a query has an MMR lambda below 1, from mmr_lambda or MMR_LAMBDA, mmr_fetch_multiplier times top_k
+        candidates are retrieved and reordered into a diverse top_k by maximal marginal relevance, keeping their scores.
+        """
+        embedding_model = queries[0].embedding_model
+        cache = get_query_cache()
+        if cache is None:
+            return await self._query_with_embeddings(queries, embedding_model)
+
+        # Keys are taken before querying so results that race with an upsert are stored under a stale generation
+        keys = [cache.key(query, embedding_model) for query in queries]
+        results: List[Optional[QueryResult]] = [cache.get(key) for key in keys]
+        misses = [i for i, result in enumerate(results) if result is None]
+        if misses:
+            missed_results = await self._query_with_embeddings([queries[i] for i in misses], embedding_model)
+            for i, result in zip(misses, missed_results):
+                cache.put(keys[i], result)
+                results[i] = result
+
+        return results
+
+    async def _query_with_embeddings(self, queries: List[Query], embedding_model: Optional[str]) -> List[QueryResult]:
+        mmr_params = [_get_mmr_params(query) for query in queries]
+        if all(lambda_mult is None for lambda_mult, _ in mmr_params):
+            results, _ = await self._query_candidates(queries, embedding_model)
+            return results
+
+        # Over-fetch the queries to diversify, their results are cut back to top_k by MMR
+        candidate_queries = [
+            query if lambda_mult is None else query.copy(update={"top_k": (query.top_k or 0) * multiplier})
+            for query, (lambda_mult, multiplier) in zip(queries, mmr_params)
+        ]
+        results, query_embeddings = await self._query_candidates(candidate_queries, embedding_model)
+        return await self._diversify(queries, results, query_embeddings, mmr_params, embedding_model)
+
+    async def _diversify(
+        self,
+        queries: List[Query],
+        results: List[QueryResult],
+        query_embeddings: np.ndarray,
+        mmr_params: List[Tuple[Optional[float], int]],
+        embedding_model: Optional[str],
+    ) -> List[QueryResult]:
+        """
+        Cut the over-fetched results of the queries with MMR on down to a diverse top_k.
+
+        Candidate vectors are read back from the provider with _get_chunk_embeddings, or else looked up in the
+        embedding cache, where their upsert usually left them. Candidates are never embedded again: a query with
+        candidates missing from both is cut to its top_k by relevance instead.
+        """
+        diversified = [i for i, (lambda_mult, _) in enumerate(mmr_params) if lambda_mult is not None]
+
+        chunk_ids: Dict[str, Dict[str, None]] = {}
+        for i in diversified:
+            for chunk in results[i].results:
+                if chunk.embedding is None and chunk.id:
+                    chunk_ids.setdefault(queries[i].source_id, {})[chunk.id] = None
+        stored: Dict[Tuple[str, str], np.ndarray] = {}
+        try:
+            source_embeddings = await asyncio.gather(
+                *[self._get_chunk_embeddings(source_id, list(ids)) for source_id, ids in chunk_ids.items()]
+            )
+            for source_id, embeddings in zip(chunk_ids, source_embeddings):
+                stored.update(((source_id, chunk_id), embedding) for chunk_id, embedding in embeddings.items())
+        except NotImplementedError:
+            pass
+
+        missing_texts = list(
+            dict.fromkeys(
+                chunk.text
+                for i in diversified
+                for chunk in results[i].results
+                if chunk.embedding is None and (queries[i].source_id, chunk.id) not in stored
+            )
+        )
+        cached = {}
+        if missing_texts:
+            cached_embeddings = await get_cached_embeddings_async(missing_texts, embedding_model)
+            cached = {
+                text: embedding for text, embedding in zip(missing_texts, cached_embeddings) if embedding is not None
+            }
+
+        diversified_results = list(results)
+        for i in diversified:
+            query, result, (lambda_mult, _) = queries[i], results[i], mmr_params[i]
+            if not result.results:
+                continue
+            top_k = query.top_k or 0
+            candidate_embeddings = [
+                chunk.embedding if chunk.embedding is not None
+                else stored.get((query.source_id, chunk.id), cached.get(chunk.text))
+                for chunk in result.results
+            ]
+            missing = sum(embedding is None for embedding in candidate_embeddings)
+            if missing:
+                logger.warning(
+                    f"MMR skipped for a query on '{query.source_id}': {missing} of {len(candidate_embeddings)} "
+                    "candidates have no stored or cached vector"
+                )
+                diversified_results[i] = QueryResult(query=result.query, results=result.results[:top_k])
+                continue
+
+            selected = maximal_marginal_relevance(
+                query_embeddings[i], np.stack(candidate_embeddings), top_k, lambda_mult
+            )
+            diversified_results[i] = QueryResult(query=result.query, results=[result.results[j] for j in selected])
+        return diversified_results
+
+    async def _query_candidates(
+        self, queries: List[Query], embedding_model: Optional[str]
+    ) -> Tuple[List[QueryResult], np.ndarray]:
+        lexical_index = get_lexical_index()
+        if lexical_index is None:
+            return await self._query_vectors(queries, embedding_model)
+
+        weights = [_get_hybrid_weights(query) for query in queries]
+        if all(lexical_weight <= 0 for _, lexical_weight in weights):
+            return await self._query_vectors(queries, embedding_model)
+        return await self._query_hybrid(queries, embedding_model, lexical_index, weights)
+
+    async def _query_hybrid(
+        self,
+        queries: List[Query],
+        embedding_model: Optional[str],
+        lexical_index: LexicalIndex,
+        weights: List[Tuple[float, float]],
+    ) -> Tuple[List[QueryResult], np.ndarray]:
         """
+        Runs the vector and BM25 searches of the queries concurrently and fuses them with reciprocal rank fusion.
+        Each leg fetches HYBRID_CANDIDATES_MULTIPLIER times top_k candidates.
+        """
+        multiplier = int(os.environ.get("HYBRID_CANDIDATES_MULTIPLIER", 2))
+        rrf_k = int(os.environ.get("HYBRID_RRF_K", 60))
+        candidate_queries = [query.copy(update={"top_k": (query.top_k or 0) * multiplier}) for query in queries]
+
+        def lexical_search():
+            return [
+                lexical_index.search(query.source_id, query.query, query.top_k, query.filter) if lexical_weight > 0 else []
+                for query, (_, lexical_weight) in zip(candidate_queries, weights)
+            ]
+
+        (vector_results, query_embeddings), lexical_results = await asyncio.gather(
+            self._query_vectors(candidate_queries, embedding_model),
+            asyncio.to_thread(lexical_search),
+        )
+        results = [
+            QueryResult(
+                query=query.query,
+                results=reciprocal_rank_fusion(
+                    [vector_result.results, lexical_result], list(query_weights), query.top_k or 0, rrf_k
+                ),
+            )
+            for query, vector_result, lexical_result, query_weights in zip(
+                queries, vector_results, lexical_results, weights
+            )
+        ]
+        return results, query_embeddings
+
+    async def _query_vectors(
+        self, queries: List[Query], embedding_model: Optional[str]
+    ) -> Tuple[List[QueryResult], np.ndarray]:
         # get a list of of just the queries from the Query list
         query_texts = [query.query for query in queries]
-        embedding_model = queries[0].embedding_model
-        query_embeddings = get_embeddings(query_texts, embedding_model)
+        query_embeddings = await get_query_embeddings_async(query_texts, embedding_model)
         # hydrate the queries with embeddings
         queries_with_embeddings = [
             QueryWithEmbedding(**query.dict(), embedding=embedding)
             for query, embedding in zip(queries, query_embeddings)
         ]
-        return await self._query(queries_with_embeddings)
+        return await self._query(queries_with_embeddings), query_embeddings
 
     @abstractmethod
     async def _query(self, queries: List[QueryWithEmbedding]) -> List[QueryResult]:
@@ -73,13 +427,38 @@ class DataStore(ABC):
         """
         raise NotImplementedError
 
-    @abstractmethod
     async def delete(
         self,
         source_id: str,
         ids: Optional[List[str]] = None,
         filter: Optional[DocumentMetadataFilter] = None,
         delete_all: Optional[bool] = None,
+    ) -> bool:
+        """
+        Removes vectors by ids, filter, or everything in the datastore.
+        Multiple parameters can be used at once.
+        Returns whether the operation was successful.
+        When hybrid search is enabled, the same chunks are removed from the lexical index.
+        Cached query results of the source_id are invalidated once the delete finishes or fails.
+        """
+        try:
+            success = await self._delete(source_id=source_id, ids=ids, filter=filter, delete_all=delete_all)
+            lexical_index = get_lexical_index()
+            if lexical_index is not None:
+                await asyncio.to_thread(
+                    lexical_index.delete, source_id, ids=ids, filter=filter, delete_all=delete_all
+                )
+            return success
+        finally:
+            invalidate_query_cache(source_id)
+
+    @abstractmethod
+    async def _delete(
+        self,
+        source_id: str,
+        ids: Optional[List[str]] = None,
+        filter: Optional[DocumentMetadataFilter] = None,
+        delete_all: Optional[bool] = None,
     ) -> bool:
         """
         Removes vectors by ids, filter, or everything in the datastore.
@@ -87,3 +466,32 @@ class DataStore(ABC):
         Returns whether the operation was successful.
         """
         raise NotImplementedError
+
+
+def _get_hybrid_weights(query: Query) -> Tuple[float, float]:
+    vector_weight = query.vector_weight
+    if vector_weight is None:
+        vector_weight = float(os.environ.get("HYBRID_VECTOR_WEIGHT", 1.0))
+    lexical_weight = query.lexical_weight
+    if lexical_weight is None:
+        lexical_weight = float(os.environ.get("HYBRID_LEXICAL_WEIGHT", 1.0))
+    return vector_weight, lexical_weight
+
+
+def _get_mmr_params(query: Query) -> Tuple[Optional[float], int]:
+    """
+    Return the MMR lambda of a query, None when MMR is off, and its candidate fetch multiplier.
+    """
+    lambda_mult = query.mmr_lambda
+    if lambda_mult is None and os.environ.get("MMR_LAMBDA"):
+        lambda_mult = float(os.environ["MMR_LAMBDA"])
+    # A lambda of 1 ranks by relevance alone, which retrieval already did
+    if lambda_mult is not None and lambda_mult >= 1:
+        lambda_mult = None
+    if lambda_mult is not None:
+        lambda_mult = max(lambda_mult, 0.0)
+
+    multiplier = query.mmr_fetch_multiplier
+    if multiplier is None:
+        multiplier = int(os.environ.get("MMR_FETCH_MULTIPLIER", 4))
+    return lambda_mult, max(multiplier, 1)
@@ -56,6 +56,10 @@ async def get_datastore() -> DataStore:
             from datastore.providers.analyticdb_datastore import AnalyticDBDataStore
 
             return AnalyticDBDataStore()
+        case "numpy":
+            from datastore.providers.numpy_datastore import NumpyDataStore
+
+            return NumpyDataStore()
         case "elasticsearch":
             from datastore.providers.elasticsearch_datastore import (
                 ElasticsearchDataStore,
@@ -65,5 +69,5 @@ async def get_datastore() -> DataStore:
         case _:
             raise ValueError(
                 f"Unsupported vector database: {datastore}. "
-                f"Try one of the following: llama, elasticsearch, pinecone, weaviate, milvus, zilliz, redis, azuresearch, or qdrant"
+                f"Try one of the following: llama, elasticsearch, pinecone, weaviate, milvus, zilliz, redis, azuresearch, numpy, or qdrant"
             )
@@ -12,6 +12,7 @@ from psycopg2.extras import DictCursor
 from psycopg2.pool import SimpleConnectionPool
 
 from services.date import to_unix_timestamp
+from services.embedding_models import get_embedding_dimension
 from datastore.datastore import DataStore
 from models.models import (
     DocumentChunk,
@@ -20,6 +21,7 @@ from models.models import (
     QueryResult,
     QueryWithEmbedding,
     DocumentChunkWithScore,
+    embedding_to_list,
 )
 
 PG_CONFIG = {
@@ -30,7 +32,13 @@ PG_CONFIG = {
     "host": os.environ.get("PG_HOST", "localhost"),
     "port": int(os.environ.get("PG_PORT", "5432")),
 }
-OUTPUT_DIM = 1536
+
+
+def __getattr__(name: str):
+    # The dimension is resolved on use, importing this module must not load or probe the embedding model
+    if name == "OUTPUT_DIM":
+        return get_embedding_dimension()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class AnalyticDBDataStore(DataStore):
@@ -41,6 +49,7 @@ class AnalyticDBDataStore(DataStore):
         self.database = config["database"]
         self.host = config["host"]
         self.port = config["port"]
+        self.dimension = get_embedding_dimension()  # Dimension of the configured EMBEDDING_MODEL
 
         self.connection_pool = SimpleConnectionPool(
             minconn=1,
@@ -99,7 +108,7 @@ class AnalyticDBDataStore(DataStore):
                 USING ann(embedding)
                 WITH (
                     distancemeasure=L2,
-                    dim=OUTPUT_DIM,
+                    dim={self.dimension},
                     pq_segments=64,
                     hnsw_m=100,
                     pq_centers=2048
@@ -131,7 +140,7 @@ class AnalyticDBDataStore(DataStore):
         data = (
             chunk.id,
             chunk.text,
-            chunk.embedding,
+            embedding_to_list(chunk.embedding),
             chunk.metadata.document_id,
             chunk.metadata.source,
             chunk.metadata.source_id,
@@ -259,7 +268,7 @@ class AnalyticDBDataStore(DataStore):
         finally:
             self.connection_pool.putconn(conn)
 
-    async def delete(
+    async def _delete(
         self,
         ids: Optional[List[str]] = None,
         filter: Optional[DocumentMetadataFilter] = None,
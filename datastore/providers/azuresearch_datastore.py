@@ -17,7 +17,9 @@ from loguru import logger
 from datastore.datastore import DataStore
 from models.models import (DocumentChunk, DocumentChunkMetadata,
                            DocumentChunkWithScore, DocumentMetadataFilter,
-                           Query, QueryResult, QueryWithEmbedding)
+                           Query, QueryResult, QueryWithEmbedding,
+                           embedding_to_list)
+from services.embedding_models import get_embedding_dimension
 
 AZURESEARCH_SERVICE = os.environ.get("AZURESEARCH_SERVICE")
 AZURESEARCH_INDEX = os.environ.get("AZURESEARCH_INDEX")
@@ -25,7 +27,7 @@ AZURESEARCH_API_KEY = os.environ.get("AZURESEARCH_API_KEY")
 AZURESEARCH_SEMANTIC_CONFIG = os.environ.get("AZURESEARCH_SEMANTIC_CONFIG")
 AZURESEARCH_LANGUAGE = os.environ.get("AZURESEARCH_LANGUAGE", "en-us")
 AZURESEARCH_DISABLE_HYBRID = os.environ.get("AZURESEARCH_DISABLE_HYBRID")
-AZURESEARCH_DIMENSIONS = os.environ.get("AZURESEARCH_DIMENSIONS", 1536) # Default to OpenAI's ada-002 embedding model vector size
+AZURESEARCH_DIMENSIONS = int(os.environ.get("AZURESEARCH_DIMENSIONS", 0))  # 0 defaults to the configured embedding model's vector size
 assert AZURESEARCH_SERVICE is not None
 assert AZURESEARCH_INDEX is not None
 
@@ -80,7 +82,7 @@ class AzureSearchDataStore(DataStore):
                     # base64-encode the id string to stay within Azure Search's valid characters for keys
                     FIELDS_ID: base64.urlsafe_b64encode(bytes(chunk.id, "utf-8")).decode("ascii"),
                     FIELDS_TEXT: chunk.text,
-                    FIELDS_EMBEDDING: chunk.embedding,
+                    FIELDS_EMBEDDING: embedding_to_list(chunk.embedding),
                     FIELDS_DOCUMENT_ID: document_id,
                     FIELDS_SOURCE: chunk.metadata.source,
                     FIELDS_SOURCE_ID: chunk.metadata.source_id,
@@ -98,7 +100,7 @@ class AzureSearchDataStore(DataStore):
 
         return ids
 
-    async def delete(self, ids: Optional[List[str]] = None, filter: Optional[DocumentMetadataFilter] = None, delete_all: Optional[bool] = None) -> bool:
+    async def _delete(self, ids: Optional[List[str]] = None, filter: Optional[DocumentMetadataFilter] = None, delete_all: Optional[bool] = None) -> bool:
         filter = None if delete_all else self._translate_filter(filter)
         if delete_all or filter is not None:
             deleted = set()
@@ -120,7 +122,7 @@ class AzureSearchDataStore(DataStore):
         if ids is not None and len(ids) > 0:
             for id in ids:
                 logger.info(f"Deleting chunks for document id {id}")
-                await self.delete(filter=DocumentMetadataFilter(document_id=id))
+                await self._delete(filter=DocumentMetadataFilter(document_id=id))
 
         return True
 
@@ -139,7 +141,7 @@ class AzureSearchDataStore(DataStore):
             vector_top_k = query.top_k if filter is None else query.top_k * 2
             if not AZURESEARCH_DISABLE_HYBRID: vector_top_k *= 2
             q = query.query if not AZURESEARCH_DISABLE_HYBRID else None
-            vector_q = Vector(value=query.embedding, k=vector_top_k, fields=FIELDS_EMBEDDING)
+            vector_q = Vector(value=embedding_to_list(query.embedding), k=vector_top_k, fields=FIELDS_EMBEDDING)
             if AZURESEARCH_SEMANTIC_CONFIG != None and not AZURESEARCH_DISABLE_HYBRID:
                 # Ensure we're feeding a good number of candidates to the L2 reranker
                 vector_top_k = max(50, vector_top_k)
@@ -226,7 +228,7 @@ class AzureSearchDataStore(DataStore):
                     SearchableField(name=FIELDS_TEXT, type=SearchFieldDataType.String, analyzer_name="standard.lucene"),
                     SearchField(name=FIELDS_EMBEDDING, type=SearchFieldDataType.Collection(SearchFieldDataType.Single), 
                                 hidden=False, searchable=True, filterable=False, sortable=False, facetable=False,
-                                vector_search_dimensions=AZURESEARCH_DIMENSIONS, vector_search_configuration="default"),
+                                vector_search_dimensions=AZURESEARCH_DIMENSIONS or get_embedding_dimension(), vector_search_configuration="default"),
                     SimpleField(name=FIELDS_DOCUMENT_ID, type=SearchFieldDataType.String, filterable=True, sortable=True),
                     SimpleField(name=FIELDS_SOURCE, type=SearchFieldDataType.String, filterable=True, sortable=True),
                     SimpleField(name=FIELDS_SOURCE_ID, type=SearchFieldDataType.String, filterable=True, sortable=True),
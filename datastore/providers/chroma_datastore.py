@@ -23,8 +23,9 @@ from models.models import (
     QueryResult,
     QueryWithEmbedding,
     Source,
+    embedding_to_list,
 )
-from services.chunks import get_document_chunks
+from services.chunks import get_document_chunks_async
 
 CHROMA_IN_MEMORY = os.environ.get("CHROMA_IN_MEMORY", "True")
 CHROMA_PERSISTENCE_DIR = os.environ.get("CHROMA_PERSISTENCE_DIR", "openai")
@@ -78,7 +79,7 @@ class ChromaDataStore(DataStore):
         Return a list of document ids.
         """
 
-        chunks = get_document_chunks(documents, chunk_token_size)
+        chunks = await get_document_chunks_async(documents, chunk_token_size)
 
         # Chroma has a true upsert, so we don't need to delete first
         return await self._upsert(chunks)
@@ -92,7 +93,7 @@ class ChromaDataStore(DataStore):
         self._collection.upsert(
             ids=[chunk.id for chunk_list in chunks.values() for chunk in chunk_list],
             embeddings=[
-                chunk.embedding
+                embedding_to_list(chunk.embedding)
                 for chunk_list in chunks.values()
                 for chunk in chunk_list
             ],
@@ -180,7 +181,7 @@ class ChromaDataStore(DataStore):
         """
         results = [
             self._collection.query(
-                query_embeddings=[query.embedding],
+                query_embeddings=[embedding_to_list(query.embedding)],
                 include=["documents", "distances", "metadatas"],  # embeddings
                 n_results=min(query.top_k, self._collection.count()),  # type: ignore
                 where=(
@@ -217,7 +218,7 @@ class ChromaDataStore(DataStore):
 
         return output
 
-    async def delete(
+    async def _delete(
         self,
         ids: Optional[List[str]] = None,
         filter: Optional[DocumentMetadataFilter] = None,
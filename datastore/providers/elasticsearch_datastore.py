@@ -12,8 +12,10 @@ from models.models import (
     DocumentMetadataFilter,
     QueryResult,
     QueryWithEmbedding,
+    embedding_to_list,
 )
 from services.date import to_unix_timestamp
+from services.embedding_models import get_embedding_model_info
 
 ELASTICSEARCH_URL = os.environ.get("ELASTICSEARCH_URL", "http://localhost:9200")
 ELASTICSEARCH_CLOUD_ID = os.environ.get("ELASTICSEARCH_CLOUD_ID")
@@ -25,16 +27,18 @@ ELASTICSEARCH_INDEX = os.environ.get("ELASTICSEARCH_INDEX")
 ELASTICSEARCH_REPLICAS = int(os.environ.get("ELASTICSEARCH_REPLICAS", "1"))
 ELASTICSEARCH_SHARDS = int(os.environ.get("ELASTICSEARCH_SHARDS", "1"))
 
-VECTOR_SIZE = 1536
 UPSERT_BATCH_SIZE = 100
 
+# dense_vector similarity for each embedding model metric. dot_product requires unit-length vectors
+ELASTICSEARCH_SIMILARITIES = {"cosine": "cosine", "dot": "dot_product", "l2": "l2_norm"}
+
 
 class ElasticsearchDataStore(DataStore):
     def __init__(
         self,
         index_name: Optional[str] = None,
-        vector_size: int = VECTOR_SIZE,
-        similarity: str = "cosine",
+        vector_size: Optional[int] = None,
+        similarity: Optional[str] = None,
         replicas: int = ELASTICSEARCH_REPLICAS,
         shards: int = ELASTICSEARCH_SHARDS,
         recreate_index: bool = True,
@@ -42,11 +46,20 @@ class ElasticsearchDataStore(DataStore):
         """
         Args:
             index_name: Name of the index to be used
-            vector_size: Size of the embedding stored in a collection
+            vector_size: Size of the embedding stored in a collection, defaults to
+                the dimension of the configured embedding model
             similarity:
-                Any of "cosine" / "l2_norm" / "dot_product".
+                Any of "cosine" / "l2_norm" / "dot_product", defaults to the embedding
+                model's preferred metric
 
         """
+        model_info = get_embedding_model_info()
+        vector_size = vector_size or model_info.dimension
+        if similarity is None:
+            similarity = ELASTICSEARCH_SIMILARITIES[model_info.metric]
+            if similarity == "dot_product" and not model_info.normalized:
+                similarity = "cosine"
+
         assert similarity in [
             "cosine",
             "l2_norm",
@@ -109,7 +122,7 @@ class ElasticsearchDataStore(DataStore):
             for query, result in zip(queries, results["responses"])
         ]
 
-    async def delete(
+    async def _delete(
         self,
         ids: Optional[List[str]] = None,
         filter: Optional[DocumentMetadataFilter] = None,
@@ -213,7 +226,7 @@ class ElasticsearchDataStore(DataStore):
             "text": document_chunk.text,
             "metadata": document_chunk.metadata.dict(),
             "created_at": created_at,
-            "embedding": document_chunk.embedding,
+            "embedding": embedding_to_list(document_chunk.embedding),
         }
 
         return [action_and_metadata, source]
@@ -228,7 +241,7 @@ class ElasticsearchDataStore(DataStore):
                     "_source": True,
                     "knn": {
                         "field": "embedding",
-                        "query_vector": query.embedding,
+                        "query_vector": embedding_to_list(query.embedding),
                         "k": query.top_k,
                         "num_candidates": query.top_k,
                     },
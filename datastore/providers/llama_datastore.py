@@ -3,7 +3,7 @@ import os
 from typing import Dict, List, Optional, Type
 from loguru import logger
 from datastore.datastore import DataStore
-from models.models import DocumentChunk, DocumentChunkMetadata, DocumentChunkWithScore, DocumentMetadataFilter, Query, QueryResult, QueryWithEmbedding
+from models.models import DocumentChunk, DocumentChunkMetadata, DocumentChunkWithScore, DocumentMetadataFilter, Query, QueryResult, QueryWithEmbedding, embedding_to_list
 
 from llama_index.indices.base import BaseGPTIndex
 from llama_index.indices.vector_store.base import GPTVectorStoreIndex
@@ -66,7 +66,7 @@ def _doc_chunk_to_node(doc_chunk: DocumentChunk, source_doc_id: str) -> Node:
     return Node(
         doc_id=doc_chunk.id,
         text=doc_chunk.text,
-        embedding=doc_chunk.embedding,
+        embedding=embedding_to_list(doc_chunk.embedding),
         extra_info=doc_chunk.metadata.dict(),
         relationships={
             DocumentRelationship.SOURCE: source_doc_id
@@ -76,7 +76,7 @@ def _doc_chunk_to_node(doc_chunk: DocumentChunk, source_doc_id: str) -> Node:
 def _query_with_embedding_to_query_bundle(query: QueryWithEmbedding) -> QueryBundle:
     return QueryBundle(
         query_str = query.query,
-        embedding=query.embedding,
+        embedding=embedding_to_list(query.embedding),
     )
 
 def _source_node_to_doc_chunk_with_score(node_with_score: NodeWithScore) -> DocumentChunkWithScore:
@@ -151,7 +151,7 @@ class LlamaDataStore(DataStore):
         
         return query_result_all
 
-    async def delete(
+    async def _delete(
         self,
         ids: Optional[List[str]] = None,
         filter: Optional[DocumentMetadataFilter] = None,
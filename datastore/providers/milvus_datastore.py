@@ -1,11 +1,15 @@
+import asyncio
 import json
 import os
-import asyncio
+import re
+import threading
 import time
 import numpy
 
+from concurrent.futures import ThreadPoolExecutor
 from loguru import logger
-from typing import Dict, List, Optional
+from tenacity import Retrying, wait_random_exponential, stop_after_attempt
+from typing import Dict, List, Optional, Set, Tuple
 from pymilvus import (
     Collection,
     connections,
@@ -15,9 +19,11 @@ from pymilvus import (
     CollectionSchema,
     MilvusException,
 )
+from pymilvus.client.types import LoadState
 from uuid import uuid4
 
 from services.date import to_unix_timestamp
+from services.embedding_models import get_embedding_dimension, get_embedding_model_info
 from datastore.datastore import DataStore
 from models.models import (
     DocumentChunk,
@@ -27,83 +33,192 @@ from models.models import (
     QueryResult,
     QueryWithEmbedding,
     DocumentChunkWithScore,
-    ConnectionInfo
+    ConnectionInfo,
+    embedding_to_list,
 )
 
 MILVUS_INDEX_PARAMS = os.environ.get("MILVUS_INDEX_PARAMS")
 MILVUS_SEARCH_PARAMS = os.environ.get("MILVUS_SEARCH_PARAMS")
 MILVUS_CONSISTENCY_LEVEL = os.environ.get("MILVUS_CONSISTENCY_LEVEL")
 
-UPSERT_BATCH_SIZE = 100
+UPSERT_BATCH_SIZE = int(os.environ.get("MILVUS_UPSERT_BATCH_SIZE", 100))  # Rows per insert call
+UPSERT_BATCH_BYTES = int(os.environ.get("MILVUS_UPSERT_BATCH_BYTES", 16 * 1024 * 1024))  # Estimated payload per insert call
+UPSERT_WORKERS = int(os.environ.get("MILVUS_UPSERT_WORKERS", 4))  # Insert calls sent concurrently
+SEARCH_WORKERS = int(os.environ.get("MILVUS_SEARCH_WORKERS", 4))  # Search calls sent concurrently
+DELETE_EXPR_MAX_LENGTH = int(os.environ.get("MILVUS_DELETE_EXPR_MAX_LENGTH", 65536))  # Characters per delete expression
+SEARCH_BATCH_SIZE = 1024  # Query vectors per search call, below Milvus' default limit of 16384
 EMBEDDING_FIELD = "embedding"
 
-OUTPUT_DIM = 384
-if os.environ.get("EMBEDDING_MODEL", "").lower() == "text-embedding-ada-002":
-    OUTPUT_DIM = 1536
+# Milvus metric type for each embedding model metric, cosine on unit-length vectors is the inner product
+MILVUS_METRIC_TYPES = {"cosine": "COSINE", "dot": "IP", "l2": "L2"}
+
+
+def __getattr__(name: str):
+    # The dimension is resolved on use, importing this module must not load or probe the embedding model
+    if name == "OUTPUT_DIM":
+        return get_embedding_dimension()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 class Required:
     pass
 
-# The fields names that we are going to be storing within Milvus, the field declaration for schema creation, and the default value
-SCHEMA_V1 = [
-    (
-        "pk",
-        FieldSchema(name="pk", dtype=DataType.INT64, is_primary=True, auto_id=True),
-        Required,
-    ),
-    (
-        EMBEDDING_FIELD,
-        FieldSchema(name=EMBEDDING_FIELD, dtype=DataType.FLOAT_VECTOR, dim=OUTPUT_DIM),
-        Required,
-    ),
-    (
-        "text",
-        FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=65535),
-        Required,
-    ),
-    (
-        "document_id",
-        FieldSchema(name="document_id", dtype=DataType.VARCHAR, max_length=65535),
-        "",
-    ),
-    (
-        "source_id",
-        FieldSchema(name="source_id", dtype=DataType.VARCHAR, max_length=65535),
-        "",
-    ),
-    (
-        "id",
-        FieldSchema(name="id",dtype=DataType.VARCHAR,max_length=65535),
-        "",
-    ),
-    (
-        "source",
-        FieldSchema(name="source", dtype=DataType.VARCHAR, max_length=65535),
-        "",
-    ),
-    (   "url",
-        FieldSchema(name="url", dtype=DataType.VARCHAR, max_length=65535),
-         ""
-    ),
-    (   "created_at",
-        FieldSchema(name="created_at", dtype=DataType.INT64),
-         -1
-    ),
-    (
-        "author",
-        FieldSchema(name="author", dtype=DataType.VARCHAR, max_length=65535),
-        "",
-    ),
-    (
-        "json_data",
-        FieldSchema(name="json_data", dtype=DataType.JSON),
-        "",
-    ),
-]
-
-# V2 schema, remomve the "pk" field
-SCHEMA_V2 = SCHEMA_V1[1:]
-SCHEMA_V2[4][1].is_primary = True
+
+def get_metric_type() -> str:
+    """Return the Milvus metric type for the configured embedding model."""
+    model_info = get_embedding_model_info()
+    if model_info.metric == "cosine" and model_info.normalized:
+        return "IP"
+    return MILVUS_METRIC_TYPES[model_info.metric]
+
+
+def build_schemas(dimension: int) -> Tuple[list, list]:
+    """Build the V1 and V2 schemas of a collection holding vectors of the given dimension."""
+    # The fields names that we are going to be storing within Milvus, the field declaration for schema creation, and the default value
+    schema_v1 = [
+        (
+            "pk",
+            FieldSchema(name="pk", dtype=DataType.INT64, is_primary=True, auto_id=True),
+            Required,
+        ),
+        (
+            EMBEDDING_FIELD,
+            FieldSchema(name=EMBEDDING_FIELD, dtype=DataType.FLOAT_VECTOR, dim=dimension),
+            Required,
+        ),
+        (
+            "text",
+            FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=65535),
+            Required,
+        ),
+        (
+            "document_id",
+            FieldSchema(name="document_id", dtype=DataType.VARCHAR, max_length=65535),
+            "",
+        ),
+        (
+            "source_id",
+            FieldSchema(name="source_id", dtype=DataType.VARCHAR, max_length=65535),
+            "",
+        ),
+        (
+            "id",
+            FieldSchema(name="id",dtype=DataType.VARCHAR,max_length=65535),
+            "",
+        ),
+        (
+            "source",
+            FieldSchema(name="source", dtype=DataType.VARCHAR, max_length=65535),
+            "",
+        ),
+        (   "url",
+            FieldSchema(name="url", dtype=DataType.VARCHAR, max_length=65535),
+             ""
+        ),
+        (   "created_at",
+            FieldSchema(name="created_at", dtype=DataType.INT64),
+             -1
+        ),
+        (
+            "author",
+            FieldSchema(name="author", dtype=DataType.VARCHAR, max_length=65535),
+            "",
+        ),
+        (
+            "json_data",
+            FieldSchema(name="json_data", dtype=DataType.JSON),
+            "",
+        ),
+    ]
+
+    # V2 schema, remomve the "pk" field
+    schema_v2 = schema_v1[1:]
+    schema_v2[4][1].is_primary = True
+    return schema_v1, schema_v2
+
+
+# Inserts are blocking gRPC calls that release the GIL, a bounded thread pool sends batches concurrently.
+# Deletes and the chunk id lookups of delta upserts run on it as well
+insert_executor = ThreadPoolExecutor(max_workers=UPSERT_WORKERS, thread_name_prefix="milvus-insert")
+# Searches are blocking too, they run on their own pool so queries never stall the event loop or wait on inserts
+search_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="milvus-search")
+
+
+def _estimate_row_bytes(row: List[any]) -> int:
+    """Estimate the serialized size of a row of insert values, float vectors at 4 bytes per dimension."""
+    size = 0
+    for value in row:
+        if isinstance(value, str):
+            size += len(value.encode("utf-8"))
+        elif isinstance(value, (list, tuple)):
+            size += 4 * len(value)
+        elif isinstance(value, dict):
+            size += len(json.dumps(value))
+        else:
+            size += 8
+    return size
+
+
+def _batch_rows(rows: List[List[any]], max_rows: int, max_bytes: int) -> List[Tuple[List[List[any]], int]]:
+    """Split rows into batches of at most max_rows rows and about max_bytes estimated bytes.
+
+    A row larger than max_bytes on its own gets a batch of its own.
+
+    Returns:
+        List[Tuple[List[List[any]], int]]: Each batch's rows and estimated size in bytes.
+    """
+    batches = []
+    batch: List[List[any]] = []
+    batch_bytes = 0
+    for row in rows:
+        row_bytes = _estimate_row_bytes(row)
+        if batch and (len(batch) >= max_rows or batch_bytes + row_bytes > max_bytes):
+            batches.append((batch, batch_bytes))
+            batch, batch_bytes = [], 0
+        batch.append(row)
+        batch_bytes += row_bytes
+    if batch:
+        batches.append((batch, batch_bytes))
+    return batches
+
+
+def _quote(value: str) -> str:
+    """Quote a string for a Milvus expression."""
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _in_expressions(field: str, values: List[str], max_length: int) -> List[str]:
+    """Build `field in [...]` expressions over the already quoted values, each at most about max_length characters.
+
+    A value longer than max_length on its own gets an expression of its own.
+    """
+    expressions = []
+    batch: List[str] = []
+    length = 0
+    for value in values:
+        if batch and length + len(value) + 1 > max_length:
+            expressions.append(f"{field} in [{','.join(batch)}]")
+            batch, length = [], 0
+        batch.append(value)
+        length += len(value) + 1
+    if batch:
+        expressions.append(f"{field} in [{','.join(batch)}]")
+    return expressions
+
+
+class CollectionHandle:
+    """A cached Collection object and whether it is known to be loaded into memory."""
+
+    def __init__(self, connection_info: ConnectionInfo, collection: Collection):
+        self.connection_info = connection_info
+        self.collection = collection
+        self.loaded = False
+        # Whether the server deletes by any boolean expression rather than by primary keys only, checked on first delete
+        self.expression_delete: Optional[bool] = None
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.connection_info.alias, self.connection_info.collection_name
 
 
 class MilvusDataStore(DataStore):
@@ -125,7 +240,15 @@ class MilvusDataStore(DataStore):
 
         self._consistency_level = MILVUS_CONSISTENCY_LEVEL or consistency_level
         self._schema_ver = "V2"
-        self.search_params = MILVUS_SEARCH_PARAMS or {"metric_type": "IP", "params": {"ef": 10}}
+        self.dimension = get_embedding_dimension()
+        self._schemas = build_schemas(self.dimension)
+        self.metric_type = get_metric_type()
+        self.search_params = (
+            json.loads(MILVUS_SEARCH_PARAMS) if MILVUS_SEARCH_PARAMS else {"metric_type": self.metric_type, "params": {"ef": 10}}
+        )
+        # Collection handles per source_id, source_ids stored in the same collection share one handle
+        self._handles: Dict[str, CollectionHandle] = {}
+        self._handles_lock = threading.Lock()
 
     def _get_connection_info(self, source_id: str) -> ConnectionInfo:
 
@@ -150,7 +273,7 @@ class MilvusDataStore(DataStore):
         )
 
     def _get_schema(self):
-        return SCHEMA_V1 if self._schema_ver == "V1" else SCHEMA_V2
+        return self._schemas[0] if self._schema_ver == "V1" else self._schemas[1]
 
     def _create_connection(self, connection_info: ConnectionInfo) -> Collection:
         try:
@@ -177,11 +300,71 @@ class MilvusDataStore(DataStore):
             logger.error("Failed to create connection to Milvus server '{}:{}', error: {}"
                          .format(connection_info.host, connection_info.port, e))
 
+    def _get_collection(self, source_id: str) -> Collection:
+        """Get the collection of a source_id from the handle cache, connecting, describing and loading it on first use.
+
+        Handles are kept until the collection is dropped, recreated or found unusable, see _invalidate_collection,
+        so queries skip the connection lookup, the describe and the load round trips.
+
+        Args:
+            source_id (str): The source_id to get the collection of.
+
+        Returns:
+            Collection: The loaded collection, or None if it could not be opened.
+        """
+        handle = self._handles.get(source_id)
+        if handle is not None and handle.loaded:
+            return handle.collection
+
+        with self._handles_lock:
+            handle = self._handles.get(source_id)
+            if handle is None:
+                connection_info = self._get_connection_info(source_id)
+                # Reuse the handle of another source_id stored in the same collection
+                handle = next(
+                    (h for h in self._handles.values() if h.key == (connection_info.alias, connection_info.collection_name)),
+                    None,
+                )
+                if handle is None:
+                    collection = self._create_connection(connection_info=connection_info)
+                    if collection is None:
+                        return None
+                    handle = CollectionHandle(connection_info, collection)
+                self._handles[source_id] = handle
+
+            if not handle.loaded:
+                try:
+                    # load() waits on loading progress even when the collection is loaded, check its state first
+                    alias, collection_name = handle.key
+                    if utility.load_state(collection_name, using=alias) != LoadState.Loaded:
+                        handle.collection.load()
+                        logger.info("Loaded Milvus collection '{}'".format(collection_name))
+                    handle.loaded = True
+                except Exception as e:
+                    logger.error("Failed to load collection '{}', error: {}".format(handle.key[1], e))
+            return handle.collection
+
+    def _invalidate_collection(self, source_id: str):
+        """Forget the cached handle of a source_id's collection, and of every source_id sharing that collection.
+
+        Args:
+            source_id (str): The source_id whose collection was dropped, recreated or could not be used.
+        """
+        with self._handles_lock:
+            handle = self._handles.get(source_id)
+            if handle is None:
+                return
+            for other in [s for s, h in self._handles.items() if h.key == handle.key]:
+                del self._handles[other]
+
     def _create_collection(self, connection_info: ConnectionInfo, collection_name, create_new: bool) -> Collection:
         """Create a collection based on environment and passed in variables.
 
         Args:
             create_new (bool): Whether to overwrite if collection already exists.
+
+        Returns:
+            Collection: The created or existing collection.
         """
         try:
             self._schema_ver = "V1"
@@ -192,7 +375,7 @@ class MilvusDataStore(DataStore):
             # Check if the collection doesnt exist
             if utility.has_collection(collection_name, using=connection_info.alias) is False:
                 # If it doesnt exist use the field params from init to create a new schem
-                schema = [field[1] for field in SCHEMA_V2]
+                schema = [field[1] for field in self._schemas[1]]
                 schema = CollectionSchema(schema)
                 # Use the schema to create a new collection
                 col = Collection(
@@ -218,6 +401,7 @@ class MilvusDataStore(DataStore):
                         break
                 logger.info("Milvus collection '{}' already exists with schema {}"
                             .format(collection_name, self._schema_ver))
+            return col
         except Exception as e:
             logger.error("Failed to create collection '{}', error: {}".format(
                 collection_name, e))
@@ -241,7 +425,7 @@ class MilvusDataStore(DataStore):
                     # If no index param supplied, to first create an HNSW index for Milvus
                     try:
                         i_p = {
-                            "metric_type": "IP",
+                            "metric_type": self.metric_type,
                             "index_type": "HNSW",
                             "params": {"M": 8, "efConstruction": 64},
                         }
@@ -256,7 +440,7 @@ class MilvusDataStore(DataStore):
                     except MilvusException:
                         logger.info(
                             "Attempting creation of Milvus default index")
-                        i_p = {"metric_type": "IP",
+                        i_p = {"metric_type": self.metric_type,
                                "index_type": "AUTOINDEX", "params": {}}
                         col.create_index(
                             EMBEDDING_FIELD, index_params=i_p)
@@ -275,12 +459,10 @@ class MilvusDataStore(DataStore):
 
             # col.load()
 
-            if self.search_params is not None:
-                # Convert the string format to JSON format parameters passed by MILVUS_SEARCH_PARAMS
-                self.search_params = json.loads(self.search_params)
-            else:
+            # Search params passed by MILVUS_SEARCH_PARAMS are parsed in __init__
+            if not MILVUS_SEARCH_PARAMS:
                 # The default search params
-                metric_type = "IP"
+                metric_type = self.metric_type
                 if "metric_type" in index_params:
                     metric_type = index_params["metric_type"]
                 default_search_params = {
@@ -314,12 +496,11 @@ class MilvusDataStore(DataStore):
         Returns:
             List[str]: The document_id's that were inserted.
         """
-        try:            
+        try:
             # The doc id's to return for the upsert
             doc_ids: List[str] = []
-            # List to collect all the insert data, skip the "pk" for schema V1
-            offset = 1 if self._schema_ver == "V1" else 0
-            insert_data = [[] for _ in range(len(self._get_schema()) - offset)]
+            # The rows to insert, each holding the values of the fields, without the "pk" for schema V1
+            rows: List[List[any]] = []
 
             # Go through each document chunklist and grab the data
             for doc_id, chunk_list in chunks.items():
@@ -331,32 +512,26 @@ class MilvusDataStore(DataStore):
                     list_of_data = self._get_values(chunk)
                     # Check if the data is valid
                     if list_of_data is not None:
-                        # Append each field to the insert_data
-                        for x in range(len(insert_data)):
-                            insert_data[x].append(list_of_data[x])
-            # Slice up our insert data into batches
-            batches = [
-                insert_data[i: i + UPSERT_BATCH_SIZE]
-                for i in range(0, len(insert_data), UPSERT_BATCH_SIZE)
-            ]
+                        rows.append(list_of_data)
+            # Slice up our rows into batches bounded by row count and payload size
+            batches = _batch_rows(rows, UPSERT_BATCH_SIZE, UPSERT_BATCH_BYTES)
             if len(batches) == 0:
                 return doc_ids
 
-            # Get Milvus connection and collection
-            col = self._create_connection(connection_info=self._get_connection_info(source_id))
-
-            # Attempt to insert each batch into our collection
-            # batch data can work with both V1 and V2 schema
-            for batch in batches:
-                if len(batch[0]) != 0:
-                    try:
-                        logger.info(f"Upserting batch of size {len(batch[0])}")
-                        col.insert(batch)
-                        logger.info(f"Upserted batch successfully")
-                    except Exception as e:
-                        logger.error(
-                            f"Failed to insert batch records, error: {e}")
-                        raise e
+            # Get the cached Milvus collection, opening it on first use blocks, so it runs on the insert pool too
+            loop = asyncio.get_running_loop()
+            col = await loop.run_in_executor(insert_executor, self._get_collection, source_id)
+
+            # Send the batches concurrently on the insert pool, any batch failing all its attempts fails the upsert
+            start = time.perf_counter()
+            await asyncio.gather(
+                *[
+                    loop.run_in_executor(insert_executor, self._insert_batch, source_id, col, batch, batch_bytes)
+                    for batch, batch_bytes in batches
+                ]
+            )
+            seconds = time.perf_counter() - start
+            logger.info("Upserted {:d} rows in {:d} batches in {:.2f}s".format(len(rows), len(batches), seconds))
 
             # This setting perfoms flushes after insert. Small insert == bad to use
             # col.flush()
@@ -365,6 +540,51 @@ class MilvusDataStore(DataStore):
             logger.error("Failed to insert records, error: {}".format(e))
             return []
 
+    def _insert_batch(self, source_id: str, col: Collection, rows: List[List[any]], batch_bytes: int):
+        """Insert a batch of rows in one call, retried on failure.
+
+        Inserts are not idempotent: a call that fails after the server applied it would leave duplicate rows
+        on retry. Before each retry the chunk ids of the batch are deleted, so every attempt starts clean.
+
+        Args:
+            source_id (str): The source_id of the collection.
+            col (Collection): The collection to insert into.
+            rows (List[List[any]]): The rows to insert, with values aligned with the schema fields.
+            batch_bytes (int): The estimated size of the batch, for logging.
+        """
+        for attempt in Retrying(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3)):
+            with attempt:
+                start = time.perf_counter()
+                try:
+                    if attempt.retry_state.attempt_number > 1:
+                        self._delete_batch_rows(source_id, col, rows)
+                    # Insert takes the data column by column, this works with both V1 and V2 schema
+                    col.insert([list(column) for column in zip(*rows)])
+                except Exception as e:
+                    logger.warning("Failed to insert batch of {:d} rows, error: {}".format(len(rows), e))
+                    raise e
+                seconds = time.perf_counter() - start
+                logger.info(
+                    "Inserted batch of {:d} rows ({:.2f} MB) in {:.2f}s, {:.0f} rows/s".format(
+                        len(rows), batch_bytes / 1e6, seconds, len(rows) / max(seconds, 1e-9)
+                    )
+                )
+
+    def _delete_batch_rows(self, source_id: str, col: Collection, rows: List[List[any]]):
+        """Delete whatever a failed insert of the rows may have stored, by their chunk ids.
+
+        Args:
+            source_id (str): The source_id of the collection.
+            col (Collection): The collection the rows were inserted into.
+            rows (List[List[any]]): The rows of the failed insert.
+        """
+        # Rows hold the values of the fields without the "pk" for schema V1, see _get_values
+        offset = 1 if self._schema_ver == "V1" else 0
+        id_index = [field[0] for field in self._get_schema()[offset:]].index("id")
+        delete_count = self._delete_in(source_id, col, "id", [_quote(row[id_index]) for row in rows])
+        if delete_count:
+            logger.info("Deleted {:d} rows left by a failed insert before retrying".format(delete_count))
+
     def _get_values(self, chunk: DocumentChunk) -> List[any] | None:
         """Convert the chunk into a list of values to insert whose indexes align with fields.
 
@@ -376,6 +596,7 @@ class MilvusDataStore(DataStore):
         """
         # Convert DocumentChunk and its sub models to dict
         values = chunk.dict()
+        values["embedding"] = embedding_to_list(values["embedding"])
         # Unpack the metadata into the same dict
         meta = values.pop("metadata")
         values.update(meta)
@@ -411,7 +632,8 @@ class MilvusDataStore(DataStore):
     ) -> List[QueryResult]:
         """Query the QueryWithEmbedding against the MilvusDocumentSearch
 
-        Search the embedding and its filter in the collection.
+        Queries with the same source_id, filter expression and top_k are sent as one multi-vector search,
+        and the results are split back per query.
 
         Args:
             queries (List[QueryWithEmbedding]): The list of searches to perform.
@@ -419,73 +641,111 @@ class MilvusDataStore(DataStore):
         Returns:
             List[QueryResult]: Results for each search.
         """
-        # Async to perform the query, adapted from pinecone implementation
-        async def _single_query(query: QueryWithEmbedding) -> QueryResult:
-            try:
+        # Group the queries that can share a search call, keeping their positions
+        groups: Dict[Tuple[str, Optional[str], Optional[int]], List[int]] = {}
+        for i, query in enumerate(queries):
+            # Set the filter to expression that is valid for Milvus, an empty expression does not filter
+            filter = self._get_filter(query.filter) if query.filter is not None else None
+            groups.setdefault((query.source_id, filter or None, query.top_k), []).append(i)
+
+        # Bound the number of vectors per search call
+        calls: List[Tuple[List[int], Tuple]] = []
+        for (source_id, filter, top_k), positions in groups.items():
+            for i in range(0, len(positions), SEARCH_BATCH_SIZE):
+                batch_positions = positions[i: i + SEARCH_BATCH_SIZE]
+                batch = [queries[j] for j in batch_positions]
+                calls.append((batch_positions, (source_id, filter, top_k, batch)))
+
+        # The searches, and the reopen and retry of a stale collection, block, so they run on the search pool
+        loop = asyncio.get_running_loop()
+        batch_results = await asyncio.gather(
+            *[loop.run_in_executor(search_executor, self._search_batch, *args) for _, args in calls]
+        )
 
-                # Get Milvus connection and collection
-                col = self._create_connection(connection_info=self._get_connection_info(query.source_id))
-                
-                # We may need to do some sort 
-                col.load()
-
-                filter = None
-                # Set the filter to expression that is valid for Milvus
-                if query.filter is not None:
-                    # Either a valid filter or None will be returned
-                    filter = self._get_filter(query.filter)
-
-                # Perform our search
-                return_from = 2 if self._schema_ver == "V1" else 1
-                res = col.search(
-                    data=[query.embedding],
+        results: List[Optional[QueryResult]] = [None] * len(queries)
+        for (batch_positions, _), batch_result in zip(calls, batch_results):
+            for j, result in zip(batch_positions, batch_result):
+                results[j] = result
+        return results  # type: ignore
+
+    def _search_batch(
+        self, source_id: str, filter: Optional[str], top_k: Optional[int], queries: List[QueryWithEmbedding]
+    ) -> List[QueryResult]:
+        """Search the embeddings of several queries sharing a source_id, filter and top_k in one call.
+
+        Args:
+            source_id (str): The source_id of the queries.
+            filter (Optional[str]): The Milvus filter expression of the queries.
+            top_k (Optional[int]): The number of results per query.
+            queries (List[QueryWithEmbedding]): The queries to search.
+
+        Returns:
+            List[QueryResult]: Results for each query, empty for every query if the search failed.
+        """
+        try:
+            # Perform our search
+            return_from = 2 if self._schema_ver == "V1" else 1
+            output_fields = [field[0] for field in self._get_schema()[return_from:]]  # Ignoring pk, embedding
+
+            def search(col: Collection):
+                return col.search(
+                    data=[embedding_to_list(query.embedding) for query in queries],
                     anns_field=EMBEDDING_FIELD,
                     param=self.search_params,
-                    limit=query.top_k,
+                    limit=top_k,
                     expr=filter,
-                    output_fields=[
-                        field[0] for field in self._get_schema()[return_from:]
-                    ],  # Ignoring pk, embedding
+                    output_fields=output_fields,
                 )
-                # Results that will hold our DocumentChunkWithScores
-                results = []
-                # Parse every result for our search
-                for hit in res[0]:  # type: ignore
-                    # The distance score for the search result, falls under DocumentChunkWithScore
-                    score = hit.score
-                    # Our metadata info, falls under DocumentChunkMetadata
-                    metadata = {}
-                    # Grab the values that correspond to our fields, ignore pk and embedding.
-                    for x in [field[0] for field in self._get_schema()[return_from:]]:
-                        metadata[x] = hit.entity.get(x)
-                    # If the source isn't valid, convert to None
-                    if metadata["source"] not in Source.__members__:
-                        metadata["source"] = None
-                    # Text falls under the DocumentChunk
-                    text = metadata.pop("text")
-                    # Id falls under the DocumentChunk
-                    ids = metadata.pop("id")
-                    chunk = DocumentChunkWithScore(
-                        id=ids,
-                        score=score,
-                        text=text,
-                        metadata=DocumentChunkMetadata(**metadata),
-                    )
-                    results.append(chunk)
 
-                # TODO: decide on doing queries to grab the embedding itself, slows down performance as double query occurs
+            # Get the cached Milvus collection, it is loaded when first cached
+            try:
+                res = search(self._get_collection(source_id))
+            except MilvusException as e:
+                # The collection may have been dropped, recreated or released since it was cached
+                logger.warning("Search failed on cached collection, reopening it, error: {}".format(e))
+                self._invalidate_collection(source_id)
+                res = search(self._get_collection(source_id))
+
+            # The search returns one list of hits per query vector, in order
+            return [
+                QueryResult(query=query.query, results=[self._get_chunk(hit, output_fields) for hit in hits])
+                for query, hits in zip(queries, res)  # type: ignore
+            ]
+        except Exception as e:
+            logger.error("Failed to query, error: {}".format(e))
+            return [QueryResult(query=query.query, results=[]) for query in queries]
+
+    def _get_chunk(self, hit, output_fields: List[str]) -> DocumentChunkWithScore:
+        """Convert a search hit into a DocumentChunkWithScore.
 
-                return QueryResult(query=query.query, results=results)
-            except Exception as e:
-                logger.error("Failed to query, error: {}".format(e))
-                return QueryResult(query=query.query, results=[])
+        Args:
+            hit: The search hit, holding the output fields.
+            output_fields (List[str]): The fields returned by the search.
 
-        results: List[QueryResult] = await asyncio.gather(
-            *[_single_query(query) for query in queries]
+        Returns:
+            DocumentChunkWithScore: The chunk, scored by the hit's distance.
+        """
+        # Our metadata info, falls under DocumentChunkMetadata
+        metadata = {}
+        # Grab the values that correspond to our fields, ignore pk and embedding.
+        for x in output_fields:
+            metadata[x] = hit.entity.get(x)
+        # If the source isn't valid, convert to None
+        if metadata["source"] not in Source.__members__:
+            metadata["source"] = None
+        # Text falls under the DocumentChunk
+        text = metadata.pop("text")
+        # Id falls under the DocumentChunk
+        ids = metadata.pop("id")
+        return DocumentChunkWithScore(
+            id=ids,
+            # The distance score for the search result, falls under DocumentChunkWithScore
+            score=hit.score,
+            text=text,
+            metadata=DocumentChunkMetadata(**metadata),
         )
-        return results
 
-    async def delete(
+    async def _delete(
         self,
         source_id: str,
         ids: Optional[List[str]] = None,
@@ -499,15 +759,29 @@ class MilvusDataStore(DataStore):
             filter (Optional[DocumentMetadataFilter], optional): The filter to delete by. Defaults to None.
             delete_all (Optional[bool], optional): Whether to drop the collection and recreate it. Defaults to None.
         """
+        # Deletes, and the queries and drops they make, block, so they run on the insert pool like inserts
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(insert_executor, self._delete_entities, source_id, ids, filter, delete_all)
+
+    def _delete_entities(
+        self,
+        source_id: str,
+        ids: Optional[List[str]],
+        filter: Optional[DocumentMetadataFilter],
+        delete_all: Optional[bool],
+    ) -> bool:
+        """Delete the entities of _delete, see its arguments."""
 
-        # Get Milvus connection and collection
-        connection_info = self._get_connection_info(source_id)
-        col = self._create_connection(connection_info=connection_info)
+        # Get the cached Milvus collection
+        col = self._get_collection(source_id)
 
         # If deleting all, drop and create the new collection
         if delete_all:
             logger.info(
                 "Delete the entire collection {} and create new one".format(col.name))
+            connection_info = self._get_connection_info(source_id)
+            # The handles of the dropped collection must not be reused
+            self._invalidate_collection(source_id)
             # Release the collection from memory
             col.release()
             # Drop the collection
@@ -519,34 +793,11 @@ class MilvusDataStore(DataStore):
 
         # Keep track of how many we have deleted for later printing
         delete_count = 0
-        batch_size = 100
-        pk_name = "pk" if self._schema_ver == "V1" else "id"
+        start = time.perf_counter()
         try:
-            # According to the api design, the ids is a list of document_id,
-            # document_id is not primary key, use query+delete to workaround,
-            # in future version we can delete by expression
+            # According to the api design, the ids is a list of document_id
             if (ids is not None) and len(ids) > 0:
-                # Add quotation marks around the string format id
-                ids = ['"' + str(id) + '"' for id in ids]
-                # Query for the pk's of entries that match id's
-                ids = col.query(f"document_id in [{','.join(ids)}]")
-                # Convert to list of pks
-                pks = [str(entry[pk_name]) for entry in ids]  # type: ignore
-                # for schema V2, the "id" is varchar, rewrite the expression
-                if self._schema_ver != "V1":
-                    pks = ['"' + pk + '"' for pk in pks]
-
-                # Delete by ids batch by batch(avoid too long expression)
-                logger.info("Apply {:d} deletions to schema {:s}".format(
-                    len(pks), self._schema_ver))
-                while len(pks) > 0:
-                    batch_pks = pks[:batch_size]
-                    pks = pks[batch_size:]
-                    # Delete the entries batch by batch
-                    res = col.delete(
-                        f"{pk_name} in [{','.join(batch_pks)}]")
-                    # Increment our deleted count
-                    delete_count += int(res.delete_count)  # type: ignore
+                delete_count += self._delete_in(source_id, col, "document_id", [_quote(id) for id in ids])
         except Exception as e:
             logger.error("Failed to delete by ids, error: {}".format(e))
 
@@ -557,33 +808,151 @@ class MilvusDataStore(DataStore):
                 filter = self._get_filter(filter)  # type: ignore
                 # Check if there is anything to filter
                 if len(filter) != 0:  # type: ignore
-                    # Query for the pk's of entries that match filter
-                    res = col.query(filter)  # type: ignore
-                    # Convert to list of pks
-                    pks = [str(entry[pk_name])
-                           for entry in res]  # type: ignore
-                    # for schema V2, the "id" is varchar, rewrite the expression
-                    if self._schema_ver != "V1":
-                        pks = ['"' + pk + '"' for pk in pks]
-                    # Check to see if there are valid pk's to delete, delete batch by batch(avoid too long expression)
-                    while len(pks) > 0:  # type: ignore
-                        batch_pks = pks[:batch_size]
-                        pks = pks[batch_size:]
-                        # Delete the entries batch by batch
-                        res = col.delete(
-                            f"{pk_name} in [{','.join(batch_pks)}]")  # type: ignore
-                        # Increment our delete count
-                        delete_count += int(res.delete_count)  # type: ignore
+                    delete_count += self._delete_expression(source_id, col, filter)  # type: ignore
         except Exception as e:
             logger.error("Failed to delete by filter, error: {}".format(e))
 
-        logger.info("{:d} records deleted".format(delete_count))
+        logger.info("{:d} records deleted in {:.2f}s".format(delete_count, time.perf_counter() - start))
 
         # This setting performs flushes after delete. Small delete == bad to use
         # col.flush()
 
         return True
 
+    async def _delete_documents(self, source_id: str, document_ids: List[str]):
+        """Delete every chunk of the given documents with document_id expressions, for the pre-delete of upserts.
+
+        Args:
+            document_ids (List[str]): The document_ids to delete.
+        """
+        def delete_documents():
+            col = self._get_collection(source_id)
+            start = time.perf_counter()
+            delete_count = self._delete_in(source_id, col, "document_id", [_quote(id) for id in document_ids])
+            logger.info("{:d} records deleted for {:d} documents in {:.2f}s".format(
+                delete_count, len(document_ids), time.perf_counter() - start))
+
+        await asyncio.get_running_loop().run_in_executor(insert_executor, delete_documents)
+
+    async def _get_chunk_ids(self, source_id: str, document_ids: List[str]) -> Dict[str, Set[str]]:
+        """Get the ids of the chunks stored for each document, for delta upserts.
+
+        Args:
+            document_ids (List[str]): The document_ids to look up.
+
+        Returns:
+            Dict[str, Set[str]]: The stored chunk ids of each document that has any.
+        """
+        def get_chunk_ids() -> Dict[str, Set[str]]:
+            col = self._get_collection(source_id)
+            chunk_ids: Dict[str, Set[str]] = {}
+
+            # Look up the documents expression by expression(avoid too long expression)
+            for expr in _in_expressions("document_id", [_quote(id) for id in document_ids], DELETE_EXPR_MAX_LENGTH):
+                res = col.query(expr, output_fields=["id", "document_id"])
+                for entry in res:
+                    chunk_ids.setdefault(entry["document_id"], set()).add(entry["id"])
+            return chunk_ids
+
+        # The lookup is part of delta upserts, it runs on the insert pool with their deletes
+        return await asyncio.get_running_loop().run_in_executor(insert_executor, get_chunk_ids)
+
+    async def _get_chunk_embeddings(self, source_id: str, chunk_ids: List[str]) -> Dict[str, numpy.ndarray]:
+        """Get the stored vectors of chunks, for MMR. The queries block, so they run on the search pool.
+
+        Args:
+            chunk_ids (List[str]): The ids of the chunks to look up.
+
+        Returns:
+            Dict[str, numpy.ndarray]: The vector of each stored chunk.
+        """
+        def get_embeddings() -> Dict[str, numpy.ndarray]:
+            col = self._get_collection(source_id)
+            embeddings: Dict[str, numpy.ndarray] = {}
+            for expr in _in_expressions("id", [_quote(id) for id in chunk_ids], DELETE_EXPR_MAX_LENGTH):
+                for entry in col.query(expr, output_fields=["id", EMBEDDING_FIELD]):
+                    embeddings[entry["id"]] = numpy.asarray(entry[EMBEDDING_FIELD], dtype=numpy.float32)
+            return embeddings
+
+        return await asyncio.get_running_loop().run_in_executor(search_executor, get_embeddings)
+
+    async def _delete_chunks(self, source_id: str, chunk_ids: List[str]):
+        """Delete chunks by their chunk id, for delta upserts.
+
+        Args:
+            chunk_ids (List[str]): The ids of the chunks to delete.
+        """
+        def delete_chunks():
+            col = self._get_collection(source_id)
+            start = time.perf_counter()
+            delete_count = self._delete_in(source_id, col, "id", [_quote(id) for id in chunk_ids])
+            logger.info("{:d} chunks deleted in {:.2f}s".format(delete_count, time.perf_counter() - start))
+
+        await asyncio.get_running_loop().run_in_executor(insert_executor, delete_chunks)
+
+    def _supports_expression_delete(self, source_id: str) -> bool:
+        """Check whether the Milvus server of a source_id deletes by any boolean expression, which Milvus 2.3 added.
+
+        The answer is kept on the collection handle, so the version is only asked once per collection.
+        """
+        handle = self._handles.get(source_id)
+        if handle is not None and handle.expression_delete is not None:
+            return handle.expression_delete
+
+        supported = False
+        try:
+            version = utility.get_server_version(using=self._get_connection_info(source_id).alias)
+            match = re.search(r"(\d+)\.(\d+)", version)
+            supported = match is not None and (int(match.group(1)), int(match.group(2))) >= (2, 3)
+            logger.info("Milvus server version {}, expression deletes {}".format(
+                version, "supported" if supported else "not supported"))
+        except Exception as e:
+            logger.warning("Failed to get Milvus server version, deleting by primary keys, error: {}".format(e))
+        if handle is not None:
+            handle.expression_delete = supported
+        return supported
+
+    def _delete_expression(self, source_id: str, col: Collection, expr: str) -> int:
+        """Delete the entities matching an expression.
+
+        Servers that support it delete by the expression in one call. Older servers only delete by primary key,
+        so the primary keys of the matching entities are queried first.
+
+        Returns:
+            int: The number of deleted entities.
+        """
+        if self._supports_expression_delete(source_id):
+            res = col.delete(expr)
+            return int(res.delete_count)  # type: ignore
+
+        pk_name = "pk" if self._schema_ver == "V1" else "id"
+        pks = [entry[pk_name] for entry in col.query(expr, output_fields=[pk_name])]
+        # for schema V2, the "id" is varchar, quote it in the expression
+        pks = [str(pk) if self._schema_ver == "V1" else _quote(pk) for pk in pks]
+        return self._delete_pks(col, pk_name, pks)
+
+    def _delete_in(self, source_id: str, col: Collection, field: str, values: List[str]) -> int:
+        """Delete the entities whose field is one of the quoted values, with expressions bounded by DELETE_EXPR_MAX_LENGTH.
+
+        Returns:
+            int: The number of deleted entities.
+        """
+        pk_name = "pk" if self._schema_ver == "V1" else "id"
+        if field == pk_name:
+            return self._delete_pks(col, pk_name, values)
+        return sum(
+            self._delete_expression(source_id, col, expr)
+            for expr in _in_expressions(field, values, DELETE_EXPR_MAX_LENGTH)
+        )
+
+    def _delete_pks(self, col: Collection, pk_name: str, pks: List[str]) -> int:
+        delete_count = 0
+        # Delete by primary keys expression by expression(avoid too long expression)
+        for expr in _in_expressions(pk_name, pks, DELETE_EXPR_MAX_LENGTH):
+            res = col.delete(expr)
+            delete_count += int(res.delete_count)  # type: ignore
+        return delete_count
+
     def _get_filter(self, filter: DocumentMetadataFilter) -> Optional[str]:
         """Converts a DocumentMetdataFilter to the expression that Milvus takes.
 
@@ -0,0 +1,663 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+import numpy as np
+from loguru import logger
+from typing import Dict, List, Optional, Set
+
+from services.date import to_unix_timestamp
+from services.embedding_models import get_embedding_dimension
+from datastore.datastore import DataStore
+from datastore.providers.numpy_hnsw import HnswIndex
+from models.models import (
+    DocumentChunk,
+    DocumentChunkMetadata,
+    DocumentChunkWithScore,
+    DocumentMetadataFilter,
+    QueryResult,
+    QueryWithEmbedding,
+    Source,
+)
+
+NUMPY_DATASTORE_PATH = os.environ.get("NUMPY_DATASTORE_PATH", ".cache/numpy_datastore")  # One directory per source_id
+NUMPY_SEARCH_BLOCK_SIZE = int(os.environ.get("NUMPY_SEARCH_BLOCK_SIZE", 65536))  # Vectors scored per matrix product
+NUMPY_COMPACT_RATIO = float(os.environ.get("NUMPY_COMPACT_RATIO", 0.5))  # Deleted fraction of rows that triggers a compaction
+NUMPY_INDEX = os.environ.get("NUMPY_INDEX", "flat").lower()  # "flat" for exact search only or "hnsw" for an HNSW graph index
+NUMPY_HNSW_M = int(os.environ.get("NUMPY_HNSW_M", 16))  # Links per row on the upper layers, doubled on layer 0
+NUMPY_HNSW_EF_CONSTRUCTION = int(os.environ.get("NUMPY_HNSW_EF_CONSTRUCTION", 100))  # Candidate list size when linking rows
+NUMPY_HNSW_EF_SEARCH = int(os.environ.get("NUMPY_HNSW_EF_SEARCH", 64))  # Candidate list size when searching
+NUMPY_INDEXES = ["flat", "hnsw"]
+
+
+# Low-cardinality string columns, stored as int32 codes into an append-only vocabulary so filters compare integers
+CATEGORICAL_COLUMNS = ["document_id", "source_id", "source", "author"]
+# Per-row string columns, stored as one UTF-8 blob per column with end offsets and only decoded for results
+BLOB_COLUMNS = ["id", "text", "url", "json_data"]
+
+MIN_COMPACT_ROWS = 1024
+
+
+class ColumnFile:
+    """
+    An append-only array file, memory-mapped up to its committed length.
+
+    Appends write past the committed length and only become visible to readers of the manifest once the
+    collection commits the new length, so a crash mid-append leaves the previous state intact.
+    """
+
+    def __init__(self, path: str, dtype, length: int = 0, row_shape: tuple = ()):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.row_shape = row_shape
+        self.row_bytes = self.dtype.itemsize * int(np.prod(row_shape, dtype=np.int64))
+        self.length = length
+        if not os.path.exists(path):
+            open(path, "wb").close()
+        self._map()
+
+    def _map(self):
+        if self.length == 0:
+            self._memmap = None
+            self.array = np.empty((0,) + self.row_shape, dtype=self.dtype)
+        else:
+            self._memmap = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=(self.length,) + self.row_shape)
+            # A plain ndarray view of the mapping, slicing np.memmap objects is several times slower
+            self.array = self._memmap.view(np.ndarray)
+
+    def append(self, values: np.ndarray):
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        if len(values) == 0:
+            return
+        with open(self.path, "r+b") as f:
+            f.seek(self.length * self.row_bytes)
+            f.write(values.tobytes())
+            f.truncate()
+        self.length += len(values)
+        self._map()
+
+    def truncate(self, length: int):
+        self.length = length
+        with open(self.path, "r+b") as f:
+            f.truncate(length * self.row_bytes)
+        self._map()
+
+    def flush(self):
+        if self._memmap is not None:
+            self._memmap.flush()
+
+
+class NumpyCollection:
+    """
+    The chunks of one source_id, stored column by column in a directory of memory-mapped files.
+
+    Vectors are kept L2-normalized in a float32 matrix so the inner product is the cosine similarity.
+    Deleted rows are tombstoned in the alive column and reclaimed by compaction once they make up
+    NUMPY_COMPACT_RATIO of the rows. manifest.json holds the committed length of every file and is
+    replaced atomically after each write.
+    """
+
+    def __init__(self, path: str, dimension: int):
+        self.path = path
+        self.dimension = dimension
+        self.lock = threading.RLock()
+        self._open()
+
+    def _open(self):
+        os.makedirs(self.path, exist_ok=True)
+        manifest_path = os.path.join(self.path, "manifest.json")
+        manifest = {"dimension": self.dimension, "lengths": {}}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            if manifest["dimension"] != self.dimension:
+                raise ValueError(
+                    f"Collection {self.path} holds {manifest['dimension']}-dimensional vectors, "
+                    f"the embedding model has {self.dimension}"
+                )
+        lengths = manifest["lengths"]
+
+        def column(name: str, dtype, row_shape: tuple = ()) -> ColumnFile:
+            return ColumnFile(os.path.join(self.path, name), dtype, lengths.get(name, 0), row_shape)
+
+        self.vectors = column("vectors.f32", np.float32, (self.dimension,))
+        self.created_at = column("created_at.i64", np.int64)
+        self.alive = column("alive.u1", np.uint8)
+        self.codes = {name: column(f"{name}.i32", np.int32) for name in CATEGORICAL_COLUMNS}
+        self.blobs = {name: column(f"{name}.bin", np.uint8) for name in BLOB_COLUMNS}
+        self.blob_ends = {name: column(f"{name}.end.i64", np.int64) for name in BLOB_COLUMNS}
+        self.property_ids = column("property_ids.i64", np.int64)
+        self.property_ends = column("property_ids.end.i64", np.int64)
+
+        self.vocab: Dict[str, List[str]] = {}
+        self.vocab_index: Dict[str, Dict[str, int]] = {}
+        for name in CATEGORICAL_COLUMNS:
+            vocab_path = os.path.join(self.path, f"{name}.vocab")
+            lines: List[str] = []
+            if os.path.exists(vocab_path):
+                with open(vocab_path, encoding="utf-8") as f:
+                    lines = f.readlines()
+            committed = lines[: lengths.get(f"{name}.vocab", 0)]
+            if len(lines) > len(committed):
+                # Drop values appended by a write that never committed
+                with open(vocab_path, "w", encoding="utf-8") as f:
+                    f.writelines(committed)
+            values = [json.loads(line) for line in committed]
+            self.vocab[name] = values
+            self.vocab_index[name] = {value: code for code, value in enumerate(values)}
+
+        self._property_rows: Optional[np.ndarray] = None
+        self._id_rows: Optional[Dict[str, int]] = None
+
+        self.index: Optional[HnswIndex] = None
+        if NUMPY_INDEX not in NUMPY_INDEXES:
+            raise ValueError(f"Unsupported NumPy index: {NUMPY_INDEX}. Try one of the following: {', '.join(NUMPY_INDEXES)}")
+        if NUMPY_INDEX == "hnsw":
+            self.index = HnswIndex(
+                self.vectors,
+                column,
+                os.path.join(self.path, "hnsw.npz"),
+                m=NUMPY_HNSW_M,
+                ef_construction=NUMPY_HNSW_EF_CONSTRUCTION,
+                ef_search=NUMPY_HNSW_EF_SEARCH,
+            )
+            if self.index.count < self.count:
+                # The index was enabled on an existing collection or its saved graph was stale
+                self.index.add(self.count)
+                self._commit()
+
+    def _columns(self) -> List[ColumnFile]:
+        return [
+            self.vectors,
+            self.created_at,
+            self.alive,
+            *self.codes.values(),
+            *self.blobs.values(),
+            *self.blob_ends.values(),
+            self.property_ids,
+            self.property_ends,
+            *(self.index.files() if self.index is not None else []),
+        ]
+
+    def _commit(self):
+        for col in self._columns():
+            col.flush()
+        if self.index is not None:
+            self.index.save()
+        lengths = {os.path.basename(col.path): col.length for col in self._columns()}
+        lengths.update({f"{name}.vocab": len(values) for name, values in self.vocab.items()})
+
+        manifest_path = os.path.join(self.path, "manifest.json")
+        with open(manifest_path + ".tmp", "w") as f:
+            json.dump({"dimension": self.dimension, "lengths": lengths}, f)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    @property
+    def count(self) -> int:
+        return self.alive.length
+
+    @property
+    def live_count(self) -> int:
+        return int(np.count_nonzero(self.alive.array))
+
+    def _encode(self, name: str, values: List[Optional[str]]) -> np.ndarray:
+        index = self.vocab_index[name]
+        new_values = []
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            if value is None:
+                codes[i] = -1
+                continue
+            code = index.get(value)
+            if code is None:
+                code = index[value] = len(self.vocab[name]) + len(new_values)
+                new_values.append(value)
+            codes[i] = code
+
+        if new_values:
+            vocab_path = os.path.join(self.path, f"{name}.vocab")
+            with open(vocab_path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(value) + "\n" for value in new_values)
+            self.vocab[name].extend(new_values)
+        return codes
+
+    def append(self, vectors: np.ndarray, rows: Dict[str, list]):
+        """
+        Append rows given as a vector matrix and a dict of per-column value lists, and commit them.
+        """
+        with self.lock:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            self.vectors.append(vectors / np.maximum(norms, 1e-12))
+            self.created_at.append(np.asarray(rows["created_at"], dtype=np.int64))
+            self.alive.append(np.ones(len(vectors), dtype=np.uint8))
+
+            for name in CATEGORICAL_COLUMNS:
+                self.codes[name].append(self._encode(name, rows[name]))
+
+            for name in BLOB_COLUMNS:
+                encoded = [value.encode("utf-8") for value in rows[name]]
+                start = int(self.blob_ends[name].array[-1]) if self.blob_ends[name].length else 0
+                self.blob_ends[name].append(start + np.cumsum([len(value) for value in encoded], dtype=np.int64))
+                self.blobs[name].append(np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+            start = int(self.property_ends.array[-1]) if self.property_ends.length else 0
+            self.property_ends.append(start + np.cumsum([len(ids) for ids in rows["property_ids"]], dtype=np.int64))
+            self.property_ids.append(np.asarray([i for ids in rows["property_ids"] for i in ids], dtype=np.int64))
+
+            if self.index is not None:
+                self.index.add(self.count)
+
+            if self._id_rows is not None:
+                first = self.count - len(vectors)
+                self._id_rows.update((chunk_id, first + i) for i, chunk_id in enumerate(rows["id"]))
+            self._property_rows = None
+            self._commit()
+
+    def read_rows(self, rows: np.ndarray) -> Dict[str, list]:
+        """
+        Decode the metadata columns of the given row numbers into per-column value lists.
+        """
+        values: Dict[str, list] = {"created_at": self.created_at.array[rows].tolist()}
+        for name in CATEGORICAL_COLUMNS:
+            vocab = self.vocab[name]
+            values[name] = [vocab[code] if code >= 0 else None for code in self.codes[name].array[rows].tolist()]
+        for name in BLOB_COLUMNS:
+            blob, ends = self.blobs[name].array, self.blob_ends[name].array
+            values[name] = [
+                bytes(blob[(ends[row - 1] if row else 0) : ends[row]]).decode("utf-8") for row in rows.tolist()
+            ]
+        ends = self.property_ends.array
+        values["property_ids"] = [
+            self.property_ids.array[(ends[row - 1] if row else 0) : ends[row]].tolist() for row in rows.tolist()
+        ]
+        return values
+
+    def _categorical_mask(self, name: str, values: List[str]) -> np.ndarray:
+        codes = [self.vocab_index[name][value] for value in values if value in self.vocab_index[name]]
+        if not codes:
+            return np.zeros(self.count, dtype=bool)
+        return np.isin(self.codes[name].array, codes)
+
+    def _property_mask(self, property_ids: List[int]) -> np.ndarray:
+        if self._property_rows is None:
+            # Row number of every stored property id, the CSR row index expanded once per write
+            self._property_rows = np.repeat(
+                np.arange(self.count), np.diff(self.property_ends.array, prepend=0)
+            )
+        mask = np.zeros(self.count, dtype=bool)
+        mask[self._property_rows[np.isin(self.property_ids.array, property_ids)]] = True
+        return mask
+
+    def filter_mask(self, filter: Optional[DocumentMetadataFilter]) -> np.ndarray:
+        """
+        Return a boolean mask of the live rows that match a filter.
+        """
+        mask = self.alive.array.astype(bool)
+        if filter is None:
+            return mask
+
+        for field, value in filter.dict().items():
+            if value is None:
+                continue
+            if field == "property_ids":
+                # Match rows holding any of the property ids, an empty list does not filter
+                if len(value) > 0:
+                    mask &= self._property_mask(value)
+            elif field == "start_date":
+                mask &= self.created_at.array >= to_unix_timestamp(value)
+            elif field == "end_date":
+                mask &= self.created_at.array <= to_unix_timestamp(value)
+            elif field == "source":
+                mask &= self._categorical_mask(field, [value.value])
+            else:
+                mask &= self._categorical_mask(field, [str(value)])
+        return mask
+
+    def search(self, embeddings: np.ndarray, masks: List[np.ndarray], top_ks: List[int]) -> List[tuple]:
+        """
+        Return the (rows, scores) of the top_k rows of each query embedding among the rows of its mask.
+
+        Queries whose mask selects at most NUMPY_SEARCH_BLOCK_SIZE rows only score those rows. The others are
+        answered by the HNSW index if there is one, and otherwise, or when a selective filter leaves the graph
+        search short of top_k rows, share one pass over the vector file in blocks, keeping a running top-k per query.
+        """
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings = (embeddings / np.maximum(norms, 1e-12)).astype(np.float32)
+        vectors = self.vectors.array
+
+        results: List[Optional[tuple]] = [None] * len(embeddings)
+        scanned = []
+        for i, (mask, top_k) in enumerate(zip(masks, top_ks)):
+            candidates = np.flatnonzero(mask)
+            if top_k <= 0 or len(candidates) == 0:
+                results[i] = (candidates[:0], np.empty(0, dtype=np.float32))
+            elif len(candidates) <= NUMPY_SEARCH_BLOCK_SIZE:
+                results[i] = _top_k(candidates, vectors[candidates] @ embeddings[i], top_k)
+            else:
+                if self.index is not None:
+                    results[i] = self.index.search(embeddings[i], top_k, mask)
+                if results[i] is None or len(results[i][0]) < top_k:
+                    scanned.append(i)
+                    results[i] = (candidates[:0], np.empty(0, dtype=np.float32))
+
+        if scanned:
+            for start in range(0, self.count, NUMPY_SEARCH_BLOCK_SIZE):
+                stop = min(start + NUMPY_SEARCH_BLOCK_SIZE, self.count)
+                scores = vectors[start:stop] @ embeddings[scanned].T
+                for j, i in enumerate(scanned):
+                    rows = np.flatnonzero(masks[i][start:stop])
+                    best_rows, best_scores = results[i]
+                    results[i] = _top_k(
+                        np.concatenate([best_rows, rows + start]),
+                        np.concatenate([best_scores, scores[rows, j]]),
+                        top_ks[i],
+                    )
+
+        sorted_results = []
+        for rows, scores in results:
+            order = np.argsort(-scores, kind="stable")
+            sorted_results.append((rows[order], scores[order]))
+        return sorted_results
+
+    def delete_rows(self, mask: np.ndarray) -> int:
+        """
+        Tombstone the rows of a mask, compacting the collection when enough rows are dead. Returns the count deleted.
+        """
+        with self.lock:
+            alive = self.alive.array
+            rows = np.flatnonzero(mask & (alive > 0))
+            if len(rows) == 0:
+                return 0
+            alive[rows] = 0
+            self._commit()
+
+            if self._id_rows is not None:
+                for chunk_id in self.read_rows(rows)["id"]:
+                    self._id_rows.pop(chunk_id, None)
+
+            dead = self.count - self.live_count
+            if dead >= MIN_COMPACT_ROWS and dead >= NUMPY_COMPACT_RATIO * self.count:
+                self.compact()
+            return len(rows)
+
+    def delete_documents(self, document_ids: List[str]) -> int:
+        with self.lock:
+            return self.delete_rows(self._categorical_mask("document_id", document_ids))
+
+    def delete_filter(self, filter: DocumentMetadataFilter) -> int:
+        with self.lock:
+            return self.delete_rows(self.filter_mask(filter))
+
+    def _get_id_rows(self) -> Dict[str, int]:
+        # Row number of every live chunk id, built on first use and kept in step by append and delete_rows
+        if self._id_rows is None:
+            rows = np.flatnonzero(self.alive.array)
+            self._id_rows = dict(zip(self.read_rows(rows)["id"], rows.tolist()))
+        return self._id_rows
+
+    def delete_chunks(self, chunk_ids: List[str]) -> int:
+        with self.lock:
+            id_rows = self._get_id_rows()
+            mask = np.zeros(self.count, dtype=bool)
+            mask[[id_rows[i] for i in chunk_ids if i in id_rows]] = True
+            return self.delete_rows(mask)
+
+    def get_vectors(self, chunk_ids: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Return copies of the stored, L2-normalized vectors of the live chunks among the given chunk ids.
+        """
+        with self.lock:
+            id_rows = self._get_id_rows()
+            found = [chunk_id for chunk_id in chunk_ids if chunk_id in id_rows]
+            vectors = np.array(self.vectors.array[[id_rows[chunk_id] for chunk_id in found]])
+        return dict(zip(found, vectors))
+
+    def get_chunk_ids(self, document_ids: List[str]) -> Dict[str, Set[str]]:
+        with self.lock:
+            mask = self._categorical_mask("document_id", document_ids) & (self.alive.array > 0)
+            values = self.read_rows(np.flatnonzero(mask))
+
+        chunk_ids: Dict[str, Set[str]] = {}
+        for document_id, chunk_id in zip(values["document_id"], values["id"]):
+            chunk_ids.setdefault(document_id, set()).add(chunk_id)
+        return chunk_ids
+
+    def compact(self):
+        """
+        Rewrite the collection without its deleted rows, then swap the new files in.
+        """
+        with self.lock:
+            start_time = time.perf_counter()
+            live = np.flatnonzero(self.alive.array)
+            new_path = self.path + ".compact"
+            shutil.rmtree(new_path, ignore_errors=True)
+            compacted = NumpyCollection(new_path, self.dimension)
+            for start in range(0, len(live), NUMPY_SEARCH_BLOCK_SIZE):
+                rows = live[start : start + NUMPY_SEARCH_BLOCK_SIZE]
+                compacted.append(np.asarray(self.vectors.array[rows]), self.read_rows(rows))
+
+            old_path = self.path + ".old"
+            os.replace(self.path, old_path)
+            os.replace(new_path, self.path)
+            shutil.rmtree(old_path)
+            self._open()
+            logger.info(
+                f"Compacted {self.path} to {len(live)} rows in {time.perf_counter() - start_time:.2f}s"
+            )
+
+    def clear(self):
+        with self.lock:
+            shutil.rmtree(self.path)
+            self._open()
+
+
+def _top_k(rows: np.ndarray, scores: np.ndarray, top_k: int) -> tuple:
+    if len(scores) <= top_k:
+        return rows, scores
+    best = np.argpartition(-scores, top_k - 1)[:top_k]
+    return rows[best], scores[best]
+
+
+class NumpyDataStore(DataStore):
+    def __init__(self, path: Optional[str] = None, dimension: Optional[int] = None):
+        """Create a NumPy DataStore.
+
+        The NumPy Datastore keeps the chunks of each source_id in local memory-mapped files and searches them
+        by brute force, so it needs no external service. It suits local development, tests and small tenants.
+
+        Args:
+            path (Optional[str], optional): The directory to store collections in. Defaults to NUMPY_DATASTORE_PATH.
+            dimension (Optional[int], optional): The vector dimension. Defaults to that of the configured EMBEDDING_MODEL.
+        """
+        self.path = path or NUMPY_DATASTORE_PATH
+        self.dimension = dimension or get_embedding_dimension()
+        self._collections: Dict[str, NumpyCollection] = {}
+        self._lock = threading.Lock()
+
+    def _get_collection(self, source_id: str) -> NumpyCollection:
+        with self._lock:
+            collection = self._collections.get(source_id)
+            if collection is None:
+                # Keep the directory name readable and tell apart source_ids that sanitize alike
+                name = re.sub(r"[^A-Za-z0-9_.-]", "_", source_id)[:64]
+                digest = hashlib.sha1(source_id.encode("utf-8")).hexdigest()[:8]
+                collection = NumpyCollection(os.path.join(self.path, f"{name}-{digest}"), self.dimension)
+                self._collections[source_id] = collection
+                logger.info(f"Opened NumPy collection for '{source_id}' with {collection.live_count} chunks")
+            return collection
+
+    async def _upsert(self, chunks: Dict[str, List[DocumentChunk]], source_id: str) -> List[str]:
+        """Append the chunks to the source's collection.
+
+        Args:
+            chunks (Dict[str, List[DocumentChunk]]): A list of DocumentChunks to insert
+
+        Returns:
+            List[str]: The document_id's that were inserted.
+        """
+        chunk_list = [chunk for doc_chunks in chunks.values() for chunk in doc_chunks]
+        if chunk_list:
+            vectors = np.stack([chunk.embedding for chunk in chunk_list])
+            rows = _get_rows(chunk_list)
+            collection = self._get_collection(source_id)
+            await asyncio.to_thread(collection.append, vectors, rows)
+        return list(chunks.keys())
+
+    async def _query(self, queries: List[QueryWithEmbedding]) -> List[QueryResult]:
+        """Search each query's source collection by brute force, one pass per source.
+
+        Args:
+            queries (List[QueryWithEmbedding]): The list of searches to perform.
+
+        Returns:
+            List[QueryResult]: Results for each search.
+        """
+        by_source: Dict[str, List[int]] = {}
+        for i, query in enumerate(queries):
+            by_source.setdefault(query.source_id, []).append(i)
+
+        def search_source(source_id: str, indexes: List[int]) -> List[QueryResult]:
+            collection = self._get_collection(source_id)
+            with collection.lock:
+                source_queries = [queries[i] for i in indexes]
+                hits = collection.search(
+                    np.stack([query.embedding for query in source_queries]),
+                    [collection.filter_mask(query.filter) for query in source_queries],
+                    [query.top_k or 0 for query in source_queries],
+                )
+                return [
+                    QueryResult(query=query.query, results=_get_chunks(collection, rows, scores))
+                    for query, (rows, scores) in zip(source_queries, hits)
+                ]
+
+        results: List[Optional[QueryResult]] = [None] * len(queries)
+        source_results = await asyncio.gather(
+            *[asyncio.to_thread(search_source, source_id, indexes) for source_id, indexes in by_source.items()]
+        )
+        for indexes, query_results in zip(by_source.values(), source_results):
+            for i, result in zip(indexes, query_results):
+                results[i] = result
+        return results
+
+    async def _delete(
+        self,
+        source_id: str,
+        ids: Optional[List[str]] = None,
+        filter: Optional[DocumentMetadataFilter] = None,
+        delete_all: Optional[bool] = None,
+    ) -> bool:
+        """Delete chunks by document id, by filter, or all of the source's chunks.
+
+        Args:
+            ids (Optional[List[str]], optional): The document_ids to delete. Defaults to None.
+            filter (Optional[DocumentMetadataFilter], optional): The filter to delete by. Defaults to None.
+            delete_all (Optional[bool], optional): Whether to remove the source's whole collection. Defaults to None.
+        """
+        collection = self._get_collection(source_id)
+
+        if delete_all:
+            logger.info(f"Delete the entire collection of '{source_id}'")
+            await asyncio.to_thread(collection.clear)
+            return True
+
+        delete_count = 0
+        if ids:
+            delete_count += await asyncio.to_thread(collection.delete_documents, ids)
+        if filter is not None:
+            delete_count += await asyncio.to_thread(collection.delete_filter, filter)
+
+        logger.info("{:d} records deleted".format(delete_count))
+        return True
+
+    async def _delete_documents(self, source_id: str, document_ids: List[str]):
+        """Delete every chunk of the given documents, for the pre-delete of upserts.
+
+        Args:
+            document_ids (List[str]): The document_ids to delete.
+        """
+        collection = self._get_collection(source_id)
+        delete_count = await asyncio.to_thread(collection.delete_documents, document_ids)
+        logger.info("{:d} records deleted for {:d} documents".format(delete_count, len(document_ids)))
+
+    async def _get_chunk_ids(self, source_id: str, document_ids: List[str]) -> Dict[str, Set[str]]:
+        """Get the ids of the chunks stored for each document, for delta upserts.
+
+        Args:
+            document_ids (List[str]): The document_ids to look up.
+
+        Returns:
+            Dict[str, Set[str]]: The stored chunk ids of each document that has any.
+        """
+        collection = self._get_collection(source_id)
+        return await asyncio.to_thread(collection.get_chunk_ids, document_ids)
+
+    async def _get_chunk_embeddings(self, source_id: str, chunk_ids: List[str]) -> Dict[str, np.ndarray]:
+        """Get the stored vectors of chunks, for MMR.
+
+        Args:
+            chunk_ids (List[str]): The ids of the chunks to look up.
+
+        Returns:
+            Dict[str, np.ndarray]: The L2-normalized vector of each stored chunk.
+        """
+        collection = self._get_collection(source_id)
+        return await asyncio.to_thread(collection.get_vectors, chunk_ids)
+
+    async def _delete_chunks(self, source_id: str, chunk_ids: List[str]):
+        """Delete chunks by their chunk id, for delta upserts.
+
+        Args:
+            chunk_ids (List[str]): The ids of the chunks to delete.
+        """
+        collection = self._get_collection(source_id)
+        delete_count = await asyncio.to_thread(collection.delete_chunks, chunk_ids)
+        logger.info("{:d} chunks deleted".format(delete_count))
+
+
+def _get_rows(chunks: List[DocumentChunk]) -> Dict[str, list]:
+    rows: Dict[str, list] = {name: [] for name in ["created_at", "property_ids", *CATEGORICAL_COLUMNS, *BLOB_COLUMNS]}
+    for chunk in chunks:
+        metadata = chunk.metadata
+        # Same as Milvus, chunks without a creation date are stamped with the insert time
+        rows["created_at"].append(
+            to_unix_timestamp(metadata.created_at) if metadata.created_at else int(time.time())
+        )
+        rows["property_ids"].append([int(i) for i in (metadata.json_data or {}).get("property_ids") or []])
+        rows["document_id"].append(metadata.document_id)
+        rows["source_id"].append(metadata.source_id)
+        rows["source"].append(metadata.source.value if metadata.source else None)
+        rows["author"].append(metadata.author)
+        rows["id"].append(chunk.id or "")
+        rows["text"].append(chunk.text)
+        rows["url"].append(metadata.url or "")
+        rows["json_data"].append(json.dumps(metadata.json_data) if metadata.json_data is not None else "")
+    return rows
+
+
+def _get_chunks(collection: NumpyCollection, rows: np.ndarray, scores: np.ndarray) -> List[DocumentChunkWithScore]:
+    values = collection.read_rows(rows)
+    chunks = []
+    for i, score in enumerate(scores.tolist()):
+        source = values["source"][i]
+        chunks.append(
+            DocumentChunkWithScore(
+                id=values["id"][i],
+                score=score,
+                text=values["text"][i],
+                metadata=DocumentChunkMetadata(
+                    document_id=values["document_id"][i],
+                    source=source if source in Source.__members__ else None,
+                    source_id=values["source_id"][i],
+                    url=values["url"][i] or None,
+                    created_at=values["created_at"][i],
+                    author=values["author"][i],
+                    json_data=json.loads(values["json_data"][i]) if values["json_data"][i] else None,
+                ),
+            )
+        )
+    return chunks
@@ -0,0 +1,282 @@
+import heapq
+import math
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+
+class HnswIndex:
+    """
+    Hierarchical navigable small world graph over the rows of a normalized float32 vector column.
+
+    The index stores row numbers only and reads vectors from the column it is given, scoring by inner
+    product. Layer 0 links, up to 2 * m per row, live in an append-only column file that is memory-mapped
+    like the vectors. The sparse upper layers are written to an npz file by save(). Rows are never removed
+    from the graph: deleted rows are left in place as waypoints and dropped from results through the mask
+    passed to search(), until the owning collection is compacted and its index rebuilt.
+
+    Args:
+        vectors: The column of L2-normalized vectors, one per row.
+        column: Factory for the index's own column files, called as column(name, dtype, row_shape).
+        upper_path: The npz file the upper layers are saved to.
+        m: The number of links per row on upper layers, doubled on layer 0.
+        ef_construction: The candidate list size when linking new rows.
+        ef_search: The default candidate list size when searching.
+        seed: Seed of the level generator.
+    """
+
+    def __init__(
+        self,
+        vectors,
+        column: Callable,
+        upper_path: str,
+        m: int = 16,
+        ef_construction: int = 100,
+        ef_search: int = 64,
+        seed: Optional[int] = None,
+    ):
+        self.vectors = vectors
+        self.upper_path = upper_path
+        self.m = m
+        self.m0 = 2 * m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.level_mult = 1 / math.log(m)
+        self._rng = np.random.default_rng(seed)
+
+        self.links = column("hnsw.links.i32", np.int32, (self.m0,))
+        self.levels = column("hnsw.levels.i8", np.int8)
+        self.upper: List[Dict[int, np.ndarray]] = []  # upper[level - 1] maps a row to its links on that level
+        self.entry_point = -1
+        self._visited = np.zeros(0, dtype=np.uint32)
+        self._visit_tag = 0
+
+        if not self._load():
+            self._reset()
+
+    @property
+    def count(self) -> int:
+        return self.levels.length
+
+    def files(self) -> list:
+        return [self.links, self.levels]
+
+    def _reset(self):
+        if self.count:
+            logger.warning(f"Rebuilding HNSW index {self.upper_path}, the saved graph does not match its rows")
+        self.links.truncate(0)
+        self.levels.truncate(0)
+        self.upper = []
+        self.entry_point = -1
+
+    def _load(self) -> bool:
+        if not os.path.exists(self.upper_path):
+            return self.count == 0
+
+        saved = np.load(self.upper_path)
+        count, self.entry_point = (int(value) for value in saved["meta"])
+        # Links of a write that never committed may point past the committed rows
+        if count != self.count or self.links.length != self.count or (count and self.links.array.max() >= count):
+            return False
+
+        self.upper = []
+        for level in range(1, int(self.levels.array.max(initial=0)) + 1):
+            rows, links = saved[f"rows_{level}"], saved[f"links_{level}"]
+            self.upper.append(dict(zip(rows.tolist(), links)))
+        return True
+
+    def save(self):
+        """
+        Write the upper layers and entry point next to the layer 0 column, replacing the previous file atomically.
+        """
+        arrays = {"meta": np.array([self.count, self.entry_point], dtype=np.int64)}
+        for level, layer in enumerate(self.upper, start=1):
+            arrays[f"rows_{level}"] = np.fromiter(layer.keys(), dtype=np.int64, count=len(layer))
+            arrays[f"links_{level}"] = np.array(list(layer.values()), dtype=np.int32).reshape(-1, self.m)
+
+        with open(self.upper_path + ".tmp", "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(self.upper_path + ".tmp", self.upper_path)
+
+    def add(self, count: int):
+        """
+        Link the vector rows from the current index count up to count into the graph, one at a time.
+        """
+        first = self.count
+        if count <= first:
+            return
+
+        levels = np.floor(-np.log(1 - self._rng.random(count - first)) * self.level_mult).astype(np.int8)
+        self.links.append(np.full((count - first, self.m0), -1, dtype=np.int32))
+        self.levels.append(levels)
+
+        vectors = self.vectors.array
+        for row, level in zip(range(first, count), levels.tolist()):
+            self._insert(row, level, vectors)
+
+    def _insert(self, row: int, level: int, vectors: np.ndarray):
+        while len(self.upper) < level:
+            self.upper.append({})
+        for layer in range(1, level + 1):
+            self.upper[layer - 1][row] = np.full(self.m, -1, dtype=np.int32)
+
+        if self.entry_point < 0:
+            self.entry_point = row
+            return
+
+        query = vectors[row]
+        entry = self.entry_point
+        top_level = int(self.levels.array[entry])
+        nearest = [(float(vectors[entry] @ query), entry)]
+
+        # Greedy descent through the layers above the new row's level
+        for layer in range(top_level, level, -1):
+            nearest = self._search_layer(query, nearest, 1, layer, vectors)
+
+        for layer in range(min(level, top_level), -1, -1):
+            nearest = self._search_layer(query, nearest, self.ef_construction, layer, vectors)
+            max_links = self.m0 if layer == 0 else self.m
+            neighbors = self._select_neighbors(sorted(nearest, reverse=True), max_links, vectors)
+            self._set_links(layer, row, neighbors)
+
+            for neighbor in neighbors:
+                links = self._get_links(layer, neighbor)
+                if len(links) < max_links:
+                    self._set_links(layer, neighbor, np.append(links, row))
+                    continue
+                # Shrink the full link list of the neighbor with the same heuristic
+                candidates = np.append(links, row)
+                scores = vectors[candidates] @ vectors[neighbor]
+                order = np.argsort(-scores)
+                self._set_links(
+                    layer,
+                    neighbor,
+                    self._select_neighbors(list(zip(scores[order].tolist(), candidates[order].tolist())), max_links, vectors),
+                )
+
+        if level > top_level:
+            self.entry_point = row
+
+    def _get_links(self, layer: int, row: int) -> np.ndarray:
+        links = self.links.array[row] if layer == 0 else self.upper[layer - 1][row]
+        return links[links >= 0]
+
+    def _set_links(self, layer: int, row: int, links):
+        target = self.links.array[row] if layer == 0 else self.upper[layer - 1][row]
+        target[:] = -1
+        target[: len(links)] = links
+
+    def _select_neighbors(self, candidates: List[Tuple[float, int]], max_links: int, vectors: np.ndarray) -> List[int]:
+        """
+        Pick up to max_links of the candidates, sorted by descending score, that are closer to the query than
+        to any neighbor already picked, so links spread out in different directions (the HNSW heuristic).
+        """
+        if len(candidates) <= max_links:
+            return [row for _, row in candidates]
+
+        rows = np.array([row for _, row in candidates])
+        scores = np.array([score for score, _ in candidates], dtype=np.float32)
+        similarity = vectors[rows] @ vectors[rows].T
+
+        # Highest similarity of each candidate to the neighbors picked so far, updated once per pick
+        closest = np.full(len(rows), -np.inf, dtype=np.float32)
+        selected: List[int] = []
+        i = 0
+        while len(selected) < max_links:
+            selected.append(i)
+            np.maximum(closest, similarity[i], out=closest)
+            remaining = np.flatnonzero(closest[i + 1 :] < scores[i + 1 :])
+            if not len(remaining):
+                break
+            i += 1 + int(remaining[0])
+        return rows[selected].tolist()
+
+    def _search_layer(
+        self,
+        query: np.ndarray,
+        entry_points: List[Tuple[float, int]],
+        ef: int,
+        layer: int,
+        vectors: np.ndarray,
+        allowed: Optional[np.ndarray] = None,
+    ) -> List[Tuple[float, int]]:
+        """
+        Best-first search of one layer, returning up to ef (score, row) pairs.
+
+        When allowed is given, every row is still traversed but only allowed rows are returned.
+        """
+        if len(self._visited) < self.count:
+            self._visited = np.zeros(self.count, dtype=np.uint32)
+        self._visit_tag += 1
+        if self._visit_tag == np.iinfo(np.uint32).max:
+            self._visited[:] = 0
+            self._visit_tag = 1
+        visited, tag = self._visited, self._visit_tag
+
+        layer_links = self.links.array if layer == 0 else self.upper[layer - 1]
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        candidates = [(-score, row) for score, row in entry_points]
+        heapq.heapify(candidates)
+        results = [(score, row) for score, row in entry_points if allowed is None or allowed[row]]
+        heapq.heapify(results)
+        for _, row in entry_points:
+            visited[row] = tag
+
+        while candidates:
+            negative_score, row = heappop(candidates)
+            if len(results) >= ef and -negative_score < results[0][0]:
+                break
+
+            links = layer_links[row]
+            links = links[(links >= 0) & (visited[links] != tag)]
+            if not len(links):
+                continue
+            visited[links] = tag
+
+            scores = vectors[links] @ query
+            if len(results) >= ef:
+                # Drop the links that cannot enter the results before the per-link loop
+                better = scores > results[0][0]
+                scores, links = scores[better], links[better]
+
+            passes = allowed[links].tolist() if allowed is not None else [True] * len(links)
+            for score, link, passed in zip(scores.tolist(), links.tolist(), passes):
+                if len(results) < ef or score > results[0][0]:
+                    heappush(candidates, (-score, link))
+                    if passed:
+                        heappush(results, (score, link))
+                        if len(results) > ef:
+                            heappop(results)
+
+        return results
+
+    def search(
+        self, query: np.ndarray, top_k: int, allowed: Optional[np.ndarray] = None, ef: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the rows and scores of the approximate top_k neighbors of a normalized query, best first.
+
+        Args:
+            query: The L2-normalized query vector.
+            top_k: The number of neighbors to return.
+            allowed: Optional boolean mask of the rows that may be returned, e.g. live rows matching a filter.
+            ef: The candidate list size, at least top_k. Defaults to ef_search.
+        """
+        if self.entry_point < 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        vectors = self.vectors.array
+        entry = self.entry_point
+        nearest = [(float(vectors[entry] @ query), entry)]
+        for layer in range(int(self.levels.array[entry]), 0, -1):
+            nearest = self._search_layer(query, nearest, 1, layer, vectors)
+
+        results = self._search_layer(query, nearest, max(ef or self.ef_search, top_k), 0, vectors, allowed)
+        results = heapq.nlargest(top_k, results)
+        return (
+            np.array([row for _, row in results], dtype=np.int64),
+            np.array([score for score, _ in results], dtype=np.float32),
+        )
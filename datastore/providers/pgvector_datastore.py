@@ -12,6 +12,7 @@ from models.models import (
     QueryResult,
     QueryWithEmbedding,
     DocumentChunkWithScore,
+    embedding_to_list,
 )
 
 
@@ -80,7 +81,7 @@ class PgVectorDataStore(DataStore):
                 json = {
                     "id": chunk.id,
                     "content": chunk.text,
-                    "embedding": chunk.embedding,
+                    "embedding": embedding_to_list(chunk.embedding),
                     "document_id": document_id,
                     "source": chunk.metadata.source,
                     "source_id": chunk.metadata.source_id,
@@ -105,7 +106,7 @@ class PgVectorDataStore(DataStore):
         for query in queries:
             # get the top 3 documents with the highest cosine similarity using rpc function in the database called "match_page_sections"
             params = {
-                "in_embedding": query.embedding,
+                "in_embedding": embedding_to_list(query.embedding),
             }
             if query.top_k:
                 params["in_match_count"] = query.top_k
@@ -152,7 +153,7 @@ class PgVectorDataStore(DataStore):
                 query_results.append(QueryResult(query=query.query, results=[]))
         return query_results
 
-    async def delete(
+    async def _delete(
         self,
         ids: Optional[List[str]] = None,
         filter: Optional[DocumentMetadataFilter] = None,
@@ -14,8 +14,10 @@ from models.models import (
     QueryResult,
     QueryWithEmbedding,
     Source,
+    embedding_to_list,
 )
 from services.date import to_unix_timestamp
+from services.embedding_models import get_embedding_model_info
 
 # Read environment variables for Pinecone configuration
 PINECONE_API_KEY = os.environ.get("PINECONE_API_KEY")
@@ -25,6 +27,9 @@ assert PINECONE_API_KEY is not None
 assert PINECONE_ENVIRONMENT is not None
 assert PINECONE_INDEX is not None
 
+# Pinecone index metric for each embedding model metric
+PINECONE_METRICS = {"cosine": "cosine", "dot": "dotproduct", "l2": "euclidean"}
+
 # Initialize Pinecone with the API key and environment
 pinecone.init(api_key=PINECONE_API_KEY, environment=PINECONE_ENVIRONMENT)
 
@@ -45,9 +50,11 @@ class PineconeDataStore(DataStore):
                 logger.info(
                     f"Creating index {PINECONE_INDEX} with metadata config {fields_to_index}"
                 )
+                model_info = get_embedding_model_info()
                 pinecone.create_index(
                     PINECONE_INDEX,
-                    dimension=1536,  # dimensionality of OpenAI ada v2 embeddings
+                    dimension=model_info.dimension,  # dimensionality of the configured embedding model
+                    metric=PINECONE_METRICS[model_info.metric],
                     metadata_config={"indexed": fields_to_index},
                 )
                 self.index = pinecone.Index(PINECONE_INDEX)
@@ -87,7 +94,7 @@ class PineconeDataStore(DataStore):
                 # Add the text and document id to the metadata dict
                 pinecone_metadata["text"] = chunk.text
                 pinecone_metadata["document_id"] = doc_id
-                vector = (chunk.id, chunk.embedding, pinecone_metadata)
+                vector = (chunk.id, embedding_to_list(chunk.embedding), pinecone_metadata)
                 vectors.append(vector)
 
         # Split the vectors list into batches of the specified size
@@ -128,7 +135,7 @@ class PineconeDataStore(DataStore):
                 query_response = self.index.query(
                     # namespace=namespace,
                     top_k=query.top_k,
-                    vector=query.embedding,
+                    vector=embedding_to_list(query.embedding),
                     filter=pinecone_filter,
                     include_metadata=True,
                 )
@@ -173,7 +180,7 @@ class PineconeDataStore(DataStore):
         return results
 
     @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3))
-    async def delete(
+    async def _delete(
         self,
         ids: Optional[List[str]] = None,
         filter: Optional[DocumentMetadataFilter] = None,
@@ -45,7 +45,7 @@ class PostgresClient(PGClient):
         with self.client.cursor() as cur:
             if not json.get("created_at"):
                 json["created_at"] = datetime.now()
-            json["embedding"] = np.array(json["embedding"])
+            json["embedding"] = np.asarray(json["embedding"])
             cur.execute(
                 f"INSERT INTO {table} (id, content, embedding, document_id, source, source_id, url, author, created_at) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) ON CONFLICT (id) DO UPDATE SET content = %s, embedding = %s, document_id = %s, source = %s, source_id = %s, url = %s, author = %s, created_at = %s",
                 (
@@ -75,7 +75,7 @@ class PostgresClient(PGClient):
         Calls a stored procedure in the database with the given parameters.
         """
         data = []
-        params["in_embedding"] = np.array(params["in_embedding"])
+        params["in_embedding"] = np.asarray(params["in_embedding"])
         with self.client.cursor(cursor_factory=DictCursor) as cur:
             cur.callproc(function_name, params)
             rows = cur.fetchall()
@@ -13,12 +13,14 @@ from models.models import (
     QueryResult,
     QueryWithEmbedding,
     DocumentChunkWithScore,
+    embedding_to_list,
 )
 from qdrant_client.http import models as rest
 
 import qdrant_client
 
 from services.date import to_unix_timestamp
+from services.embedding_models import get_embedding_model_info
 
 QDRANT_URL = os.environ.get("QDRANT_URL", "http://localhost")
 QDRANT_PORT = os.environ.get("QDRANT_PORT", "6333")
@@ -26,6 +28,9 @@ QDRANT_GRPC_PORT = os.environ.get("QDRANT_GRPC_PORT", "6334")
 QDRANT_API_KEY = os.environ.get("QDRANT_API_KEY")
 QDRANT_COLLECTION = os.environ.get("QDRANT_COLLECTION", "document_chunks")
 
+# Qdrant distance for each embedding model metric
+QDRANT_DISTANCES = {"cosine": "Cosine", "dot": "Dot", "l2": "Euclid"}
+
 
 class QdrantDataStore(DataStore):
     UUID_NAMESPACE = uuid.UUID("3896d314-1e95-4a3a-b45a-945f9f0b541d")
@@ -33,17 +38,18 @@ class QdrantDataStore(DataStore):
     def __init__(
         self,
         collection_name: Optional[str] = None,
-        vector_size: int = 1536,
-        distance: str = "Cosine",
+        vector_size: Optional[int] = None,
+        distance: Optional[str] = None,
         recreate_collection: bool = False,
     ):
         """
         Args:
             collection_name: Name of the collection to be used
-            vector_size: Size of the embedding stored in a collection
+            vector_size: Size of the embedding stored in a collection, defaults to
+                the dimension of the configured embedding model
             distance:
                 Any of "Cosine" / "Euclid" / "Dot". Distance function to measure
-                similarity
+                similarity, defaults to the embedding model's preferred metric
         """
         self.client = qdrant_client.QdrantClient(
             url=QDRANT_URL,
@@ -55,6 +61,10 @@ class QdrantDataStore(DataStore):
         )
         self.collection_name = collection_name or QDRANT_COLLECTION
 
+        model_info = get_embedding_model_info()
+        vector_size = vector_size or model_info.dimension
+        distance = distance or QDRANT_DISTANCES[model_info.metric]
+
         # Set up the collection so the points might be inserted or queried
         self._set_up_collection(vector_size, distance, recreate_collection)
 
@@ -100,7 +110,7 @@ class QdrantDataStore(DataStore):
             for query, result in zip(queries, results)
         ]
 
-    async def delete(
+    async def _delete(
         self,
         ids: Optional[List[str]] = None,
         filter: Optional[DocumentMetadataFilter] = None,
@@ -138,7 +148,7 @@ class QdrantDataStore(DataStore):
         )
         return rest.PointStruct(
             id=self._create_document_chunk_id(document_chunk.id),
-            vector=document_chunk.embedding,  # type: ignore
+            vector=embedding_to_list(document_chunk.embedding),  # type: ignore
             payload={
                 "id": document_chunk.id,
                 "text": document_chunk.text,
@@ -156,7 +166,7 @@ class QdrantDataStore(DataStore):
         self, query: QueryWithEmbedding
     ) -> rest.SearchRequest:
         return rest.SearchRequest(
-            vector=query.embedding,
+            vector=embedding_to_list(query.embedding),
             filter=self._convert_metadata_filter_to_qdrant_filter(query.filter),
             limit=query.top_k,  # type: ignore
             with_payload=True,
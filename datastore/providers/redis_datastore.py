@@ -23,8 +23,10 @@ from models.models import (
     DocumentMetadataFilter,
     QueryResult,
     QueryWithEmbedding,
+    embedding_to_list,
 )
 from services.date import to_unix_timestamp
+from services.embedding_models import get_embedding_model_info
 
 # Read environment variables for Redis
 REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
@@ -32,12 +34,14 @@ REDIS_PORT = int(os.environ.get("REDIS_PORT", 6379))
 REDIS_PASSWORD = os.environ.get("REDIS_PASSWORD")
 REDIS_INDEX_NAME = os.environ.get("REDIS_INDEX_NAME", "index")
 REDIS_DOC_PREFIX = os.environ.get("REDIS_DOC_PREFIX", "doc")
-REDIS_DISTANCE_METRIC = os.environ.get("REDIS_DISTANCE_METRIC", "COSINE")
+REDIS_DISTANCE_METRIC = os.environ.get("REDIS_DISTANCE_METRIC")  # Defaults to the embedding model's preferred metric
 REDIS_INDEX_TYPE = os.environ.get("REDIS_INDEX_TYPE", "FLAT")
 assert REDIS_INDEX_TYPE in ("FLAT", "HNSW")
 
-# OpenAI Ada Embeddings Dimension
-VECTOR_DIMENSION = 1536
+REDIS_DELETE_PAGE_SIZE = 10000  # Keys fetched per search when bulk deleting documents
+
+# RediSearch distance metric for each embedding model metric
+REDIS_DISTANCE_METRICS = {"cosine": "COSINE", "dot": "IP", "l2": "L2"}
 
 # RediSearch constants
 REDIS_REQUIRED_MODULES = [
@@ -94,7 +98,8 @@ class RedisDataStore(DataStore):
 
         await _check_redis_module_exist(client, modules=REDIS_REQUIRED_MODULES)
 
-        dim = kwargs.get("dim", VECTOR_DIMENSION)
+        model_info = get_embedding_model_info()
+        dim = kwargs.get("dim") or model_info.dimension
         redisearch_schema = {
             "metadata": {
                 "document_id": TagField("$.metadata.document_id", as_name="document_id"),
@@ -109,7 +114,7 @@ class RedisDataStore(DataStore):
                 {
                     "TYPE": "FLOAT64",
                     "DIM": dim,
-                    "DISTANCE_METRIC": REDIS_DISTANCE_METRIC,
+                    "DISTANCE_METRIC": REDIS_DISTANCE_METRIC or REDIS_DISTANCE_METRICS[model_info.metric],
                 },
                 as_name="embedding",
             ),
@@ -178,6 +183,7 @@ class RedisDataStore(DataStore):
         data = chunk.__dict__
         metadata = chunk.metadata.__dict__
         data["chunk_id"] = data.pop("id")
+        data["embedding"] = embedding_to_list(data["embedding"])
 
         # Prep Redis Metadata
         redis_metadata = dict(self._default_metadata)
@@ -307,7 +313,7 @@ class RedisDataStore(DataStore):
 
             # Extract Redis query
             redis_query: RediSearchQuery = self._get_redis_query(query)
-            embedding = np.array(query.embedding, dtype=np.float64).tobytes()
+            embedding = np.asarray(query.embedding, dtype=np.float64).tobytes()
 
             # Perform vector search
             query_response = await self.client.ft(REDIS_INDEX_NAME).search(
@@ -335,7 +341,34 @@ class RedisDataStore(DataStore):
     async def _find_keys(self, pattern: str) -> List[str]:
         return [key async for key in self.client.scan_iter(pattern)]
 
-    async def delete(
+    async def _delete_documents(self, source_id: str, document_ids: List[str]):
+        """
+        Deletes every chunk of the given documents, finding their keys with document_id tag
+        queries on the index instead of one SCAN per document.
+        """
+        deleted = set()
+        for i in range(0, len(document_ids), 100):
+            tags = "|".join(self._escape(document_id) for document_id in document_ids[i : i + 100])
+            query = (
+                RediSearchQuery(f"@document_id:{{{tags}}}")
+                .no_content()
+                .paging(0, REDIS_DELETE_PAGE_SIZE)
+                .dialect(2)
+            )
+            # Deleted keys leave the index, so each search starts from offset 0. Paging to an offset past
+            # RediSearch's MAXSEARCHRESULTS (10000 by default) is an error
+            while True:
+                results = await self.client.ft(REDIS_INDEX_NAME).search(query)
+                # Stop on keys already deleted too, rather than loop if the index lags behind
+                keys = [doc.id for doc in results.docs if doc.id not in deleted]
+                if not keys:
+                    break
+                await self._redis_delete(keys)
+                deleted.update(keys)
+
+        logger.info(f"Deleted {len(deleted)} keys for {len(document_ids)} documents from Redis")
+
+    async def _delete(
         self,
         ids: Optional[List[str]] = None,
         filter: Optional[DocumentMetadataFilter] = None,
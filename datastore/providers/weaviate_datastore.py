@@ -18,6 +18,7 @@ from models.models import (
     QueryResult,
     QueryWithEmbedding,
     Source,
+    embedding_to_list,
 )
 
 WEAVIATE_URL_DEFAULT = "http://localhost:8080"
@@ -172,7 +173,7 @@ class WeaviateDataStore(DataStore):
                         if doc_chunk_dict["source"]
                         else None
                     )
-                    embedding = doc_chunk_dict.pop("embedding")
+                    embedding = embedding_to_list(doc_chunk_dict.pop("embedding"))
 
                     batch.add_data_object(
                         uuid=doc_uuid,
@@ -210,7 +211,7 @@ class WeaviateDataStore(DataStore):
                             "author",
                         ],
                     )
-                    .with_hybrid(query=query.query, alpha=0.5, vector=query.embedding)
+                    .with_hybrid(query=query.query, alpha=0.5, vector=embedding_to_list(query.embedding))
                     .with_limit(query.top_k)  # type: ignore
                     .with_additional(["score", "vector"])
                     .do()
@@ -231,7 +232,7 @@ class WeaviateDataStore(DataStore):
                             "author",
                         ],
                     )
-                    .with_hybrid(query=query.query, alpha=0.5, vector=query.embedding)
+                    .with_hybrid(query=query.query, alpha=0.5, vector=embedding_to_list(query.embedding))
                     .with_where(filters_)
                     .with_limit(query.top_k)  # type: ignore
                     .with_additional(["score", "vector"])
@@ -261,7 +262,7 @@ class WeaviateDataStore(DataStore):
 
         return await asyncio.gather(*[_single_query(query) for query in queries])
 
-    async def delete(
+    async def _delete(
         self,
         ids: Optional[List[str]] = None,
         filter: Optional[DocumentMetadataFilter] = None,
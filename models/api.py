@@ -1,4 +1,5 @@
 from models.models import (
+    EMBEDDING_JSON_ENCODERS,
     Document,
     DocumentMetadataFilter,
     Query,
@@ -24,6 +25,9 @@ class QueryRequest(BaseModel):
 class QueryResponse(BaseModel):
     results: List[QueryResult]
 
+    class Config:
+        json_encoders = EMBEDDING_JSON_ENCODERS
+
 
 class DeleteRequest(BaseModel):
     ids: Optional[List[str]] = None
@@ -1,6 +1,39 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Union
 from enum import Enum
+import numpy as np
+
+
+class Embedding(np.ndarray):
+    """
+    Field type for embedding vectors. Values are kept as contiguous float32 numpy arrays
+    (rows of a batch are not copied) and only converted to lists at the JSON API boundary.
+    """
+
+    @classmethod
+    def __get_validators__(cls):
+        yield cls.validate
+
+    @classmethod
+    def validate(cls, value) -> np.ndarray:
+        return np.ascontiguousarray(value, dtype=np.float32)
+
+    @classmethod
+    def __modify_schema__(cls, field_schema: dict):
+        field_schema.update(type="array", items={"type": "number"})
+
+
+def embedding_to_list(embedding: Optional[Union[np.ndarray, List[float]]]) -> Optional[List[float]]:
+    """
+    Convert an embedding to a list of floats for clients that only accept plain JSON vectors.
+    """
+    if isinstance(embedding, np.ndarray):
+        return embedding.tolist()
+    return embedding
+
+
+# Lets pydantic and FastAPI serialize models holding numpy embeddings
+EMBEDDING_JSON_ENCODERS = {np.ndarray: lambda embedding: embedding.tolist()}
 
 
 class Source(str, Enum):
@@ -26,7 +59,10 @@ class DocumentChunk(BaseModel):
     id: Optional[str] = None
     text: str
     metadata: DocumentChunkMetadata
-    embedding: Optional[List[float]] = None
+    embedding: Optional[Embedding] = None
+
+    class Config:
+        json_encoders = EMBEDDING_JSON_ENCODERS
 
 
 class DocumentChunkWithScore(DocumentChunk):
@@ -59,10 +95,17 @@ class Query(BaseModel):
     filter: Optional[DocumentMetadataFilter] = None
     top_k: Optional[int] = 3
     embedding_model: Optional[str]
+    vector_weight: Optional[float] = None  # Weight of the vector results in hybrid search, defaults to HYBRID_VECTOR_WEIGHT
+    lexical_weight: Optional[float] = None  # Weight of the BM25 results in hybrid search, defaults to HYBRID_LEXICAL_WEIGHT
+    mmr_lambda: Optional[float] = None  # Relevance weight of MMR diversification from 0 to 1, defaults to MMR_LAMBDA
+    mmr_fetch_multiplier: Optional[int] = None  # Candidates retrieved per result for MMR, defaults to MMR_FETCH_MULTIPLIER
 
 
 class QueryWithEmbedding(Query):
-    embedding: List[float]
+    embedding: Embedding
+
+    class Config:
+        json_encoders = EMBEDDING_JSON_ENCODERS
 
 
 class QueryResult(BaseModel):
@@ -21,7 +21,8 @@ from models.api import (
 from datastore.factory import get_datastore
 from services.file import get_document_from_file
 from services.load_env_vars import load as load_env_vars
-from services.embeddings import get_embeddings
+from services.chunks import shutdown_chunk_workers, start_chunk_workers
+from services.embeddings import get_embeddings_async, preload_embedding_model, shutdown_embedding_workers
 from services.prompt import get_prompt_response
 
 from models.models import DocumentMetadata, Source
@@ -165,10 +166,10 @@ async def embedding(
     request: EmbeddingRequest = Body(...),
 ):
     try:
-        results = get_embeddings(
+        results = await get_embeddings_async(
             [request.text],
         )
-        return EmbeddingResponse(embedding=results[0])
+        return EmbeddingResponse(embedding=results[0].tolist())
     except Exception as e:
         logger.error(e)
         raise HTTPException(status_code=500, detail="Internal Service Error")
@@ -204,6 +205,15 @@ async def prompt(
 async def startup():
     global datastore
     datastore = await get_datastore()
+    if os.environ.get("EMBEDDING_MODEL_PRELOAD", "false").lower() == "true":
+        preload_embedding_model()
+    start_chunk_workers()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    shutdown_embedding_workers()
+    shutdown_chunk_workers()
 
 
 def start():
@@ -0,0 +1,281 @@
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import os
+import uuid
+
+import tiktoken
+
+from models.models import Document, DocumentChunk, DocumentChunkMetadata
+from services.sbert_tokenizer import get_tokenizer
+
+# Global variables
+tokenizer = tiktoken.get_encoding(
+    "cl100k_base"
+)  # The encoding scheme to use for tokenization
+
+# Constants
+CHUNK_SIZE = 200  # The target size of each text chunk in tokens
+MIN_CHUNK_SIZE_CHARS = 350  # The minimum size of each text chunk in characters
+MIN_CHUNK_LENGTH_TO_EMBED = 5  # Discard chunks shorter than this
+MAX_NUM_CHUNKS = 10000  # The maximum number of chunks to generate from a text
+
+
+def get_text_chunks(text: str, chunk_token_size: Optional[int]) -> List[str]:
+    """
+    Split a text into chunks of ~CHUNK_SIZE tokens, based on punctuation and newline boundaries.
+
+    Args:
+        text: The text to split into chunks.
+        chunk_token_size: The target size of each chunk in tokens, or None to use the default CHUNK_SIZE.
+
+    Returns:
+        A list of text chunks, each of which is a string of ~CHUNK_SIZE tokens.
+    """
+    # Return an empty list if the text is empty or whitespace
+    if not text or text.isspace():
+        return []
+
+    # Optionally size chunks with the tokenizer of the sentence-transformer model that will embed them.
+    # EMBEDDING_MODEL is read here like services.embeddings.get_embedding_model_name, which this module does not
+    # import so chunking processes never load the embedding stack
+    if os.environ.get("CHUNK_TOKENIZER", "cl100k_base") == "model":
+        embedding_model = os.environ.get("EMBEDDING_MODEL") or "text-embedding-ada-002"
+        if embedding_model != "text-embedding-ada-002":
+            return get_model_text_chunks(text, chunk_token_size, embedding_model)
+
+    # Tokenize the text. encode_ordinary matches encode(text, disallowed_special=()) without the special token scan
+    tokens = tokenizer.encode_ordinary(text)
+
+    # Initialize an empty list of chunks
+    chunks = []
+
+    # Use the provided chunk token size or the default one
+    chunk_size = chunk_token_size or CHUNK_SIZE
+
+    # Initialize a counter for the number of chunks
+    num_chunks = 0
+
+    # Walk the token list by offset instead of re-slicing the remaining tokens, which made long texts quadratic
+    start = 0
+
+    # Loop until all tokens are consumed
+    while start < len(tokens) and num_chunks < MAX_NUM_CHUNKS:
+        # Take the next chunk_size tokens as a chunk
+        end = min(start + chunk_size, len(tokens))
+
+        # Decode the chunk into text
+        chunk_text = tokenizer.decode(tokens[start:end])
+
+        # Skip the chunk if it is empty or whitespace
+        if not chunk_text or chunk_text.isspace():
+            # Move past the tokens of the chunk
+            start = end
+            # Continue to the next iteration of the loop
+            continue
+
+        # Find the last period or punctuation mark in the chunk
+        last_punctuation = max(
+            chunk_text.rfind("."),
+            chunk_text.rfind("?"),
+            chunk_text.rfind("!"),
+            chunk_text.rfind("\n"),
+        )
+
+        # If there is a punctuation mark, and the last punctuation index is before MIN_CHUNK_SIZE_CHARS
+        if last_punctuation != -1 and last_punctuation > MIN_CHUNK_SIZE_CHARS:
+            # Truncate the chunk text at the punctuation mark
+            chunk_text = chunk_text[: last_punctuation + 1]
+
+        # Remove any newline characters and strip any leading or trailing whitespace
+        chunk_text_to_append = chunk_text.replace("\n", " ").strip()
+
+        if len(chunk_text_to_append) > MIN_CHUNK_LENGTH_TO_EMBED:
+            # Append the chunk text to the list of chunks
+            chunks.append(chunk_text_to_append)
+
+        # Move past the tokens corresponding to the chunk text. The chunk text is re-encoded rather than mapped
+        # back through token byte offsets: a decoded chunk can re-encode to fewer tokens than it was cut from
+        # (e.g. around tabs and multibyte characters), the original chunker advanced by the re-encoded count, and
+        # chunks must not change. Re-encoding one chunk at a time keeps the walk linear in the text length.
+        # tests/services/test_chunker.py checks the output against the original chunker
+        start += len(tokenizer.encode_ordinary(chunk_text))
+
+        # Increment the number of chunks
+        num_chunks += 1
+
+    # Handle the remaining tokens
+    if start < len(tokens):
+        remaining_text = tokenizer.decode(tokens[start:]).replace("\n", " ").strip()
+        if len(remaining_text) > MIN_CHUNK_LENGTH_TO_EMBED:
+            chunks.append(remaining_text)
+
+    return chunks
+
+
+@lru_cache(maxsize=8)
+def get_chunk_tokenizer(embedding_model: str) -> Tuple[Any, int]:
+    """
+    Return the tokenizer of a sentence-transformer model and the number of text tokens it can embed
+    without truncation (its max sequence length minus the special tokens it adds).
+
+    Only the tokenizer and the model config are loaded, so chunking never loads model weights.
+    """
+    model_tokenizer, max_seq_length = get_tokenizer(embedding_model)
+    return model_tokenizer, max_seq_length - model_tokenizer.num_special_tokens_to_add()
+
+
+def get_model_text_chunks(text: str, chunk_token_size: Optional[int], embedding_model: str) -> List[str]:
+    """
+    Split a text into chunks counted in the embedding model's own tokens, with the same punctuation and newline
+    rules as get_text_chunks.
+
+    Chunks default to, and are capped at, the model's max sequence length so none are truncated at encode time.
+    Token character offsets map chunk boundaries back to the text, so chunks are exact slices of it and nothing
+    is re-encoded.
+
+    Args:
+        text: The text to split into chunks.
+        chunk_token_size: The target size of each chunk in model tokens, or None to use the model's maximum.
+        embedding_model: The name of the sentence-transformer model.
+
+    Returns:
+        A list of text chunks.
+    """
+    model_tokenizer, max_tokens = get_chunk_tokenizer(embedding_model)
+    chunk_size = min(chunk_token_size or max_tokens, max_tokens)
+
+    encoding = model_tokenizer(
+        text,
+        add_special_tokens=False,
+        return_offsets_mapping=True,
+        return_attention_mask=False,
+        return_token_type_ids=False,
+        verbose=False,  # Long texts exceed the model's max length on purpose
+    )
+    token_starts = [start for start, _ in encoding["offset_mapping"]]
+    token_ends = [end for _, end in encoding["offset_mapping"]]
+
+    chunks = []
+    num_chunks = 0
+    start = 0
+
+    while start < len(token_starts) and num_chunks < MAX_NUM_CHUNKS:
+        end = min(start + chunk_size, len(token_starts))
+        chunk_start = token_starts[start]
+        chunk_text = text[chunk_start : token_ends[end - 1]]
+
+        # Find the last period or punctuation mark in the chunk
+        last_punctuation = max(
+            chunk_text.rfind("."),
+            chunk_text.rfind("?"),
+            chunk_text.rfind("!"),
+            chunk_text.rfind("\n"),
+        )
+
+        # Truncate the chunk at the punctuation mark and only consume the tokens that end before it
+        if last_punctuation != -1 and last_punctuation > MIN_CHUNK_SIZE_CHARS:
+            chunk_text = chunk_text[: last_punctuation + 1]
+            end = max(start + 1, bisect_right(token_ends, chunk_start + last_punctuation + 1, start, end))
+
+        chunk_text_to_append = chunk_text.replace("\n", " ").strip()
+
+        if len(chunk_text_to_append) > MIN_CHUNK_LENGTH_TO_EMBED:
+            chunks.append(chunk_text_to_append)
+
+        start = end
+        num_chunks += 1
+
+    # Handle the remaining tokens
+    if start < len(token_starts):
+        remaining_text = text[token_starts[start] :].replace("\n", " ").strip()
+        if len(remaining_text) > MIN_CHUNK_LENGTH_TO_EMBED:
+            chunks.append(remaining_text)
+
+    return chunks
+
+
+def create_document_chunks(
+    doc: Document, chunk_token_size: Optional[int], content_ids: bool = False
+) -> Tuple[List[DocumentChunk], str]:
+    """
+    Create a list of document chunks from a document object and return the document id.
+
+    Args:
+        doc: The document object to create chunks from. It should have a text attribute and optionally an id and a metadata attribute.
+        chunk_token_size: The target size of each chunk in tokens, or None to use the default CHUNK_SIZE.
+        content_ids: Whether to derive chunk ids from a hash of each chunk's content (see get_content_chunk_ids)
+            instead of numbering the chunks, so an unchanged chunk keeps its id across upserts.
+
+    Returns:
+        A tuple of (doc_chunks, doc_id), where doc_chunks is a list of document chunks, each of which is a DocumentChunk object with an id, a document_id, a text, and a metadata attribute,
+        and doc_id is the id of the document object, generated if not provided. The id of each chunk is generated from the document id and a sequential number, and the metadata is copied from the document object.
+    """
+    # Check if the document text is empty or whitespace
+    if not doc.text or doc.text.isspace():
+        return [], doc.id or str(uuid.uuid4())
+
+    # Generate a document id if not provided
+    doc_id = doc.id or str(uuid.uuid4())
+
+    # Split the document text into chunks
+    text_chunks = get_text_chunks(doc.text, chunk_token_size)
+
+    metadata = (
+        DocumentChunkMetadata(**doc.metadata.__dict__)
+        if doc.metadata is not None
+        else DocumentChunkMetadata()
+    )
+
+    metadata.document_id = doc_id
+
+    # Initialize an empty list of chunks for this document
+    doc_chunks = []
+
+    if content_ids:
+        chunk_ids = get_content_chunk_ids(doc_id, text_chunks, metadata)
+    else:
+        chunk_ids = [f"{doc_id}_{i}" for i in range(len(text_chunks))]
+
+    # Create a DocumentChunk object for each chunk
+    for chunk_id, text_chunk in zip(chunk_ids, text_chunks):
+        doc_chunk = DocumentChunk(
+            id=chunk_id,
+            text=text_chunk,
+            metadata=metadata,
+        )
+        # Append the chunk object to the list of chunks for this document
+        doc_chunks.append(doc_chunk)
+
+    # Return the list of chunks and the document id
+    return doc_chunks, doc_id
+
+
+def get_content_chunk_ids(doc_id: str, text_chunks: List[str], metadata: DocumentChunkMetadata) -> List[str]:
+    """
+    Return an id of the form {doc_id}_{hash} for each chunk, hashing the chunk text together with the metadata.
+
+    A chunk whose text and metadata are unchanged gets the same id on every upsert, so delta upserts can tell
+    unchanged chunks apart from new ones. Repeated identical chunks within a document are told apart by a
+    _{n} suffix.
+    """
+    metadata_json = metadata.json(sort_keys=True)
+    seen: Dict[str, int] = {}
+    chunk_ids = []
+
+    for text_chunk in text_chunks:
+        content_hash = hashlib.sha256(f"{metadata_json}\0{text_chunk}".encode("utf-8")).hexdigest()[:32]
+        count = seen.get(content_hash, 0)
+        seen[content_hash] = count + 1
+        chunk_ids.append(f"{doc_id}_{content_hash}" + (f"_{count}" if count else ""))
+
+    return chunk_ids
+
+
+def warm_up_chunk_worker() -> int:
+    """
+    No-op run by services.chunks in each chunking process on start. Importing this module to unpickle it is
+    the warm-up.
+    """
+    return os.getpid()
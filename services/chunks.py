@@ -1,203 +1,234 @@
-from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import multiprocessing
+import threading
 import uuid
 import os
-from models.models import Document, DocumentChunk, DocumentChunkMetadata
+from models.models import Document, DocumentChunk
+
+from loguru import logger
+
+# Chunking itself lives in services.chunker, which chunking processes import without the embedding stack
+from services.chunker import (
+    CHUNK_SIZE,
+    MAX_NUM_CHUNKS,
+    MIN_CHUNK_LENGTH_TO_EMBED,
+    MIN_CHUNK_SIZE_CHARS,
+    create_document_chunks,
+    get_chunk_tokenizer,
+    get_content_chunk_ids,
+    get_model_text_chunks,
+    get_text_chunks,
+    tokenizer,
+    warm_up_chunk_worker,
+)
+from services.embeddings import get_embeddings, get_embeddings_async
 
-import tiktoken
-
-from services.embeddings import get_embeddings
-
-# Global variables
-tokenizer = tiktoken.get_encoding(
-    "cl100k_base"
-)  # The encoding scheme to use for tokenization
-
-# Constants
-CHUNK_SIZE = 200  # The target size of each text chunk in tokens
-MIN_CHUNK_SIZE_CHARS = 350  # The minimum size of each text chunk in characters
-MIN_CHUNK_LENGTH_TO_EMBED = 5  # Discard chunks shorter than this
 EMBEDDINGS_BATCH_SIZE = int(os.environ.get("OPENAI_EMBEDDING_BATCH_SIZE", 128))  # The number of embeddings to request at a time
-MAX_NUM_CHUNKS = 10000  # The maximum number of chunks to generate from a text
+CHUNK_WORKERS = int(os.environ.get("CHUNK_WORKERS", 0))  # Chunking processes, 0 or 1 chunks in-process
+CHUNK_PARALLEL_MIN_CHARS = int(os.environ.get("CHUNK_PARALLEL_MIN_CHARS", 200000))  # Smaller batches skip the process pool
 
+_chunk_executor: Optional[ProcessPoolExecutor] = None
+_chunk_executor_lock = threading.Lock()
 
-def get_text_chunks(text: str, chunk_token_size: Optional[int]) -> List[str]:
+
+def chunk_documents(
+    documents: List[Document], chunk_token_size: Optional[int], content_ids: bool = False
+) -> Tuple[Dict[str, List[DocumentChunk]], List[DocumentChunk]]:
     """
-    Split a text into chunks of ~CHUNK_SIZE tokens, based on punctuation and newline boundaries.
+    Split a list of documents into chunks without embedding them.
 
     Args:
-        text: The text to split into chunks.
+        documents: The list of documents to convert.
         chunk_token_size: The target size of each chunk in tokens, or None to use the default CHUNK_SIZE.
+        content_ids: Whether to give chunks content hash ids, see create_document_chunks.
 
     Returns:
-        A list of text chunks, each of which is a string of ~CHUNK_SIZE tokens.
+        A tuple of (chunks, all_chunks), where chunks maps each document id to its list of document chunks
+        and all_chunks is the flat list of every chunk in document order.
     """
-    # Return an empty list if the text is empty or whitespace
-    if not text or text.isspace():
-        return []
-
-    # Tokenize the text
-    tokens = tokenizer.encode(text, disallowed_special=())
-
-    # Initialize an empty list of chunks
-    chunks = []
-
-    # Use the provided chunk token size or the default one
-    chunk_size = chunk_token_size or CHUNK_SIZE
-
-    # Initialize a counter for the number of chunks
-    num_chunks = 0
-
-    # Loop until all tokens are consumed
-    while tokens and num_chunks < MAX_NUM_CHUNKS:
-        # Take the first chunk_size tokens as a chunk
-        chunk = tokens[:chunk_size]
-
-        # Decode the chunk into text
-        chunk_text = tokenizer.decode(chunk)
-
-        # Skip the chunk if it is empty or whitespace
-        if not chunk_text or chunk_text.isspace():
-            # Remove the tokens corresponding to the chunk text from the remaining tokens
-            tokens = tokens[len(chunk) :]
-            # Continue to the next iteration of the loop
-            continue
-
-        # Find the last period or punctuation mark in the chunk
-        last_punctuation = max(
-            chunk_text.rfind("."),
-            chunk_text.rfind("?"),
-            chunk_text.rfind("!"),
-            chunk_text.rfind("\n"),
-        )
-
-        # If there is a punctuation mark, and the last punctuation index is before MIN_CHUNK_SIZE_CHARS
-        if last_punctuation != -1 and last_punctuation > MIN_CHUNK_SIZE_CHARS:
-            # Truncate the chunk text at the punctuation mark
-            chunk_text = chunk_text[: last_punctuation + 1]
-
-        # Remove any newline characters and strip any leading or trailing whitespace
-        chunk_text_to_append = chunk_text.replace("\n", " ").strip()
+    # Initialize an empty dictionary of lists of chunks
+    chunks: Dict[str, List[DocumentChunk]] = {}
 
-        if len(chunk_text_to_append) > MIN_CHUNK_LENGTH_TO_EMBED:
-            # Append the chunk text to the list of chunks
-            chunks.append(chunk_text_to_append)
+    # Initialize an empty list of all chunks
+    all_chunks: List[DocumentChunk] = []
 
-        # Remove the tokens corresponding to the chunk text from the remaining tokens
-        tokens = tokens[len(tokenizer.encode(chunk_text, disallowed_special=())) :]
+    if _use_chunk_workers(documents):
+        # Assign missing document ids up front so ids do not depend on which process chunks a document
+        documents = [doc if doc.id else doc.copy(update={"id": str(uuid.uuid4())}) for doc in documents]
+        # map keeps the input order, so chunk order and ids match chunking in-process
+        results = _get_chunk_executor().map(
+            create_document_chunks,
+            documents,
+            repeat(chunk_token_size),
+            repeat(content_ids),
+            chunksize=max(1, len(documents) // (CHUNK_WORKERS * 4)),
+        )
+    else:
+        results = (create_document_chunks(doc, chunk_token_size, content_ids) for doc in documents)
 
-        # Increment the number of chunks
-        num_chunks += 1
+    # Loop over each document's chunks
+    for doc_chunks, doc_id in results:
+        # Append the chunks for this document to the list of all chunks
+        all_chunks.extend(doc_chunks)
 
-    # Handle the remaining tokens
-    if tokens:
-        remaining_text = tokenizer.decode(tokens).replace("\n", " ").strip()
-        if len(remaining_text) > MIN_CHUNK_LENGTH_TO_EMBED:
-            chunks.append(remaining_text)
+        # Add the list of chunks for this document to the dictionary with the document id as the key
+        chunks[doc_id] = doc_chunks
 
-    return chunks
+    return chunks, all_chunks
 
 
-def create_document_chunks(
-    doc: Document, chunk_token_size: Optional[int]
-) -> Tuple[List[DocumentChunk], str]:
+def get_document_chunks(
+    documents: List[Document], chunk_token_size: Optional[int]
+) -> Dict[str, List[DocumentChunk]]:
     """
-    Create a list of document chunks from a document object and return the document id.
+    Convert a list of documents into a dictionary from document id to list of document chunks.
 
     Args:
-        doc: The document object to create chunks from. It should have a text attribute and optionally an id and a metadata attribute.
+        documents: The list of documents to convert.
         chunk_token_size: The target size of each chunk in tokens, or None to use the default CHUNK_SIZE.
 
     Returns:
-        A tuple of (doc_chunks, doc_id), where doc_chunks is a list of document chunks, each of which is a DocumentChunk object with an id, a document_id, a text, and a metadata attribute,
-        and doc_id is the id of the document object, generated if not provided. The id of each chunk is generated from the document id and a sequential number, and the metadata is copied from the document object.
+        A dictionary mapping each document id to a list of document chunks, each of which is a DocumentChunk object
+        with text, metadata, and embedding attributes.
     """
-    # Check if the document text is empty or whitespace
-    if not doc.text or doc.text.isspace():
-        return [], doc.id or str(uuid.uuid4())
+    chunks, all_chunks = chunk_documents(documents, chunk_token_size)
 
-    # Generate a document id if not provided
-    doc_id = doc.id or str(uuid.uuid4())
+    # Check if there are no chunks
+    if not all_chunks:
+        return {}
+
+    # Get the embeddings for the document chunks in batches, using get_embeddings
+    for i in range(0, len(all_chunks), EMBEDDINGS_BATCH_SIZE):
+        batch_chunks = all_chunks[i : i + EMBEDDINGS_BATCH_SIZE]
 
-    # Split the document text into chunks
-    text_chunks = get_text_chunks(doc.text, chunk_token_size)
+        # Get the embeddings for the batch texts as a float32 array
+        batch_embeddings = get_embeddings([chunk.text for chunk in batch_chunks])
 
-    metadata = (
-        DocumentChunkMetadata(**doc.metadata.__dict__)
-        if doc.metadata is not None
-        else DocumentChunkMetadata()
+        # Give each chunk its row of the batch array
+        for chunk, embedding in zip(batch_chunks, batch_embeddings):
+            chunk.embedding = embedding
+
+    return chunks
+
+
+def _use_chunk_workers(documents: List[Document]) -> bool:
+    return (
+        CHUNK_WORKERS > 1
+        and len(documents) > 1
+        and sum(len(doc.text) for doc in documents) >= CHUNK_PARALLEL_MIN_CHARS
     )
 
-    metadata.document_id = doc_id
 
-    # Initialize an empty list of chunks for this document
-    doc_chunks = []
+def _get_chunk_executor() -> ProcessPoolExecutor:
+    global _chunk_executor
 
-    # Assign each chunk a sequential number and create a DocumentChunk object
-    for i, text_chunk in enumerate(text_chunks):
-        chunk_id = f"{doc_id}_{i}"
-        doc_chunk = DocumentChunk(
-            id=chunk_id,
-            text=text_chunk,
-            metadata=metadata,
-        )
-        # Append the chunk object to the list of chunks for this document
-        doc_chunks.append(doc_chunk)
+    with _chunk_executor_lock:
+        if _chunk_executor is None:
+            logger.info(f"Starting {CHUNK_WORKERS} document chunking processes")
+            # The server runs many threads (event loop, encode pools, tokenizers, torch) whose locks a forked
+            # child could inherit while held, so workers are spawned as fresh interpreters
+            _chunk_executor = ProcessPoolExecutor(
+                max_workers=CHUNK_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _chunk_executor
 
-    # Return the list of chunks and the document id
-    return doc_chunks, doc_id
 
+def start_chunk_workers():
+    """
+    Start the document chunking processes ahead of the first large upsert, if CHUNK_WORKERS is above 1.
 
-def get_document_chunks(
-    documents: List[Document], chunk_token_size: Optional[int]
-) -> Dict[str, List[DocumentChunk]]:
+    The pool is opt-in (CHUNK_WORKERS defaults to 0). Spawned workers only import services.chunker, not the
+    embedding stack, but that still takes a moment, so when enabled they are started with the server rather than
+    on the request path. It does not wait for the workers to be ready.
     """
-    Convert a list of documents into a dictionary from document id to list of document chunks.
+    if CHUNK_WORKERS > 1:
+        executor = _get_chunk_executor()
+        for _ in range(CHUNK_WORKERS):
+            executor.submit(warm_up_chunk_worker)
 
-    Args:
-        documents: The list of documents to convert.
-        chunk_token_size: The target size of each chunk in tokens, or None to use the default CHUNK_SIZE.
 
-    Returns:
-        A dictionary mapping each document id to a list of document chunks, each of which is a DocumentChunk object
-        with text, metadata, and embedding attributes.
+def shutdown_chunk_workers():
     """
-    # Initialize an empty dictionary of lists of chunks
-    chunks: Dict[str, List[DocumentChunk]] = {}
-
-    # Initialize an empty list of all chunks
-    all_chunks: List[DocumentChunk] = []
+    Stop the document chunking processes, if any were started.
+    """
+    global _chunk_executor
 
-    # Loop over each document and create chunks
-    for doc in documents:
-        doc_chunks, doc_id = create_document_chunks(doc, chunk_token_size)
+    with _chunk_executor_lock:
+        if _chunk_executor is not None:
+            _chunk_executor.shutdown(wait=False, cancel_futures=True)
+            _chunk_executor = None
 
-        # Append the chunks for this document to the list of all chunks
-        all_chunks.extend(doc_chunks)
 
-        # Add the list of chunks for this document to the dictionary with the document id as the key
-        chunks[doc_id] = doc_chunks
+async def get_document_chunks_async(
+    documents: List[Document], chunk_token_size: Optional[int]
+) -> Dict[str, List[DocumentChunk]]:
+    """
+    Awaitable variant of get_document_chunks for the request path. Chunking runs in a worker thread and
+    all chunk texts are handed to get_embeddings_async at once, which batches them for the embedding backend,
+    so the event loop is never blocked.
+    """
+    chunks, all_chunks = await asyncio.to_thread(chunk_documents, documents, chunk_token_size)
 
     # Check if there are no chunks
     if not all_chunks:
         return {}
 
-    # Get all the embeddings for the document chunks in batches, using get_embeddings
-    embeddings: List[List[float]] = []
-    for i in range(0, len(all_chunks), EMBEDDINGS_BATCH_SIZE):
-        # Get the text of the chunks in the current batch
-        batch_texts = [
-            chunk.text for chunk in all_chunks[i : i + EMBEDDINGS_BATCH_SIZE]
-        ]
+    await embed_chunks(all_chunks)
+
+    return chunks
 
-        # Get the embeddings for the batch texts
-        batch_embeddings = get_embeddings(batch_texts)
 
-        # Append the batch embeddings to the embeddings list
-        embeddings.extend(batch_embeddings)
+async def embed_chunks(chunks: List[DocumentChunk]):
+    """
+    Embed a list of document chunks in one get_embeddings_async call and set each chunk's embedding.
+    """
+    if not chunks:
+        return
 
-    # Update the document chunk objects with the embeddings
-    for i, chunk in enumerate(all_chunks):
-        # Assign the embedding from the embeddings list to the chunk object
-        chunk.embedding = embeddings[i]
+    embeddings = await get_embeddings_async([chunk.text for chunk in chunks])
 
-    return chunks
+    for chunk, embedding in zip(chunks, embeddings):
+        chunk.embedding = embedding
+
+
+async def iter_document_chunk_windows(
+    documents: List[Document], chunk_token_size: Optional[int], window_size: int
+) -> AsyncIterator[Dict[str, List[DocumentChunk]]]:
+    """
+    Chunk documents one at a time and yield their chunks in windows of up to window_size chunks.
+
+    Only the current document and window are held in memory. A document with more chunks than fit in the
+    remaining window is split across windows, in order. Documents without chunks are reported with an empty
+    list in the window that follows them so callers still see their ids.
+
+    Args:
+        documents: The list of documents to chunk.
+        chunk_token_size: The target size of each chunk in tokens, or None to use the default CHUNK_SIZE.
+        window_size: The maximum number of chunks per window.
+
+    Yields:
+        Dictionaries mapping document ids to the (not yet embedded) chunks of that document in the window.
+    """
+    window: Dict[str, List[DocumentChunk]] = {}
+    window_count = 0
+
+    for doc in documents:
+        doc_chunks, doc_id = await asyncio.to_thread(create_document_chunks, doc, chunk_token_size)
+        window.setdefault(doc_id, [])
+
+        while doc_chunks:
+            take = window_size - window_count
+            window[doc_id].extend(doc_chunks[:take])
+            window_count += len(doc_chunks[:take])
+            doc_chunks = doc_chunks[take:]
+
+            if window_count >= window_size:
+                yield window
+                window = {doc_id: []} if doc_chunks else {}
+                window_count = 0
+
+    if window:
+        yield window
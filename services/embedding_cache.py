@@ -0,0 +1,151 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import os
+import sqlite3
+import threading
+
+import numpy as np
+from loguru import logger
+
+SQLITE_MAX_VARIABLES = 500  # Keep IN (...) lookups well below SQLite's host parameter limit
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def pack_embedding(embedding: np.ndarray) -> bytes:
+    return np.asarray(embedding, dtype=np.float32).tobytes()
+
+
+def unpack_embedding(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache keyed by (model name, sha256 of text).
+
+    Lookups go to an in-memory LRU tier first and then to an optional SQLite tier that
+    survives restarts. Vectors are held as float32 arrays and stored on disk as packed float32 blobs.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_memory_items: int = 50000):
+        self.max_memory_items = max_memory_items
+        self._memory: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, text_hash)) WITHOUT ROWID"
+            )
+            self._db.commit()
+            logger.info(f"Embedding cache persisted at {path}")
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Return the cached embedding for each text, or None where the text is not cached.
+        """
+        hashes = [text_hash(text) for text in texts]
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        disk_lookups: Dict[str, List[int]] = {}
+
+        with self._lock:
+            for i, h in enumerate(hashes):
+                embedding = self._memory.get((model, h))
+                if embedding is not None:
+                    self._memory.move_to_end((model, h))
+                    results[i] = embedding
+                    self.memory_hits += 1
+                else:
+                    disk_lookups.setdefault(h, []).append(i)
+
+            if disk_lookups and self._db is not None:
+                for h, embedding in self._select(model, list(disk_lookups.keys())):
+                    self._remember(model, h, embedding)
+                    for i in disk_lookups.pop(h):
+                        results[i] = embedding
+                        self.disk_hits += 1
+
+            self.misses += sum(len(indexes) for indexes in disk_lookups.values())
+
+        return results
+
+    def put_many(self, model: str, texts: List[str], embeddings: np.ndarray):
+        rows = []
+        with self._lock:
+            for text, embedding in zip(texts, embeddings):
+                h = text_hash(text)
+                # Copy the row so the cache does not keep the whole batch array alive
+                embedding = np.array(embedding, dtype=np.float32)
+                self._remember(model, h, embedding)
+                rows.append((model, h, pack_embedding(embedding)))
+
+            if self._db is not None and rows:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                    rows,
+                )
+                self._db.commit()
+
+    def _select(self, model: str, hashes: List[str]):
+        for i in range(0, len(hashes), SQLITE_MAX_VARIABLES):
+            batch = hashes[i : i + SQLITE_MAX_VARIABLES]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._db.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                [model, *batch],
+            )
+            for h, blob in rows:
+                yield h, unpack_embedding(blob)
+
+    def _remember(self, model: str, h: str, embedding: np.ndarray):
+        self._memory[(model, h)] = embedding
+        self._memory.move_to_end((model, h))
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_items": len(self._memory),
+        }
+
+
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Return the process-wide embedding cache, created on first use from the environment, or None if disabled.
+    """
+    global _embedding_cache
+
+    if os.environ.get("EMBEDDING_CACHE_ENABLED", "true").lower() != "true":
+        return None
+
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache(
+                path=os.environ.get("EMBEDDING_CACHE_PATH"),  # None keeps the cache in memory only
+                max_memory_items=int(os.environ.get("EMBEDDING_CACHE_MEMORY_ITEMS", 50000)),
+            )
+        return _embedding_cache
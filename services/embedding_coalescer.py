@@ -0,0 +1,85 @@
+from typing import Awaitable, Callable, Dict, List, Set, Tuple
+import asyncio
+
+import numpy as np
+from loguru import logger
+
+EmbedFunction = Callable[[List[str], str], Awaitable[np.ndarray]]
+
+
+class EmbeddingCoalescer:
+    """
+    Coalesces texts from concurrent callers into a single batched embedding call.
+
+    Texts for the same model that arrive within window_ms of the first pending text, or until
+    max_batch_size texts are pending, are embedded together and the results are fanned back
+    out to each waiting caller in order.
+    """
+
+    def __init__(self, embed: EmbedFunction, window_ms: float = 2, max_batch_size: int = 64):
+        self._embed = embed
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._pending: Dict[str, List[Tuple[List[str], asyncio.Future]]] = {}
+        self._pending_counts: Dict[str, int] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        # The event loop only keeps weak references to tasks, so running batches are held here until done
+        self._tasks: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.requests = 0
+
+    async def embed(self, texts: List[str], embedding_model: str) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.requests += 1
+
+        self._pending.setdefault(embedding_model, []).append((texts, future))
+        self._pending_counts[embedding_model] = self._pending_counts.get(embedding_model, 0) + len(texts)
+
+        if self._pending_counts[embedding_model] >= self.max_batch_size:
+            self._flush(embedding_model)
+        elif embedding_model not in self._timers:
+            self._timers[embedding_model] = loop.call_later(self.window, self._flush, embedding_model)
+
+        return await future
+
+    def _flush(self, embedding_model: str):
+        timer = self._timers.pop(embedding_model, None)
+        if timer is not None:
+            timer.cancel()
+
+        pending = self._pending.pop(embedding_model, [])
+        self._pending_counts.pop(embedding_model, None)
+        if pending:
+            task = asyncio.ensure_future(self._run_batch(embedding_model, pending))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, embedding_model: str, pending: List[Tuple[List[str], asyncio.Future]]):
+        texts = [text for caller_texts, _ in pending for text in caller_texts]
+        self.batches += 1
+        logger.debug(f"Embedding coalesced batch of {len(texts)} texts from {len(pending)} callers")
+
+        try:
+            embeddings = await self._embed(texts, embedding_model)
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        offset = 0
+        for caller_texts, future in pending:
+            if not future.done():
+                future.set_result(embeddings[offset : offset + len(caller_texts)])
+            offset += len(caller_texts)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_callers_per_batch": self.requests / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,80 @@
+from typing import Dict, NamedTuple, Optional
+import threading
+
+import numpy as np
+from loguru import logger
+
+from services.embeddings import get_embedding_model_name
+from services.sbert import get_model
+
+
+class EmbeddingModelInfo(NamedTuple):
+    """
+    What a datastore needs to know about an embedding model to create its collection or index.
+    """
+
+    dimension: int
+    normalized: bool  # Whether the model returns unit-length vectors
+    metric: str  # Preferred similarity metric: "cosine", "dot" or "l2"
+
+
+# Models whose metadata is known without loading them
+KNOWN_EMBEDDING_MODELS: Dict[str, EmbeddingModelInfo] = {
+    "text-embedding-ada-002": EmbeddingModelInfo(1536, True, "cosine"),
+    "all-MiniLM-L6-v2": EmbeddingModelInfo(384, True, "cosine"),
+    "all-MiniLM-L12-v2": EmbeddingModelInfo(384, True, "cosine"),
+    "all-mpnet-base-v2": EmbeddingModelInfo(768, True, "cosine"),
+    "all-distilroberta-v1": EmbeddingModelInfo(768, True, "cosine"),
+    "multi-qa-MiniLM-L6-cos-v1": EmbeddingModelInfo(384, True, "cosine"),
+    "multi-qa-mpnet-base-cos-v1": EmbeddingModelInfo(768, True, "cosine"),
+    "multi-qa-mpnet-base-dot-v1": EmbeddingModelInfo(768, False, "dot"),
+    "paraphrase-MiniLM-L6-v2": EmbeddingModelInfo(384, False, "cosine"),
+    "paraphrase-multilingual-MiniLM-L12-v2": EmbeddingModelInfo(384, False, "cosine"),
+    "paraphrase-multilingual-mpnet-base-v2": EmbeddingModelInfo(768, False, "cosine"),
+}
+
+_probed_models: Dict[str, EmbeddingModelInfo] = {}
+_probe_lock = threading.Lock()
+
+
+def get_embedding_model_info(embedding_model: Optional[str] = None) -> EmbeddingModelInfo:
+    """
+    Return the dimension, normalization and preferred metric of an embedding model.
+
+    Known models are looked up in KNOWN_EMBEDDING_MODELS. Any other sentence-transformer model is loaded
+    once through the SBERT model registry and probed, and the result is remembered for the process.
+
+    Args:
+        embedding_model: The model name, or None for the configured EMBEDDING_MODEL.
+
+    Returns:
+        The EmbeddingModelInfo of the model.
+    """
+    embedding_model = get_embedding_model_name(embedding_model)
+    # Hugging Face names may carry the organization, e.g. "sentence-transformers/all-MiniLM-L6-v2"
+    known = KNOWN_EMBEDDING_MODELS.get(embedding_model) or KNOWN_EMBEDDING_MODELS.get(
+        embedding_model.split("/")[-1]
+    )
+    if known is not None:
+        return known
+
+    with _probe_lock:
+        if embedding_model not in _probed_models:
+            _probed_models[embedding_model] = _probe_sbert_model(embedding_model)
+        return _probed_models[embedding_model]
+
+
+def get_embedding_dimension(embedding_model: Optional[str] = None) -> int:
+    """
+    Return the vector dimension of an embedding model, or of the configured EMBEDDING_MODEL if None.
+    """
+    return get_embedding_model_info(embedding_model).dimension
+
+
+def _probe_sbert_model(embedding_model: str) -> EmbeddingModelInfo:
+    # Encode a probe text rather than inspecting modules so every SBERT backend is handled alike
+    embedding = get_model(embedding_model).encode(["dimension probe"], show_progress_bar=False)[0]
+    normalized = bool(abs(np.linalg.norm(embedding) - 1) < 1e-3)
+    info = EmbeddingModelInfo(len(embedding), normalized, "cosine")
+    logger.info(f"Probed embedding model '{embedding_model}': {info}")
+    return info
@@ -1,13 +1,174 @@
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+import asyncio
 import os
+import numpy as np
+from loguru import logger
+from services.embedding_cache import get_embedding_cache
+from services.embedding_coalescer import EmbeddingCoalescer
 from services.openai import get_embeddings as openai_get_embeddings
-from services.sbert import get_embeddings as sbert_get_embeddings
+from services.openai_batcher import openai_batcher
+from services.sbert import (
+    SBERT_BACKEND,
+    get_embeddings as sbert_get_embeddings,
+    preload_model as sbert_preload_model,
+    shutdown_encode_pool,
+)
 
-def get_embeddings(texts: List[str], embedding_model: str = None) -> List[List[float]]:
-    
-    embedding_model = embedding_model or os.environ.get("EMBEDDING_MODEL") or "text-embedding-ada-002"
+EMBEDDING_WORKERS = int(os.environ.get("EMBEDDING_WORKERS", 4))  # Size of the thread pool running blocking embedding calls
+EMBEDDING_COALESCE_WINDOW_MS = float(os.environ.get("EMBEDDING_COALESCE_WINDOW_MS", 2))  # 0 disables query coalescing
+EMBEDDING_COALESCE_MAX_BATCH = int(os.environ.get("EMBEDDING_COALESCE_MAX_BATCH", 64))
 
+# SBERT encodes and OpenAI HTTP calls release the GIL, so a bounded thread pool lets concurrent requests overlap
+embedding_executor = ThreadPoolExecutor(max_workers=EMBEDDING_WORKERS, thread_name_prefix="embedding")
+
+
+def get_embedding_model_name(embedding_model: str = None) -> str:
+    """
+    Resolve the embedding model to use, falling back to EMBEDDING_MODEL and then OpenAI's ada model.
+    """
+    return embedding_model or os.environ.get("EMBEDDING_MODEL") or "text-embedding-ada-002"
+
+
+def get_cache_model_key(embedding_model: str) -> str:
+    """
+    Return the model part of embedding cache keys. SBERT models include the backend, since the persisted cache
+    must not serve vectors of one backend or quantization to another.
+    """
+    if embedding_model == "text-embedding-ada-002":
+        return embedding_model
+    return f"{embedding_model}@{SBERT_BACKEND}"
+
+
+def get_embeddings(texts: List[str], embedding_model: str = None) -> np.ndarray:
+    """
+    Embed texts with the given or configured model, only sending texts missing from the embedding cache to the model.
+
+    Returns a float32 array of shape (len(texts), dimension).
+    """
+    embedding_model = get_embedding_model_name(embedding_model)
+
+    cache = get_embedding_cache()
+    if cache is None:
+        return _get_model_embeddings(texts, embedding_model)
+
+    cache_key = get_cache_model_key(embedding_model)
+    embeddings = cache.get_many(cache_key, texts)
+
+    missing_texts = _get_missing_texts(texts, embeddings)
+    if missing_texts:
+        new_embeddings = _get_model_embeddings(missing_texts, embedding_model)
+        cache.put_many(cache_key, missing_texts, new_embeddings)
+        return _fill_missing(texts, embeddings, missing_texts, new_embeddings)
+
+    return _stack(embeddings)
+
+
+async def get_embeddings_async(texts: List[str], embedding_model: str = None) -> np.ndarray:
+    """
+    Awaitable variant of get_embeddings that keeps the event loop free. SBERT encodes run on the embedding
+    thread pool, and OpenAI texts are packed into token-bounded requests sent concurrently by the batcher.
+    """
+    embedding_model = get_embedding_model_name(embedding_model)
+    loop = asyncio.get_running_loop()
+
+    if embedding_model != "text-embedding-ada-002":
+        return await loop.run_in_executor(embedding_executor, get_embeddings, texts, embedding_model)
+
+    cache = get_embedding_cache()
+    if cache is None:
+        return await openai_batcher.embed(texts)
+
+    cache_key = get_cache_model_key(embedding_model)
+    embeddings = await loop.run_in_executor(embedding_executor, cache.get_many, cache_key, texts)
+
+    missing_texts = _get_missing_texts(texts, embeddings)
+    if missing_texts:
+        new_embeddings = await openai_batcher.embed(missing_texts)
+        await loop.run_in_executor(embedding_executor, cache.put_many, cache_key, missing_texts, new_embeddings)
+        return _fill_missing(texts, embeddings, missing_texts, new_embeddings)
+
+    return _stack(embeddings)
+
+
+async def get_cached_embeddings_async(texts: List[str], embedding_model: str = None) -> List[Optional[np.ndarray]]:
+    """
+    Return the cached embedding of each text, or None where it is not cached or the cache is off. Nothing is embedded.
+    """
+    cache = get_embedding_cache()
+    if cache is None:
+        return [None] * len(texts)
+
+    cache_key = get_cache_model_key(get_embedding_model_name(embedding_model))
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(embedding_executor, cache.get_many, cache_key, texts)
+
+
+def _get_missing_texts(texts: List[str], embeddings: List[Optional[np.ndarray]]) -> List[str]:
+    # Embed each distinct missing text once
+    return list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+
+
+def _fill_missing(
+    texts: List[str],
+    embeddings: List[Optional[np.ndarray]],
+    missing_texts: List[str],
+    new_embeddings: np.ndarray,
+) -> np.ndarray:
+    # Write cached and new rows into one preallocated float32 array
+    rows = {text: i for i, text in enumerate(missing_texts)}
+    result = np.empty((len(texts), new_embeddings.shape[1]), dtype=np.float32)
+    for i, (text, embedding) in enumerate(zip(texts, embeddings)):
+        result[i] = new_embeddings[rows[text]] if embedding is None else embedding
+    return result
+
+
+def _stack(embeddings: List[np.ndarray]) -> np.ndarray:
+    if not embeddings:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.stack(embeddings).astype(np.float32, copy=False)
+
+
+query_coalescer = EmbeddingCoalescer(
+    get_embeddings_async,
+    window_ms=EMBEDDING_COALESCE_WINDOW_MS,
+    max_batch_size=EMBEDDING_COALESCE_MAX_BATCH,
+)
+
+
+async def get_query_embeddings_async(texts: List[str], embedding_model: str = None) -> np.ndarray:
+    """
+    Embed query texts, coalescing concurrent callers for the same model into one batched embedding call.
+    """
+    embedding_model = get_embedding_model_name(embedding_model)
+
+    if EMBEDDING_COALESCE_WINDOW_MS <= 0:
+        return await get_embeddings_async(texts, embedding_model)
+
+    return await query_coalescer.embed(texts, embedding_model)
+
+
+def _get_model_embeddings(texts: List[str], embedding_model: str) -> np.ndarray:
     if embedding_model == "text-embedding-ada-002":
         return openai_get_embeddings(texts)
     else:
         return sbert_get_embeddings(texts, embedding_model)
+
+
+def preload_embedding_model(embedding_model: str = None):
+    """
+    Load the configured local embedding model before serving requests. No-op for OpenAI models.
+    """
+    embedding_model = get_embedding_model_name(embedding_model)
+
+    if embedding_model != "text-embedding-ada-002":
+        logger.info(f"Preloading embedding model '{embedding_model}'")
+        sbert_preload_model(embedding_model)
+
+
+def shutdown_embedding_workers():
+    """
+    Release the embedding thread pool and any SBERT encoding processes.
+    """
+    shutdown_encode_pool()
+    embedding_executor.shutdown(wait=False)
@@ -0,0 +1,224 @@
+from typing import Dict, List, Optional, Tuple
+import os
+import re
+import sqlite3
+import threading
+
+from loguru import logger
+
+from models.models import DocumentChunk, DocumentChunkMetadata, DocumentChunkWithScore, DocumentMetadataFilter
+from services.date import to_unix_timestamp
+
+# Unit and property codes such as "B-204" or "LAKE_01" are kept as single tokens
+FTS_TOKENIZER = "unicode61 tokenchars '-_'"
+QUERY_TOKEN_PATTERN = re.compile(r"[\w-]+")
+MAX_QUERY_TOKENS = 64
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS chunk_rows (
+    rowid INTEGER PRIMARY KEY,
+    partition TEXT NOT NULL,
+    chunk_id TEXT NOT NULL,
+    document_id TEXT,
+    source TEXT,
+    source_id TEXT,
+    author TEXT,
+    created_at INTEGER,
+    property_ids TEXT,
+    metadata TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunk_rows_chunk_id ON chunk_rows (partition, chunk_id);
+CREATE INDEX IF NOT EXISTS chunk_rows_document_id ON chunk_rows (partition, document_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunk_text USING fts5(
+    text, content='chunk_rows', content_rowid='rowid', tokenize="{FTS_TOKENIZER}"
+);
+CREATE TRIGGER IF NOT EXISTS chunk_rows_insert AFTER INSERT ON chunk_rows BEGIN
+    INSERT INTO chunk_text (rowid, text) VALUES (new.rowid, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS chunk_rows_delete AFTER DELETE ON chunk_rows BEGIN
+    INSERT INTO chunk_text (chunk_text, rowid, text) VALUES ('delete', old.rowid, old.text);
+END;
+"""
+
+# SQLite limits the number of bound parameters per statement
+SQL_BATCH_SIZE = 500
+
+
+class LexicalIndex:
+    """
+    BM25 index over chunk text in a local SQLite FTS5 database, partitioned by source_id.
+
+    Chunk metadata is stored next to the text so lexical matches can be filtered like vector queries and
+    returned as DocumentChunkWithScore without a round trip to the datastore. The index only knows the chunks
+    upserted while it was enabled.
+    """
+
+    def __init__(self, path: str):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def add(self, source_id: str, chunks: Dict[str, List[DocumentChunk]]):
+        """
+        Index the chunks of a source_id, replacing any indexed chunks with the same chunk ids.
+        """
+        rows = []
+        for doc_chunks in chunks.values():
+            for chunk in doc_chunks:
+                metadata = chunk.metadata
+                property_ids = (metadata.json_data or {}).get("property_ids") or []
+                rows.append(
+                    (
+                        source_id,
+                        chunk.id,
+                        metadata.document_id,
+                        metadata.source.value if metadata.source else None,
+                        metadata.source_id,
+                        metadata.author,
+                        to_unix_timestamp(metadata.created_at) if metadata.created_at else None,
+                        ",".join(str(int(i)) for i in property_ids),
+                        metadata.json(),
+                        chunk.text,
+                    )
+                )
+        if not rows:
+            return
+
+        with self._lock, self._conn:
+            self._delete_where("chunk_id", source_id, [row[1] for row in rows])
+            self._conn.executemany(
+                "INSERT INTO chunk_rows (partition, chunk_id, document_id, source, source_id, author, created_at, "
+                "property_ids, metadata, text) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def _delete_where(self, column: str, source_id: str, values: List[str]) -> int:
+        count = 0
+        for i in range(0, len(values), SQL_BATCH_SIZE):
+            batch = values[i : i + SQL_BATCH_SIZE]
+            count += self._conn.execute(
+                f"DELETE FROM chunk_rows WHERE partition = ? AND {column} IN ({','.join('?' * len(batch))})",
+                [source_id, *batch],
+            ).rowcount
+        return count
+
+    def delete_documents(self, source_id: str, document_ids: List[str]) -> int:
+        with self._lock, self._conn:
+            return self._delete_where("document_id", source_id, document_ids)
+
+    def delete_chunks(self, source_id: str, chunk_ids: List[str]) -> int:
+        with self._lock, self._conn:
+            return self._delete_where("chunk_id", source_id, chunk_ids)
+
+    def delete(
+        self,
+        source_id: str,
+        ids: Optional[List[str]] = None,
+        filter: Optional[DocumentMetadataFilter] = None,
+        delete_all: Optional[bool] = None,
+    ) -> int:
+        """
+        Remove chunks by document ids, by filter, or all of a source_id's chunks, like DataStore.delete.
+        """
+        with self._lock, self._conn:
+            if delete_all:
+                return self._conn.execute("DELETE FROM chunk_rows WHERE partition = ?", [source_id]).rowcount
+
+            count = self._delete_where("document_id", source_id, ids or [])
+            if filter is not None:
+                conditions, params = _filter_conditions(filter)
+                count += self._conn.execute(
+                    f"DELETE FROM chunk_rows WHERE {' AND '.join(['partition = ?', *conditions])}",
+                    [source_id, *params],
+                ).rowcount
+            return count
+
+    def search(
+        self, source_id: str, query: str, top_k: int, filter: Optional[DocumentMetadataFilter] = None
+    ) -> List[DocumentChunkWithScore]:
+        """
+        Return up to top_k chunks of a source_id matching any token of the query, best BM25 score first.
+
+        Scores are negated FTS5 bm25() values, so higher is better as for vector results.
+        """
+        tokens = [token.strip("-") for token in QUERY_TOKEN_PATTERN.findall(query)]
+        tokens = list(dict.fromkeys(token for token in tokens if token))[:MAX_QUERY_TOKENS]
+        if not tokens or top_k <= 0:
+            return []
+
+        # Quote every token so user text is never parsed as FTS5 query syntax
+        match = " OR ".join('"' + token.replace('"', '""') + '"' for token in tokens)
+        # The filter columns only exist in chunk_rows, so they need no table prefix
+        conditions, params = _filter_conditions(filter) if filter is not None else ([], [])
+        sql = (
+            "SELECT chunk_rows.chunk_id, chunk_rows.text, chunk_rows.metadata, bm25(chunk_text) AS bm25_score "
+            "FROM chunk_text JOIN chunk_rows ON chunk_rows.rowid = chunk_text.rowid "
+            f"WHERE {' AND '.join(['chunk_text MATCH ?', 'chunk_rows.partition = ?', *conditions])} "
+            "ORDER BY bm25_score LIMIT ?"
+        )
+        with self._lock:
+            rows = self._conn.execute(sql, [match, source_id, *params, top_k]).fetchall()
+
+        return [
+            DocumentChunkWithScore(
+                id=chunk_id,
+                text=text,
+                metadata=DocumentChunkMetadata.parse_raw(metadata),
+                score=-bm25_score,
+            )
+            for chunk_id, text, metadata, bm25_score in rows
+        ]
+
+
+def _filter_conditions(filter: DocumentMetadataFilter) -> Tuple[List[str], list]:
+    conditions = []
+    params = []
+    for field, value in filter.dict().items():
+        if value is None:
+            continue
+        if field == "property_ids":
+            # Match rows holding any of the property ids, an empty list does not filter
+            if len(value) > 0:
+                conditions.append(
+                    "(" + " OR ".join("(',' || property_ids || ',') LIKE ?" for _ in value) + ")"
+                )
+                params.extend(f"%,{int(i)},%" for i in value)
+        elif field == "start_date":
+            conditions.append("created_at >= ?")
+            params.append(to_unix_timestamp(value))
+        elif field == "end_date":
+            conditions.append("created_at <= ?")
+            params.append(to_unix_timestamp(value))
+        elif field == "source":
+            conditions.append("source = ?")
+            params.append(value.value)
+        else:
+            conditions.append(f"{field} = ?")
+            params.append(str(value))
+    return conditions, params
+
+
+_lexical_index: Optional[LexicalIndex] = None
+_lexical_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> Optional[LexicalIndex]:
+    """
+    Return the process-wide lexical index, opened on first use, or None if HYBRID_SEARCH_ENABLED is not "true".
+    """
+    global _lexical_index
+
+    if os.environ.get("HYBRID_SEARCH_ENABLED", "false").lower() != "true":
+        return None
+
+    with _lexical_index_lock:
+        if _lexical_index is None:
+            path = os.environ.get("LEXICAL_INDEX_PATH", ".cache/lexical_index.sqlite3")
+            _lexical_index = LexicalIndex(path)
+            logger.info(f"Opened lexical index at {path}")
+        return _lexical_index
@@ -0,0 +1,47 @@
+from typing import List
+
+import numpy as np
+
+
+def maximal_marginal_relevance(
+    query_embedding: np.ndarray, candidate_embeddings: np.ndarray, top_k: int, lambda_mult: float = 0.5
+) -> List[int]:
+    """
+    Select a relevant but diverse subset of candidates with maximal marginal relevance.
+
+    Each pick maximizes lambda_mult * sim(query, candidate) - (1 - lambda_mult) * max sim(candidate, picked),
+    with cosine similarities. The highest similarity of every candidate to the picks is kept in one vector and
+    updated with a single matrix-vector product per pick, so a selection costs O(top_k * n * dim).
+
+    Args:
+        query_embedding: The query vector, shape (dim,).
+        candidate_embeddings: The candidate vectors, shape (n, dim).
+        top_k: The number of candidates to select.
+        lambda_mult: The weight of relevance against diversity, from 0 (diversity only) to 1 (relevance only).
+
+    Returns:
+        The indices of up to top_k selected candidates, in selection order.
+    """
+    count = len(candidate_embeddings)
+    top_k = min(top_k, count)
+    if top_k <= 0:
+        return []
+
+    candidates = np.asarray(candidate_embeddings, dtype=np.float32)
+    candidates = candidates / np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = lambda_mult * (candidates @ query)
+    closest = np.full(count, -np.inf, dtype=np.float32)
+    selected: List[int] = []
+    # The first pick has nothing to differ from, so it is the most relevant candidate
+    scores = relevance.copy()
+    while True:
+        best = int(np.argmax(scores))
+        selected.append(best)
+        if len(selected) == top_k:
+            return selected
+        np.maximum(closest, candidates @ candidates[best], out=closest)
+        scores = relevance - (1 - lambda_mult) * closest
+        scores[selected] = -np.inf
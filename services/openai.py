@@ -1,4 +1,5 @@
 from typing import List
+import numpy as np
 import openai
 import os
 from loguru import logger
@@ -7,7 +8,7 @@ from tenacity import retry, wait_random_exponential, stop_after_attempt
 
 
 @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3))
-def get_embeddings(texts: List[str]) -> List[List[float]]:
+def get_embeddings(texts: List[str]) -> np.ndarray:
     """
     Embed texts using OpenAI's ada model.
 
@@ -15,7 +16,7 @@ def get_embeddings(texts: List[str]) -> List[List[float]]:
         texts: The list of texts to embed.
 
     Returns:
-        A list of embeddings, each of which is a list of floats.
+        A float32 array of shape (len(texts), dimension) with one embedding per text.
 
     Raises:
         Exception: If the OpenAI API call fails.
@@ -33,8 +34,38 @@ def get_embeddings(texts: List[str]) -> List[List[float]]:
     # Extract the embedding data from the response
     data = response["data"]  # type: ignore
 
-    # Return the embeddings as a list of lists of floats
-    return [result["embedding"] for result in data]
+    # Return the embeddings as a float32 array
+    return np.array([result["embedding"] for result in data], dtype=np.float32)
+
+
+async def get_embeddings_async(texts: List[str]) -> np.ndarray:
+    """
+    Embed texts using OpenAI's ada model without blocking the event loop.
+
+    Unlike get_embeddings this is not retried here: the embedding batcher retries each request itself so
+    every attempt goes through its rate limiter.
+
+    Args:
+        texts: The list of texts to embed.
+
+    Returns:
+        A float32 array of shape (len(texts), dimension) with one embedding per text.
+
+    Raises:
+        Exception: If the OpenAI API call fails.
+    """
+    # NOTE: Azure Open AI requires deployment id
+    deployment = os.environ.get("OPENAI_EMBEDDINGMODEL_DEPLOYMENTID")
+
+    response = {}
+    if deployment == None:
+        response = await openai.Embedding.acreate(input=texts, model="text-embedding-ada-002")
+    else:
+        response = await openai.Embedding.acreate(input=texts, deployment_id=deployment)
+
+    data = response["data"]  # type: ignore
+
+    return np.array([result["embedding"] for result in data], dtype=np.float32)
 
 
 @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3))
@@ -0,0 +1,153 @@
+from collections import deque
+from typing import List, Optional
+import asyncio
+import os
+import time
+
+import numpy as np
+import tiktoken
+from loguru import logger
+from tenacity import AsyncRetrying, wait_random_exponential, stop_after_attempt
+
+from services.openai import get_embeddings_async as openai_get_embeddings_async
+
+# Per-request limits of the embeddings endpoint
+OPENAI_EMBEDDING_MAX_TOKENS_PER_REQUEST = int(os.environ.get("OPENAI_EMBEDDING_MAX_TOKENS_PER_REQUEST", 100000))
+OPENAI_EMBEDDING_BATCH_SIZE = int(os.environ.get("OPENAI_EMBEDDING_BATCH_SIZE", 128))  # The maximum number of texts per request
+# Number of requests kept in flight at once
+OPENAI_EMBEDDING_CONCURRENCY = int(os.environ.get("OPENAI_EMBEDDING_CONCURRENCY", 4))
+# Account budgets, 0 disables the limit
+OPENAI_EMBEDDING_REQUESTS_PER_MINUTE = int(os.environ.get("OPENAI_EMBEDDING_REQUESTS_PER_MINUTE", 3000))
+OPENAI_EMBEDDING_TOKENS_PER_MINUTE = int(os.environ.get("OPENAI_EMBEDDING_TOKENS_PER_MINUTE", 1000000))
+
+tokenizer = tiktoken.get_encoding("cl100k_base")  # The encoding used by text-embedding-ada-002
+
+
+def pack_batches(token_counts: List[int], max_tokens: int, max_items: int) -> List[List[int]]:
+    """
+    Greedily pack texts, in order, into batches that stay within the per-request token and item limits.
+
+    Args:
+        token_counts: The number of tokens of each text.
+        max_tokens: The maximum total number of tokens per batch.
+        max_items: The maximum number of texts per batch.
+
+    Returns:
+        A list of batches, each of which is a list of indexes into token_counts. A text larger than
+        max_tokens is sent in a batch of its own.
+    """
+    batches: List[List[int]] = []
+    batch: List[int] = []
+    batch_tokens = 0
+
+    for i, count in enumerate(token_counts):
+        if batch and (batch_tokens + count > max_tokens or len(batch) >= max_items):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(i)
+        batch_tokens += count
+
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+class RateLimiter:
+    """
+    Sliding one-minute window limiter for requests per minute and tokens per minute.
+    """
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._events: deque = deque()  # (timestamp, tokens) of the requests sent in the last minute
+        self._tokens_in_window = 0
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self, tokens: int):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._events and now - self._events[0][0] >= 60:
+                    _, expired_tokens = self._events.popleft()
+                    self._tokens_in_window -= expired_tokens
+
+                requests_ok = not self.requests_per_minute or len(self._events) < self.requests_per_minute
+                # An oversized request is let through once the window is empty rather than waiting forever
+                tokens_ok = (
+                    not self.tokens_per_minute
+                    or not self._events
+                    or self._tokens_in_window + tokens <= self.tokens_per_minute
+                )
+                if requests_ok and tokens_ok:
+                    self._events.append((now, tokens))
+                    self._tokens_in_window += tokens
+                    return
+
+                wait = 60 - (now - self._events[0][0])
+                logger.info(f"OpenAI embedding rate limit reached, waiting {wait:.1f}s")
+                await asyncio.sleep(wait)
+
+
+class OpenAIEmbeddingBatcher:
+    """
+    Embeds large lists of texts with OpenAI by packing them into token-bounded requests and keeping
+    several requests in flight within the configured rate limits. Each request is retried on its own.
+    """
+
+    def __init__(
+        self,
+        max_tokens_per_request: int = OPENAI_EMBEDDING_MAX_TOKENS_PER_REQUEST,
+        max_items_per_request: int = OPENAI_EMBEDDING_BATCH_SIZE,
+        concurrency: int = OPENAI_EMBEDDING_CONCURRENCY,
+        requests_per_minute: int = OPENAI_EMBEDDING_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = OPENAI_EMBEDDING_TOKENS_PER_MINUTE,
+    ):
+        self.max_tokens_per_request = max_tokens_per_request
+        self.max_items_per_request = max_items_per_request
+        self.concurrency = concurrency
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        # Tokenizing a whole ingest takes a while, keep it off the event loop
+        token_counts = await asyncio.to_thread(_count_tokens, texts)
+        batches = pack_batches(token_counts, self.max_tokens_per_request, self.max_items_per_request)
+
+        async def _embed_batch(batch: List[int]) -> np.ndarray:
+            batch_tokens = sum(token_counts[i] for i in batch)
+            # Every attempt, retries included, takes a concurrency slot and counts against the rate limits
+            async for attempt in AsyncRetrying(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3)):
+                with attempt:
+                    async with self._semaphore:
+                        await self.rate_limiter.acquire(batch_tokens)
+                        start = time.perf_counter()
+                        embeddings = await openai_get_embeddings_async([texts[i] for i in batch])
+                        logger.debug(
+                            f"Embedded batch of {len(batch)} texts ({batch_tokens} tokens) in {time.perf_counter() - start:.2f}s"
+                        )
+                        return embeddings
+
+        results = await asyncio.gather(*[_embed_batch(batch) for batch in batches])
+
+        embeddings = np.empty((len(texts), results[0].shape[1]), dtype=np.float32)
+        for batch, batch_embeddings in zip(batches, results):
+            embeddings[batch] = batch_embeddings
+        return embeddings
+
+
+def _count_tokens(texts: List[str]) -> List[int]:
+    return [len(tokenizer.encode(text, disallowed_special=())) for text in texts]
+
+
+openai_batcher = OpenAIEmbeddingBatcher()
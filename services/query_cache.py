@@ -0,0 +1,124 @@
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import os
+import threading
+import time
+
+from loguru import logger
+
+from models.models import Query, QueryResult
+from services.embeddings import get_embedding_model_name
+
+
+class QueryResultCache:
+    """
+    In-process cache of query results with TTL and LRU bounds.
+
+    Entries are keyed by (source_id, embedding model, normalized query). Each source_id carries a generation
+    number that is part of the key, so invalidating a source is O(1): older entries can no longer be reached
+    and age out through the LRU and TTL bounds. A global epoch in the key does the same for all sources.
+    Cached QueryResult objects are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, max_items: int = 10000, ttl_seconds: float = 300):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple, Tuple[float, QueryResult]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def key(self, query: Query, embedding_model: Optional[str] = None) -> Tuple:
+        """
+        Return the cache key of a query embedded with embedding_model, or with the configured model if None.
+
+        The key carries the source's current generation, so a result computed while the source is being
+        written and put under a key taken before the write completes is never served afterwards.
+        """
+        # The source_id and embedding model are keyed on their own, the rest of the query as normalized JSON
+        normalized = query.json(exclude={"source_id", "embedding_model"}, exclude_none=True, sort_keys=True)
+        with self._lock:
+            generation = (self._epoch, self._generations.get(query.source_id, 0))
+        return (query.source_id, generation, get_embedding_model_name(embedding_model), normalized)
+
+    def get(self, key: Tuple) -> Optional[QueryResult]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Tuple, result: QueryResult):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, source_id: Optional[str] = None):
+        """
+        Drop the cached results of a source_id, or of every source if source_id is None.
+        """
+        with self._lock:
+            self.invalidations += 1
+            if source_id is None:
+                # Bump the epoch rather than resetting generations, so keys taken before the invalidation and
+                # put after it stay unreachable
+                self._epoch += 1
+                self._entries.clear()
+            else:
+                self._generations[source_id] = self._generations.get(source_id, 0) + 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "items": len(self._entries),
+        }
+
+
+_query_cache: Optional[QueryResultCache] = None
+_query_cache_lock = threading.Lock()
+
+
+def get_query_cache() -> Optional[QueryResultCache]:
+    """
+    Return the process-wide query result cache, created on first use from the environment, or None if disabled.
+    """
+    global _query_cache
+
+    if os.environ.get("QUERY_CACHE_ENABLED", "false").lower() != "true":
+        return None
+
+    with _query_cache_lock:
+        if _query_cache is None:
+            _query_cache = QueryResultCache(
+                max_items=int(os.environ.get("QUERY_CACHE_MAX_ITEMS", 10000)),
+                ttl_seconds=float(os.environ.get("QUERY_CACHE_TTL_SECONDS", 300)),
+            )
+            logger.info(
+                f"Query result cache enabled with {_query_cache.max_items} items "
+                f"and a {_query_cache.ttl_seconds:.0f}s TTL"
+            )
+        return _query_cache
+
+
+def invalidate_query_cache(source_id: Optional[str] = None):
+    """
+    Invalidate the cached query results of a source_id, or of every source if None. No-op when the cache is disabled.
+    """
+    cache = get_query_cache()
+    if cache is not None:
+        cache.invalidate(source_id)
@@ -0,0 +1,35 @@
+from typing import Dict, List
+
+from models.models import DocumentChunkWithScore
+
+
+def reciprocal_rank_fusion(
+    ranked_lists: List[List[DocumentChunkWithScore]], weights: List[float], top_k: int, k: int = 60
+) -> List[DocumentChunkWithScore]:
+    """
+    Merge ranked result lists with weighted reciprocal rank fusion.
+
+    Each chunk scores the sum over the lists it appears in of weight / (k + rank), with 1-based ranks, so
+    only positions matter and scores on different scales (cosine, BM25) can be combined.
+
+    Args:
+        ranked_lists: Result lists, each best first. Chunks are matched across lists by id.
+        weights: The weight of each list.
+        top_k: The number of fused results to return.
+        k: The rank offset. Larger values flatten the gap between top and lower ranks.
+
+    Returns:
+        Up to top_k chunks, best first, with their fused score. A chunk found in several lists keeps the
+        fields of the first list it appears in.
+    """
+    scores: Dict[str, float] = {}
+    chunks: Dict[str, DocumentChunkWithScore] = {}
+    for results, weight in zip(ranked_lists, weights):
+        if weight <= 0:
+            continue
+        for rank, chunk in enumerate(results, start=1):
+            scores[chunk.id] = scores.get(chunk.id, 0.0) + weight / (k + rank)
+            chunks.setdefault(chunk.id, chunk)
+
+    best = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [chunks[chunk_id].copy(update={"score": scores[chunk_id]}) for chunk_id in best]
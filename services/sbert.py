@@ -1,11 +1,338 @@
-from typing import List, Optional
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import atexit
+import os
+import threading
+import time
+import numpy as np
 from sentence_transformers import SentenceTransformer
 from loguru import logger
 
+from services.sbert_tokenizer import DEFAULT_SBERT_MODEL
+
 from tenacity import retry, wait_random_exponential, stop_after_attempt
 
+SBERT_MODEL_CACHE_MAX_MB = int(os.environ.get("SBERT_MODEL_CACHE_MAX_MB", 2048))  # 0 disables the memory cap
+SBERT_ENCODE_BATCH_SIZE = int(os.environ.get("SBERT_ENCODE_BATCH_SIZE", 32))  # Texts per length-homogeneous encode batch
+SBERT_POOL_WORKERS = int(os.environ.get("SBERT_POOL_WORKERS", 0))  # Encoding worker processes, 0 encodes in-process only
+SBERT_POOL_MIN_TEXTS = int(os.environ.get("SBERT_POOL_MIN_TEXTS", 256))  # Smaller requests, e.g. single-document upserts, skip the pool's IPC overhead
+# Inference backend: torch, torch-int8 (dynamic quantization), onnx or onnx-int8 (ONNX Runtime)
+SBERT_BACKEND = os.environ.get("SBERT_BACKEND", "torch").lower()
+SBERT_BACKENDS = ["torch", "torch-int8", "onnx", "onnx-int8"]
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded SentenceTransformer models keyed by model name.
+
+    Models are loaded once and kept in least-recently-used order. When the estimated
+    memory of the loaded models exceeds max_bytes, the least recently used models are
+    evicted (the most recently requested model is always kept).
+    """
+
+    def __init__(self, max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self._models: "OrderedDict[str, SentenceTransformer]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._load_seconds: Dict[str, float] = {}
+        self._loading: Dict[str, threading.Event] = {}  # Models being loaded, set once the load finishes
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, model_name: str, backend: str = "torch") -> SentenceTransformer:
+        key = model_name if backend == "torch" else f"{model_name} ({backend})"
+
+        # Models load outside the lock so a slow cold load does not block hits on other models. Concurrent
+        # requests for a model being loaded wait for that load, and retry it if it failed.
+        while True:
+            with self._lock:
+                model = self._models.get(key)
+                if model is not None:
+                    self._models.move_to_end(key)
+                    self.hits += 1
+                    return model
+
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    self.misses += 1
+                    break
+            loading.wait()
+
+        try:
+            start = time.perf_counter()
+            model = _load_model(model_name, backend)
+            elapsed = time.perf_counter() - start
+            size = _estimate_model_bytes(model)
+
+            with self._lock:
+                self._models[key] = model
+                self._sizes[key] = size
+                self._load_seconds[key] = elapsed
+                logger.info(f"Loaded SentenceTransformer '{key}' in {elapsed:.2f}s (~{size / 2**20:.0f} MB)")
+                self._evict()
+            return model
+        finally:
+            with self._lock:
+                self._loading.pop(key).set()
+
+    def _evict(self):
+        while (
+            self.max_bytes
+            and len(self._models) > 1
+            and sum(self._sizes.values()) > self.max_bytes
+        ):
+            model_name, _ = self._models.popitem(last=False)
+            self._sizes.pop(model_name, None)
+            self._load_seconds.pop(model_name, None)
+            self.evictions += 1
+            logger.info(f"Evicted SentenceTransformer '{model_name}' from model registry")
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self._sizes.clear()
+            self._load_seconds.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "models": list(self._models.keys()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "loaded_bytes": sum(self._sizes.values()),
+                "load_seconds": dict(self._load_seconds),
+            }
+
+
+def _load_model(model_name: str, backend: str):
+    if backend not in SBERT_BACKENDS:
+        raise ValueError(f"Unsupported SBERT backend: {backend}. Try one of the following: {', '.join(SBERT_BACKENDS)}")
+
+    model = SentenceTransformer(model_name, device="cpu" if backend != "torch" else None)
+
+    if backend == "torch-int8":
+        import torch
+
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif backend in ("onnx", "onnx-int8"):
+        from services.sbert_onnx import OnnxSentenceEncoder
+
+        return OnnxSentenceEncoder(model_name, model, quantize=backend == "onnx-int8")
+
+    return model
+
+
+def _estimate_model_bytes(model: SentenceTransformer) -> int:
+    if hasattr(model, "model_bytes"):
+        return model.model_bytes
+    # The state dict also covers the packed int8 weights of dynamically quantized layers
+    tensors = [t for t in model.state_dict().values() if hasattr(t, "element_size")]
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+model_registry = ModelRegistry(max_bytes=SBERT_MODEL_CACHE_MAX_MB * 2**20)
+
+
+def get_model(embedding_model: Optional[str] = None, backend: Optional[str] = None) -> SentenceTransformer:
+    """
+    Return the shared SentenceTransformer instance for a model name and backend, loading it on first use.
+    """
+    return model_registry.get(embedding_model or DEFAULT_SBERT_MODEL, backend or SBERT_BACKEND)
+
+
+def preload_model(embedding_model: Optional[str] = None):
+    """
+    Load a model into the registry ahead of the first request and run a warm-up encode.
+    """
+    model = get_model(embedding_model)
+    model.encode(["warm up"], show_progress_bar=False)
+
+
+class EncodeStats:
+    """
+    Cumulative throughput counters for SBERT encodes, in texts and characters.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.texts = 0
+        self.chars = 0
+        self.seconds = 0.0
+
+    def record(self, texts: int, chars: int, seconds: float):
+        with self._lock:
+            self.texts += texts
+            self.chars += chars
+            self.seconds += seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "texts": self.texts,
+                "chars": self.chars,
+                "seconds": self.seconds,
+                "chars_per_second": self.chars / self.seconds if self.seconds else 0.0,
+            }
+
+
+encode_stats = EncodeStats()
+
+
+def encode_length_sorted(
+    model: SentenceTransformer, texts: List[str], batch_size: int = SBERT_ENCODE_BATCH_SIZE
+) -> np.ndarray:
+    """
+    Encode texts in batches of similar length to minimize padding.
+
+    Texts are sorted by character length, encoded in sub-batches of batch_size, and written back in the
+    original order. Character length tracks token length closely enough to group texts, and sorting by it
+    avoids tokenizing every text a second time before model.encode does.
+
+    Args:
+        model: The SentenceTransformer to encode with.
+        texts: The list of texts to embed.
+        batch_size: The number of texts per encode batch.
+
+    Returns:
+        A float32 array of shape (len(texts), dimension) in the same order as texts.
+    """
+    if not texts:
+        return np.empty((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+    start = time.perf_counter()
+
+    lengths = _char_lengths(texts)
+    order = np.argsort(-lengths, kind="stable")
+
+    embeddings = np.empty((len(texts), model.get_sentence_embedding_dimension()), dtype=np.float32)
+    for i in range(0, len(texts), batch_size):
+        batch = order[i : i + batch_size]
+        embeddings[batch] = model.encode(
+            [texts[j] for j in batch],
+            batch_size=len(batch),
+            show_progress_bar=False,
+            convert_to_numpy=True,
+        )
+
+    elapsed = time.perf_counter() - start
+    chars = int(lengths.sum())
+    encode_stats.record(len(texts), chars, elapsed)
+    logger.debug(
+        f"Encoded {len(texts)} texts ({chars} characters) in {elapsed:.2f}s, {chars / elapsed:.0f} characters/s"
+    )
+    return embeddings
+
+
+def _char_lengths(texts: List[str]) -> np.ndarray:
+    return np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+
+
+class EncodePool:
+    """
+    Multi-process SBERT encoding pool for bulk ingestion, built on sentence-transformers' process pool.
+
+    One set of worker processes is started per model on first use and reused across requests until
+    shutdown. Requests are length-sorted before being split across workers so each worker encodes
+    length-homogeneous batches.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._pools: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def encode(self, model_name: str, model: SentenceTransformer, texts: List[str]) -> np.ndarray:
+        start = time.perf_counter()
+        lengths = _char_lengths(texts)
+        order = np.argsort(-lengths, kind="stable")
+
+        # The pool's input and output queues are shared, so only one request may use them at a time
+        with self._lock:
+            pool = self._pools.get(model_name)
+            if pool is None:
+                logger.info(f"Starting {self.workers} SBERT encoding processes for '{model_name}'")
+                pool = model.start_multi_process_pool(target_devices=["cpu"] * self.workers)
+                self._pools[model_name] = pool
+            sorted_embeddings = model.encode_multi_process(
+                [texts[i] for i in order], pool, batch_size=SBERT_ENCODE_BATCH_SIZE
+            )
+
+        embeddings = np.empty_like(sorted_embeddings, dtype=np.float32)
+        embeddings[order] = sorted_embeddings
+
+        elapsed = time.perf_counter() - start
+        chars = int(lengths.sum())
+        encode_stats.record(len(texts), chars, elapsed)
+        logger.info(
+            f"Encoded {len(texts)} texts ({chars} characters) on {self.workers} processes in {elapsed:.2f}s, "
+            f"{chars / elapsed:.0f} characters/s"
+        )
+        return embeddings
+
+    def shutdown(self):
+        with self._lock:
+            for model_name, pool in self._pools.items():
+                logger.info(f"Stopping SBERT encoding processes for '{model_name}'")
+                SentenceTransformer.stop_multi_process_pool(pool)
+            self._pools.clear()
+
+
+encode_pool = EncodePool(workers=SBERT_POOL_WORKERS)
+atexit.register(encode_pool.shutdown)
+
+
+def check_backend_parity(
+    texts: List[str],
+    embedding_model: Optional[str] = None,
+    backend: Optional[str] = None,
+    reference_backend: str = "torch",
+) -> dict:
+    """
+    Compare the embeddings of a backend against a reference backend on the same texts.
+
+    Args:
+        texts: The list of texts to embed with both backends.
+        embedding_model: The model to compare, or None for the default SBERT model.
+        backend: The backend to check, or None for the configured SBERT_BACKEND.
+        reference_backend: The backend whose embeddings are taken as ground truth.
+
+    Returns:
+        A dict with the minimum and mean cosine similarity between the two backends' embeddings of each
+        text, the maximum cosine drift (1 - minimum cosine), and each backend's encode time in seconds.
+    """
+    start = time.perf_counter()
+    reference = encode_length_sorted(get_model(embedding_model, reference_backend), texts)
+    reference_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    candidate = encode_length_sorted(get_model(embedding_model, backend), texts)
+    candidate_seconds = time.perf_counter() - start
+
+    cosine = (reference * candidate).sum(axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    )
+    return {
+        "min_cosine": float(cosine.min()),
+        "mean_cosine": float(cosine.mean()),
+        "max_drift": float(1 - cosine.min()),
+        "reference_seconds": reference_seconds,
+        "backend_seconds": candidate_seconds,
+    }
+
+
+def shutdown_encode_pool():
+    """
+    Stop the SBERT encoding worker processes, if any were started.
+    """
+    encode_pool.shutdown()
+
+
 @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3))
-def get_embeddings(texts: List[str], embedding_model: Optional[str]) -> List[List[float]]:
+def get_embeddings(texts: List[str], embedding_model: Optional[str]) -> np.ndarray:
     """
     Embed texts using sbert.
 
@@ -13,16 +340,15 @@ def get_embeddings(texts: List[str], embedding_model: Optional[str]) -> List[Lis
         texts: The list of texts to embed.
 
     Returns:
-        A list of embeddings, each of which is a list of floats.
+        A float32 array of shape (len(texts), dimension) with one embedding per text.
 
     Raises:
         Exception: If the error.
     """
-    if not embedding_model:
-        embedding_model = "all-MiniLM-L6-v2"
-    model = SentenceTransformer(embedding_model)
+    embedding_model = embedding_model or DEFAULT_SBERT_MODEL
+    model = get_model(embedding_model)
 
-    vector = model.encode(texts, show_progress_bar=False).tolist()
+    if encode_pool.workers > 0 and SBERT_BACKEND == "torch" and len(texts) >= SBERT_POOL_MIN_TEXTS:
+        return encode_pool.encode(embedding_model, model, texts)
 
-    # Return the embeddings as a list of lists of floats
-    return vector
+    return encode_length_sorted(model, texts)
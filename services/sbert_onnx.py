@@ -0,0 +1,141 @@
+from typing import List
+import inspect
+import os
+import re
+
+import numpy as np
+import torch
+from loguru import logger
+from sentence_transformers import SentenceTransformer, models
+
+SBERT_ONNX_CACHE_DIR = os.environ.get("SBERT_ONNX_CACHE_DIR", ".cache/onnx")  # Where exported models are kept
+
+
+class OnnxSentenceEncoder:
+    """
+    Runs a SentenceTransformer's transformer through ONNX Runtime on CPU, with optional int8 dynamic quantization.
+
+    The transformer is exported once to SBERT_ONNX_CACHE_DIR and reused on later starts. Pooling and
+    normalization follow the source model's modules. The encode signature mirrors SentenceTransformer.encode
+    so both can be used interchangeably by services.sbert.
+    """
+
+    def __init__(self, model_name: str, model: SentenceTransformer, quantize: bool = False):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError(
+                "The onnx SBERT backends require onnxruntime, install it with `pip install onnxruntime`"
+            )
+
+        self.model_name = model_name
+        self.tokenizer = model.tokenizer
+        self.max_seq_length = model.max_seq_length
+        self._dimension = model.get_sentence_embedding_dimension()
+        self._pooling, self._normalize = _get_pooling(model)
+
+        path = _export_path(model_name, quantize)
+        if not os.path.exists(path):
+            float_path = _export_path(model_name, False)
+            if not os.path.exists(float_path):
+                _export(model, float_path)
+            if quantize:
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+
+                quantize_dynamic(float_path, path, weight_type=QuantType.QInt8)
+            logger.info(f"Exported '{model_name}' to ONNX at {path}")
+
+        self.model_bytes = os.path.getsize(path)
+        self._session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self._session.get_inputs()}
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self._dimension
+
+    def encode(
+        self,
+        sentences: List[str],
+        batch_size: int = 32,
+        show_progress_bar: bool = False,
+        convert_to_numpy: bool = True,
+        **kwargs,
+    ) -> np.ndarray:
+        embeddings = np.empty((len(sentences), self._dimension), dtype=np.float32)
+
+        for i in range(0, len(sentences), batch_size):
+            features = self.tokenizer(
+                sentences[i : i + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            inputs = {name: value.astype(np.int64) for name, value in features.items() if name in self._input_names}
+            token_embeddings = self._session.run(None, inputs)[0]
+            embeddings[i : i + batch_size] = self._pool(token_embeddings, features["attention_mask"])
+
+        return embeddings
+
+    def _pool(self, token_embeddings: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        mask = attention_mask[..., np.newaxis].astype(np.float32)
+
+        if self._pooling == "cls":
+            pooled = token_embeddings[:, 0]
+        elif self._pooling == "max":
+            pooled = np.where(mask > 0, token_embeddings, -1e9).max(axis=1)
+        else:
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        if self._normalize:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+        return pooled
+
+
+def _get_pooling(model: SentenceTransformer):
+    pooling = "mean"
+    normalize = False
+
+    for module in model:
+        if isinstance(module, models.Pooling):
+            if module.pooling_mode_cls_token:
+                pooling = "cls"
+            elif module.pooling_mode_max_tokens:
+                pooling = "max"
+        elif isinstance(module, models.Normalize):
+            normalize = True
+        elif not isinstance(module, models.Transformer):
+            raise ValueError(
+                f"Module {type(module).__name__} is not supported by the onnx SBERT backends, use SBERT_BACKEND=torch"
+            )
+
+    return pooling, normalize
+
+
+def _export_path(model_name: str, quantize: bool) -> str:
+    name = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name.strip("/"))
+    return os.path.join(SBERT_ONNX_CACHE_DIR, f"{name}{'-int8' if quantize else ''}.onnx")
+
+
+def _export(model: SentenceTransformer, path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    transformer = model[0].auto_model
+    transformer.eval()
+    dummy = model.tokenizer(["warm up"], return_tensors="pt")
+    # Keep the positional order of the transformer's forward signature
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+    # Newer torch releases default to the dynamo exporter, which does not take dynamic_axes
+    export_kwargs = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(dummy[name] for name in input_names),
+            path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]},
+            opset_version=14,
+            **export_kwargs,
+        )
@@ -0,0 +1,57 @@
+from functools import lru_cache
+from typing import Any, Optional, Tuple
+import json
+import os
+
+DEFAULT_SBERT_MODEL = "all-MiniLM-L6-v2"
+
+
+@lru_cache(maxsize=8)
+def get_tokenizer(embedding_model: Optional[str] = None) -> Tuple[Any, int]:
+    """
+    Return the tokenizer of a sentence-transformer model and its max sequence length, without loading its weights.
+
+    The model is located like SentenceTransformer does, as a local directory or a Hugging Face Hub repository
+    with bare names under sentence-transformers/. The max sequence length is read from sentence_bert_config.json,
+    falling back to the tokenizer's and the transformer config's limits as sentence-transformers does.
+    """
+    from transformers import AutoConfig, AutoTokenizer
+
+    model_path = embedding_model or DEFAULT_SBERT_MODEL
+    if not os.path.isdir(model_path) and "/" not in model_path:
+        model_path = f"sentence-transformers/{model_path}"
+
+    # The transformer module may live in a subfolder of the model, such as 0_Transformer
+    subfolder = ""
+    for module in _read_model_json(model_path, "modules.json") or []:
+        if module["type"].endswith("Transformer"):
+            subfolder = module["path"]
+            break
+    if os.path.isdir(model_path):
+        model_path, subfolder = os.path.join(model_path, subfolder), ""
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path, subfolder=subfolder)
+    config = _read_model_json(model_path, os.path.join(subfolder, "sentence_bert_config.json")) or {}
+    max_seq_length = config.get("max_seq_length")
+    if max_seq_length is None:
+        transformer_config = AutoConfig.from_pretrained(model_path, subfolder=subfolder)
+        max_seq_length = min(
+            tokenizer.model_max_length, getattr(transformer_config, "max_position_embeddings", tokenizer.model_max_length)
+        )
+    return tokenizer, max_seq_length
+
+
+def _read_model_json(model_path: str, filename: str) -> Optional[Any]:
+    if os.path.isdir(model_path):
+        path = os.path.join(model_path, filename)
+    else:
+        from huggingface_hub import hf_hub_download
+
+        try:
+            path = hf_hub_download(model_path, filename)
+        except Exception:
+            return None
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,353 @@
+import threading
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+from tenacity import wait_none
+
+from datastore.providers import milvus_datastore
+from datastore.providers.milvus_datastore import (
+    CollectionHandle,
+    MilvusException,
+    MilvusDataStore,
+    _batch_rows,
+    _estimate_row_bytes,
+    _in_expressions,
+    _quote,
+)
+from models.models import DocumentChunk, DocumentChunkMetadata, DocumentMetadataFilter, QueryWithEmbedding
+
+SOURCE_ID = "test"
+DIM = 4
+
+
+@pytest.fixture
+def datastore(monkeypatch):
+    """A datastore that never connects, with a fixed dimension and metric instead of probing the embedding model."""
+    monkeypatch.setattr(milvus_datastore, "get_embedding_dimension", lambda: DIM)
+    monkeypatch.setattr(milvus_datastore, "get_metric_type", lambda: "IP")
+    return MilvusDataStore()
+
+
+@pytest.fixture
+def collection(datastore, monkeypatch):
+    """A mocked collection served for every source_id, recording the thread of each call."""
+    threads = []
+    col = MagicMock()
+
+    def record(result):
+        def call(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return result
+        return call
+
+    col.insert.side_effect = record(None)
+    col.delete.side_effect = record(SimpleNamespace(delete_count=1))
+    col.query.side_effect = record([{"id": "doc_0", "document_id": "doc"}])
+    col.threads = threads
+    monkeypatch.setattr(datastore, "_get_collection", lambda source_id: col)
+    monkeypatch.setattr(datastore, "_supports_expression_delete", lambda source_id: True)
+    return col
+
+
+def chunk(i: int, text: str = "text") -> DocumentChunk:
+    return DocumentChunk(
+        id=f"doc_{i}", text=text, metadata=DocumentChunkMetadata(document_id="doc"), embedding=[0.5] * DIM
+    )
+
+
+def test_batch_rows_row_limit():
+    rows = [["a"] for _ in range(5)]
+
+    assert [len(batch) for batch, _ in _batch_rows(rows, max_rows=2, max_bytes=1000)] == [2, 2, 1]
+
+
+def test_batch_rows_byte_limit():
+    rows = [["x" * 100, [0.0] * DIM] for _ in range(5)]
+    row_bytes = _estimate_row_bytes(rows[0])
+
+    batches = _batch_rows(rows, max_rows=100, max_bytes=2 * row_bytes + 1)
+
+    assert [len(batch) for batch, _ in batches] == [2, 2, 1]
+    assert [batch_bytes for _, batch_bytes in batches] == [2 * row_bytes, 2 * row_bytes, row_bytes]
+
+
+def test_batch_rows_oversized_row_gets_its_own_batch():
+    small, large = ["x" * 10], ["x" * 500]
+
+    batches = _batch_rows([small, large, small, small], max_rows=100, max_bytes=100)
+
+    assert [batch for batch, _ in batches] == [[small], [large], [small, small]]
+    assert batches[1][1] == 500
+    assert _batch_rows([], max_rows=10, max_bytes=100) == []
+
+
+def test_insert_batch_retry_deletes_partial_insert(datastore, collection, monkeypatch):
+    monkeypatch.setattr(milvus_datastore, "wait_random_exponential", lambda **kwargs: wait_none())
+    collection.insert.side_effect = [TimeoutError("deadline exceeded"), None]
+    rows = [datastore._get_values(chunk(i)) for i in range(2)]
+
+    datastore._insert_batch(SOURCE_ID, collection, rows, 0)
+
+    assert [call[0] for call in collection.method_calls] == ["insert", "delete", "insert"]
+    assert collection.delete.call_args.args == ('id in ["doc_0","doc_1"]',)
+    # Rows are sent column by column
+    assert collection.insert.call_args.args[0][4] == ["doc_0", "doc_1"]
+
+
+@pytest.mark.asyncio
+async def test_upsert_fails_after_every_attempt_failed(datastore, collection, monkeypatch):
+    monkeypatch.setattr(milvus_datastore, "wait_random_exponential", lambda **kwargs: wait_none())
+    collection.insert.side_effect = TimeoutError("deadline exceeded")
+
+    assert await datastore._upsert({"doc": [chunk(0)]}, SOURCE_ID) == []
+    assert collection.insert.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_upsert_batches_rows(datastore, collection, monkeypatch):
+    monkeypatch.setattr(milvus_datastore, "UPSERT_BATCH_SIZE", 2)
+
+    assert await datastore._upsert({"doc": [chunk(i) for i in range(5)]}, SOURCE_ID) == ["doc"]
+    assert sorted(len(call.args[0][0]) for call in collection.insert.call_args_list) == [1, 2, 2]
+
+
+@pytest.mark.asyncio
+async def test_deletes_and_lookups_run_on_the_insert_pool(datastore, collection):
+    await datastore._delete(SOURCE_ID, ids=["doc"])
+    await datastore._delete_documents(SOURCE_ID, ["doc"])
+    await datastore._delete_chunks(SOURCE_ID, ["doc_0"])
+    assert await datastore._get_chunk_ids(SOURCE_ID, ["doc"]) == {"doc": {"doc_0"}}
+
+    assert len(collection.threads) == 4
+    assert all(name.startswith("milvus-insert") for name in collection.threads)
+
+
+def test_quote_escapes_quotes_and_backslashes():
+    assert _quote("plain") == '"plain"'
+    assert _quote('say "hi"') == '"say \\"hi\\""'
+    assert _quote("C:\\path\\") == '"C:\\\\path\\\\"'
+    # The backslash is escaped before the quote, so an escaped quote in the value cannot end the string
+    assert _quote('\\"') == '"\\\\\\""'
+
+
+def test_in_expressions_split_at_length_bound():
+    values = [_quote(f"id{i}") for i in range(5)]  # 5 characters each, 6 with the separator
+
+    assert _in_expressions("id", values, 12) == ['id in ["id0","id1"]', 'id in ["id2","id3"]', 'id in ["id4"]']
+    assert _in_expressions("id", values, 1000) == ['id in ["id0","id1","id2","id3","id4"]']
+    assert _in_expressions("id", [], 12) == []
+
+
+def test_in_expressions_long_value_gets_its_own_expression():
+    long_value = _quote("x" * 50)
+
+    expressions = _in_expressions("id", ['"a"', long_value, '"b"'], 12)
+
+    assert expressions == ['id in ["a"]', f"id in [{long_value}]", 'id in ["b"]']
+
+
+@pytest.mark.parametrize(
+    "version, supported",
+    [("v2.3.3", True), ("2.4.0", True), ("v2.2.12", False), ("v1.9.0", False), ("unknown", False)],
+)
+def test_supports_expression_delete(datastore, monkeypatch, version, supported):
+    calls = []
+
+    def get_server_version(using):
+        calls.append(using)
+        return version
+
+    monkeypatch.setattr(milvus_datastore, "utility", SimpleNamespace(get_server_version=get_server_version))
+    datastore._handles[SOURCE_ID] = CollectionHandle(datastore._get_connection_info(SOURCE_ID), MagicMock())
+
+    assert datastore._supports_expression_delete(SOURCE_ID) is supported
+    assert datastore._supports_expression_delete(SOURCE_ID) is supported
+    # The answer is kept on the collection handle
+    assert len(calls) == 1
+
+
+def test_supports_expression_delete_when_version_unavailable(datastore, monkeypatch):
+    def get_server_version(using):
+        raise ConnectionError("unavailable")
+
+    monkeypatch.setattr(milvus_datastore, "utility", SimpleNamespace(get_server_version=get_server_version))
+
+    assert datastore._supports_expression_delete(SOURCE_ID) is False
+
+
+def test_delete_by_primary_keys_below_2_3(datastore, monkeypatch):
+    col = MagicMock()
+    col.query.return_value = [{"id": 'chunk "1"'}, {"id": "chunk 2"}]
+    col.delete.return_value = SimpleNamespace(delete_count=2)
+    monkeypatch.setattr(datastore, "_supports_expression_delete", lambda source_id: False)
+
+    assert datastore._delete_expression(SOURCE_ID, col, '(author == "a")') == 2
+    col.query.assert_called_once_with('(author == "a")', output_fields=["id"])
+    col.delete.assert_called_once_with('id in ["chunk \\"1\\"","chunk 2"]')
+
+
+def test_delete_by_expression_from_2_3(datastore, monkeypatch):
+    col = MagicMock()
+    col.delete.return_value = SimpleNamespace(delete_count=3)
+    monkeypatch.setattr(datastore, "_supports_expression_delete", lambda source_id: True)
+
+    assert datastore._delete_expression(SOURCE_ID, col, '(author == "a")') == 3
+    col.query.assert_not_called()
+    col.delete.assert_called_once_with('(author == "a")')
+
+
+class Hit:
+    def __init__(self, query_index: int, rank: int):
+        self.score = 1.0 - rank / 10
+        self.entity = {
+            "id": f"q{query_index}_hit{rank}",
+            "text": f"text {rank}",
+            "document_id": "doc",
+            "source_id": SOURCE_ID,
+            "source": "email",
+            "url": "",
+            "created_at": 0,
+            "author": "",
+            "json_data": None,
+        }
+
+
+class SearchCollection:
+    """Answers each query vector with top_k hits named after the query index held in its first element."""
+
+    def __init__(self):
+        self.searches = []
+
+    def search(self, data, anns_field, param, limit, expr, output_fields):
+        self.searches.append(([int(vector[0]) for vector in data], limit, expr))
+        return [[Hit(int(vector[0]), rank) for rank in range(limit)] for vector in data]
+
+
+@pytest.mark.asyncio
+async def test_query_results_keep_query_order_across_groups(datastore, monkeypatch):
+    col = SearchCollection()
+    monkeypatch.setattr(datastore, "_get_collection", lambda source_id: col)
+    monkeypatch.setattr(milvus_datastore, "SEARCH_BATCH_SIZE", 2)
+    # Interleave two top_k values, an author filter and an empty filter, which does not filter
+    queries = [
+        QueryWithEmbedding(
+            query=f"query {i}",
+            source_id=SOURCE_ID,
+            top_k=2 if i % 2 else 3,
+            filter=DocumentMetadataFilter(author="a") if i % 3 == 0 else DocumentMetadataFilter(),
+            embedding=[float(i)] + [0.0] * (DIM - 1),
+        )
+        for i in range(9)
+    ]
+
+    results = await datastore._query(queries)
+
+    assert [result.query for result in results] == [query.query for query in queries]
+    for i, (query, result) in enumerate(zip(queries, results)):
+        assert [chunk.id for chunk in result.results] == [f"q{i}_hit{rank}" for rank in range(query.top_k)]
+    # Queries sharing a filter and top_k are searched together, at most SEARCH_BATCH_SIZE per call
+    assert sorted(col.searches) == [
+        ([0, 6], 3, '(author == "a")'),
+        ([1, 5], 2, None),
+        ([2, 4], 3, None),
+        ([3], 2, '(author == "a")'),
+        ([7], 2, None),
+        ([8], 3, None),
+    ]
+
+
+
+@pytest.fixture
+def connections(datastore, monkeypatch):
+    """
+    Open a new mocked collection on every connection, searching with search when it is set. The load state is
+    taken from states, Loaded once empty, and loads fail with the errors of load_errors until it is empty.
+    """
+    connections = SimpleNamespace(opened=[], states=[], load_errors=[], search=None)
+
+    def load():
+        if connections.load_errors:
+            raise connections.load_errors.pop(0)
+
+    def create_connection(connection_info):
+        col = MagicMock()
+        col.load.side_effect = load
+        if connections.search is not None:
+            col.search.side_effect = connections.search
+        connections.opened.append(col)
+        return col
+
+    def load_state(collection_name, using):
+        return connections.states.pop(0) if connections.states else milvus_datastore.LoadState.Loaded
+
+    monkeypatch.setattr(datastore, "_create_connection", create_connection)
+    monkeypatch.setattr(milvus_datastore, "utility", SimpleNamespace(load_state=load_state))
+    return connections
+
+
+def test_collection_handle_is_cached(datastore, connections):
+    col = datastore._get_collection(SOURCE_ID)
+
+    assert datastore._get_collection(SOURCE_ID) is col
+    # Source ids stored in the same collection share its handle
+    assert datastore._get_collection("other") is col
+    assert len(connections.opened) == 1
+    col.load.assert_not_called()
+
+
+def test_collection_is_loaded_when_not_loaded(datastore, connections):
+    connections.states.append(milvus_datastore.LoadState.NotLoad)
+
+    col = datastore._get_collection(SOURCE_ID)
+    datastore._get_collection(SOURCE_ID)
+
+    col.load.assert_called_once()
+    assert connections.states == []
+
+
+def test_failed_load_is_retried_on_next_use(datastore, connections):
+    connections.states.extend([milvus_datastore.LoadState.NotLoad, milvus_datastore.LoadState.NotLoad])
+    connections.load_errors.append(MilvusException("not enough memory"))
+
+    col = datastore._get_collection(SOURCE_ID)
+    assert not datastore._handles[SOURCE_ID].loaded
+    assert datastore._get_collection(SOURCE_ID) is col
+    datastore._get_collection(SOURCE_ID)
+
+    assert col.load.call_count == 2
+    assert datastore._handles[SOURCE_ID].loaded
+    assert len(connections.opened) == 1
+
+
+def test_search_reopens_a_dropped_collection(datastore, connections):
+    stale = datastore._get_collection(SOURCE_ID)
+    stale.search.side_effect = MilvusException("collection not found")
+    query = QueryWithEmbedding(query="q", source_id=SOURCE_ID, top_k=1, embedding=[0.0] * DIM)
+
+    # The collection reopened after the failure is the recreated one, not loaded yet
+    connections.search = lambda data, **kwargs: [[Hit(0, 0)]]
+    connections.states.append(milvus_datastore.LoadState.NotLoad)
+
+    (result,) = datastore._search_batch(SOURCE_ID, None, 1, [query])
+
+    assert [chunk.id for chunk in result.results] == ["q0_hit0"]
+    assert len(connections.opened) == 2
+    assert datastore._get_collection("other") is connections.opened[1]
+    connections.opened[1].load.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_delete_all_forgets_the_dropped_collection(datastore, connections, monkeypatch):
+    recreated = MagicMock()
+    monkeypatch.setattr(datastore, "_create_collection", lambda connection_info, collection_name, create_new: recreated)
+    monkeypatch.setattr(datastore, "_create_index", lambda col: None)
+    dropped = datastore._get_collection(SOURCE_ID)
+    datastore._get_collection("other")
+
+    assert await datastore._delete(SOURCE_ID, delete_all=True)
+
+    dropped.drop.assert_called_once()
+    assert datastore._handles == {}
+    # Both source ids reconnect rather than reuse the dropped collection object
+    assert datastore._get_collection("other") is connections.opened[1]
@@ -0,0 +1,187 @@
+import pytest
+from models.models import (
+    DocumentChunkMetadata,
+    DocumentMetadataFilter,
+    DocumentChunk,
+    QueryWithEmbedding,
+    Source,
+)
+from datastore.providers.numpy_datastore import NumpyDataStore
+from services.date import to_unix_timestamp
+
+OUTPUT_DIM = 8
+SOURCE_ID = "test"
+
+
+@pytest.fixture
+def numpy_datastore(tmp_path):
+    return NumpyDataStore(path=str(tmp_path), dimension=OUTPUT_DIM)
+
+
+def sample_embedding(one_element_poz: int):
+    embedding = [0] * OUTPUT_DIM
+    embedding[one_element_poz % OUTPUT_DIM] = 1
+    return embedding
+
+
+def sample_query(one_element_poz: int, top_k: int = 9, filter=None):
+    return QueryWithEmbedding(
+        query="lorem",
+        source_id=SOURCE_ID,
+        top_k=top_k,
+        filter=filter,
+        embedding=sample_embedding(one_element_poz),
+    )
+
+
+@pytest.fixture
+def document_chunk_one():
+    doc_id = "zerp"
+    doc_chunks = []
+
+    ids = ["abc_123", "def_456", "ghi_789"]
+    texts = [
+        "lorem ipsum dolor sit amet",
+        "consectetur adipiscing elit",
+        "sed do eiusmod tempor incididunt",
+    ]
+    sources = [Source.email, Source.file, Source.chat]
+    source_ids = ["foo", "bar", "baz"]
+    urls = ["foo.com", "bar.net", "baz.org"]
+    created_ats = [
+        "1929-10-28T09:30:00-05:00",
+        "2009-01-03T16:39:57-08:00",
+        "2021-01-21T10:00:00-02:00",
+    ]
+    authors = ["Max Mustermann", "John Doe", "Jane Doe"]
+    property_ids = [[1, 2], [3], []]
+
+    for i in range(3):
+        chunk = DocumentChunk(
+            id=ids[i],
+            text=texts[i],
+            metadata=DocumentChunkMetadata(
+                document_id=doc_id,
+                source=sources[i],
+                source_id=source_ids[i],
+                url=urls[i],
+                created_at=to_unix_timestamp(created_ats[i]),
+                author=authors[i],
+                json_data={"property_ids": property_ids[i]},
+            ),
+            embedding=sample_embedding(i),  # type: ignore
+        )
+
+        doc_chunks.append(chunk)
+
+    return {doc_id: doc_chunks}
+
+
+@pytest.mark.asyncio
+async def test_upsert_query_all(numpy_datastore, document_chunk_one):
+    res = await numpy_datastore._upsert(document_chunk_one, SOURCE_ID)
+    assert res == list(document_chunk_one.keys())
+
+    query_results = await numpy_datastore._query(queries=[sample_query(0)])
+
+    assert 1 == len(query_results)
+    assert 3 == len(query_results[0].results)
+    assert "abc_123" == query_results[0].results[0].id
+    assert 1.0 == pytest.approx(query_results[0].results[0].score)
+    assert Source.email == query_results[0].results[0].metadata.source
+    assert {"property_ids": [1, 2]} == query_results[0].results[0].metadata.json_data
+
+
+@pytest.mark.asyncio
+async def test_reload(numpy_datastore, document_chunk_one, tmp_path):
+    await numpy_datastore._upsert(document_chunk_one, SOURCE_ID)
+
+    new_store = NumpyDataStore(path=str(tmp_path), dimension=OUTPUT_DIM)
+    query_results = await new_store._query(queries=[sample_query(1, top_k=1)])
+
+    assert 1 == len(query_results[0].results)
+    assert "def_456" == query_results[0].results[0].id
+    assert "bar.net" == query_results[0].results[0].metadata.url
+
+
+@pytest.mark.asyncio
+async def test_query_filter(numpy_datastore, document_chunk_one):
+    await numpy_datastore._upsert(document_chunk_one, SOURCE_ID)
+    query = sample_query(
+        0,
+        top_k=1,
+        filter=DocumentMetadataFilter(
+            start_date="2000-01-03T16:39:57-08:00", end_date="2010-01-03T16:39:57-08:00"
+        ),
+    )
+    query_results = await numpy_datastore._query(queries=[query])
+
+    assert 1 == len(query_results[0].results)
+    assert 1.0 != query_results[0].results[0].score
+    assert "def_456" == query_results[0].results[0].id
+
+
+@pytest.mark.asyncio
+async def test_query_property_ids_filter(numpy_datastore, document_chunk_one):
+    await numpy_datastore._upsert(document_chunk_one, SOURCE_ID)
+    query = sample_query(0, filter=DocumentMetadataFilter(property_ids=[2, 3]))
+    query_results = await numpy_datastore._query(queries=[query])
+
+    assert ["abc_123", "def_456"] == [result.id for result in query_results[0].results]
+
+
+@pytest.mark.asyncio
+async def test_query_metadata_filters(numpy_datastore, document_chunk_one):
+    await numpy_datastore._upsert(document_chunk_one, SOURCE_ID)
+    queries = [
+        sample_query(0, filter=DocumentMetadataFilter(author="Jane Doe")),
+        sample_query(0, filter=DocumentMetadataFilter(source_id="bar")),
+        sample_query(0, filter=DocumentMetadataFilter(document_id="zerp", source=Source.email)),
+        sample_query(0, filter=DocumentMetadataFilter(author="Nobody")),
+    ]
+    query_results = await numpy_datastore._query(queries=queries)
+
+    assert [["ghi_789"], ["def_456"], ["abc_123"], []] == [
+        [result.id for result in query_result.results] for query_result in query_results
+    ]
+
+
+@pytest.mark.asyncio
+async def test_delete_with_source_filter(numpy_datastore, document_chunk_one):
+    await numpy_datastore._upsert(document_chunk_one, SOURCE_ID)
+    await numpy_datastore.delete(SOURCE_ID, filter=DocumentMetadataFilter(source=Source.email))
+
+    query_results = await numpy_datastore._query(queries=[sample_query(0)])
+
+    assert 2 == len(query_results[0].results)
+    assert "def_456" == query_results[0].results[0].id
+
+
+@pytest.mark.asyncio
+async def test_delete_with_document_id(numpy_datastore, document_chunk_one):
+    res = await numpy_datastore._upsert(document_chunk_one, SOURCE_ID)
+    await numpy_datastore.delete(SOURCE_ID, [res[0]])
+
+    query_results = await numpy_datastore._query(queries=[sample_query(0)])
+
+    assert 0 == len(query_results[0].results)
+
+
+@pytest.mark.asyncio
+async def test_delete_chunks(numpy_datastore, document_chunk_one):
+    await numpy_datastore._upsert(document_chunk_one, SOURCE_ID)
+    await numpy_datastore._delete_chunks(SOURCE_ID, ["abc_123"])
+
+    chunk_ids = await numpy_datastore._get_chunk_ids(SOURCE_ID, ["zerp", "merp"])
+
+    assert {"zerp": {"def_456", "ghi_789"}} == chunk_ids
+
+
+@pytest.mark.asyncio
+async def test_delete_all(numpy_datastore, document_chunk_one):
+    await numpy_datastore._upsert(document_chunk_one, SOURCE_ID)
+    await numpy_datastore.delete(SOURCE_ID, delete_all=True)
+
+    query_results = await numpy_datastore._query(queries=[sample_query(0)])
+
+    assert 0 == len(query_results[0].results)
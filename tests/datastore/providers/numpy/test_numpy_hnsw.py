@@ -0,0 +1,171 @@
+import os
+
+import numpy as np
+import pytest
+
+from datastore.providers import numpy_datastore as numpy_datastore_module
+from datastore.providers.numpy_datastore import ColumnFile, NumpyDataStore
+from datastore.providers.numpy_hnsw import HnswIndex
+from models.models import DocumentChunk, DocumentChunkMetadata, QueryWithEmbedding
+from tools.benchmark_hnsw import make_vectors
+
+DIM = 16
+ROWS = 1500
+TOP_K = 10
+SOURCE_ID = "test"
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(0)
+    vectors = make_vectors(ROWS + 50, DIM, 20, rng)
+    return vectors[50:], vectors[:50]
+
+
+def open_index(path: str, lengths: dict) -> HnswIndex:
+    def column(name: str, dtype, row_shape: tuple = ()) -> ColumnFile:
+        return ColumnFile(os.path.join(path, name), dtype, lengths.get(name, 0), row_shape)
+
+    vectors = column("vectors.f32", np.float32, (DIM,))
+    return HnswIndex(vectors, column, os.path.join(path, "hnsw.npz"), m=8, ef_construction=64, seed=0)
+
+
+@pytest.fixture(scope="module")
+def index(tmp_path_factory, data):
+    """An index over the data vectors, built once since building dominates the run time of these tests."""
+    vectors, _ = data
+    index = open_index(str(tmp_path_factory.mktemp("hnsw")), {})
+    index.vectors.append(vectors)
+    index.add(len(vectors))
+    return index
+
+
+def exact_top_k(vectors: np.ndarray, query: np.ndarray, top_k: int, allowed=None) -> np.ndarray:
+    scores = vectors @ query
+    if allowed is not None:
+        scores[~allowed] = -np.inf
+    return np.argsort(-scores, kind="stable")[:top_k]
+
+
+def recall(index: HnswIndex, vectors: np.ndarray, queries: np.ndarray, allowed=None) -> float:
+    found = 0
+    for query in queries:
+        rows, _ = index.search(query, TOP_K, allowed)
+        found += len(set(rows.tolist()) & set(exact_top_k(vectors, query, TOP_K, allowed).tolist()))
+    return found / (len(queries) * TOP_K)
+
+
+def test_recall_against_exact_search(index, data):
+    vectors, queries = data
+
+    assert recall(index, vectors, queries) >= 0.95
+
+
+def test_results_are_sorted_and_scored(index, data):
+    vectors, queries = data
+
+    rows, scores = index.search(queries[0], TOP_K)
+
+    assert len(rows) == TOP_K
+    assert np.all(np.diff(scores) <= 0)
+    np.testing.assert_allclose(scores, vectors[rows] @ queries[0], rtol=1e-5)
+
+
+def test_allowed_mask_is_honoured(index, data):
+    vectors, queries = data
+    allowed = np.random.default_rng(1).random(ROWS) < 0.3
+
+    for query in queries:
+        rows, _ = index.search(query, TOP_K, allowed)
+        assert len(rows) == TOP_K
+        assert allowed[rows].all()
+    assert recall(index, vectors, queries, allowed) >= 0.9
+
+
+def test_save_and_reopen_without_rebuild(index, data, monkeypatch):
+    _, queries = data
+    index.save()
+    for column in [index.vectors, *index.files()]:
+        column.flush()
+    lengths = {os.path.basename(column.path): column.length for column in [index.vectors, *index.files()]}
+
+    def fail_rebuild(self):
+        raise AssertionError("the saved graph was rebuilt")
+
+    monkeypatch.setattr(HnswIndex, "_reset", fail_rebuild)
+    reopened = open_index(os.path.dirname(index.upper_path), lengths)
+
+    assert reopened.count == ROWS
+    assert reopened.entry_point == index.entry_point
+    for query in queries:
+        expected_rows, expected_scores = index.search(query, TOP_K)
+        rows, scores = reopened.search(query, TOP_K)
+        np.testing.assert_array_equal(rows, expected_rows)
+        np.testing.assert_array_equal(scores, expected_scores)
+
+
+@pytest.fixture
+def hnsw_datastore(tmp_path, monkeypatch):
+    """A NumPy datastore with an HNSW index that answers every unfiltered query, compacting from 100 dead rows."""
+    monkeypatch.setattr(numpy_datastore_module, "NUMPY_INDEX", "hnsw")
+    monkeypatch.setattr(numpy_datastore_module, "NUMPY_HNSW_M", 8)
+    monkeypatch.setattr(numpy_datastore_module, "NUMPY_HNSW_EF_CONSTRUCTION", 64)
+    monkeypatch.setattr(numpy_datastore_module, "NUMPY_SEARCH_BLOCK_SIZE", 64)
+    monkeypatch.setattr(numpy_datastore_module, "MIN_COMPACT_ROWS", 100)
+    return NumpyDataStore(path=str(tmp_path), dimension=DIM)
+
+
+def chunks(vectors: np.ndarray, count: int):
+    return {
+        f"doc{i}": [
+            DocumentChunk(
+                id=f"chunk{i}",
+                text=f"chunk {i}",
+                metadata=DocumentChunkMetadata(document_id=f"doc{i}"),
+                embedding=vectors[i].tolist(),
+            )
+        ]
+        for i in range(count)
+    }
+
+
+async def query_ids(datastore: NumpyDataStore, queries: np.ndarray):
+    results = await datastore._query(
+        [QueryWithEmbedding(query="q", source_id=SOURCE_ID, top_k=TOP_K, embedding=query.tolist()) for query in queries]
+    )
+    return [[int(chunk.id[len("chunk"):]) for chunk in result.results] for result in results]
+
+
+@pytest.mark.asyncio
+async def test_tombstoned_rows_are_never_returned(hnsw_datastore, data):
+    vectors, queries = data
+    await hnsw_datastore._upsert(chunks(vectors, 400), SOURCE_ID)
+    # The best match of every query is deleted, staying in the graph as a waypoint
+    deleted = {int(exact_top_k(vectors[:400], query, 1)[0]) for query in queries}
+    await hnsw_datastore._delete_chunks(SOURCE_ID, [f"chunk{i}" for i in deleted])
+
+    collection = hnsw_datastore._get_collection(SOURCE_ID)
+    assert collection.index.count == 400
+    for rows in await query_ids(hnsw_datastore, queries):
+        assert len(rows) == TOP_K
+        assert not deleted & set(rows)
+
+
+@pytest.mark.asyncio
+async def test_compaction_rebuilds_the_graph(hnsw_datastore, data):
+    vectors, queries = data
+    await hnsw_datastore._upsert(chunks(vectors, 400), SOURCE_ID)
+    # Deleting more than NUMPY_COMPACT_RATIO of the rows compacts the collection
+    await hnsw_datastore._delete_chunks(SOURCE_ID, [f"chunk{i}" for i in range(400) if i % 4 != 3])
+
+    collection = hnsw_datastore._get_collection(SOURCE_ID)
+    assert collection.count == collection.index.count == 100
+    links = collection.index.links.array
+    assert links.max() < 100
+    assert all(row < 100 for layer in collection.index.upper for row in layer)
+
+    kept = np.arange(3, 400, 4)
+    for query, rows in zip(queries, await query_ids(hnsw_datastore, queries)):
+        assert set(rows) <= set(kept.tolist())
+        expected = kept[exact_top_k(vectors[kept], query, TOP_K)]
+        assert len(set(rows) & set(expected.tolist())) >= TOP_K - 1
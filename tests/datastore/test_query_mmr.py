@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from datastore import datastore as datastore_module
+from datastore.providers.numpy_datastore import NumpyDataStore
+from models.models import DocumentChunk, DocumentChunkMetadata, Query
+from services import embeddings as embeddings_module
+from services.embedding_cache import EmbeddingCache
+
+SOURCE_ID = "test"
+QUERY_EMBEDDING = np.array([1.0, 0.0, 0.0])
+# Two near duplicates closest to the query, then a diverse chunk and one orthogonal to the query
+VECTORS = {
+    "near": [1.0, 0.1, 0.0],
+    "near_copy": [1.0, 0.12, 0.0],
+    "diverse": [0.7, 0.0, 0.7],
+    "orthogonal": [0.0, 1.0, 0.0],
+}
+
+
+@pytest.fixture
+def numpy_datastore(tmp_path, monkeypatch):
+    """An empty datastore and the chunks of VECTORS, with a fixed query embedding and no embedding cache."""
+    datastore = NumpyDataStore(path=str(tmp_path), dimension=3)
+    chunks = [
+        DocumentChunk(id=chunk_id, text=f"text of {chunk_id}", metadata=DocumentChunkMetadata(document_id=chunk_id),
+                      embedding=vector)
+        for chunk_id, vector in VECTORS.items()
+    ]
+
+    async def fake_query_embeddings(texts, embedding_model):
+        return np.tile(QUERY_EMBEDDING, (len(texts), 1))
+
+    monkeypatch.setattr(datastore_module, "get_query_embeddings_async", fake_query_embeddings)
+    monkeypatch.setattr(embeddings_module, "get_embedding_cache", lambda: None)
+    return datastore, chunks
+
+
+def query(**kwargs):
+    return Query(query="q", source_id=SOURCE_ID, top_k=2, embedding_model="m", **kwargs)
+
+
+async def result_ids(datastore, **kwargs):
+    (result,) = await datastore.query([query(**kwargs)])
+    return [chunk.id for chunk in result.results]
+
+
+@pytest.mark.asyncio
+async def test_mmr_uses_stored_vectors(numpy_datastore):
+    datastore, chunks = numpy_datastore
+    await datastore._upsert({chunk.id: [chunk] for chunk in chunks}, SOURCE_ID)
+
+    assert await result_ids(datastore) == ["near", "near_copy"]
+    # The near duplicate is skipped for the diverse chunk
+    assert await result_ids(datastore, mmr_lambda=0.5) == ["near", "diverse"]
+
+
+@pytest.mark.asyncio
+async def test_mmr_falls_back_to_cached_vectors(numpy_datastore, monkeypatch):
+    datastore, chunks = numpy_datastore
+    await datastore._upsert({chunk.id: [chunk] for chunk in chunks}, SOURCE_ID)
+    cache = EmbeddingCache()
+    cache.put_many(
+        embeddings_module.get_cache_model_key("m"), [chunk.text for chunk in chunks], np.array(list(VECTORS.values()))
+    )
+
+    async def not_stored(source_id, chunk_ids):
+        raise NotImplementedError
+
+    monkeypatch.setattr(datastore, "_get_chunk_embeddings", not_stored)
+    monkeypatch.setattr(embeddings_module, "get_embedding_cache", lambda: cache)
+
+    assert await result_ids(datastore, mmr_lambda=0.5) == ["near", "diverse"]
+
+
+@pytest.mark.asyncio
+async def test_mmr_skipped_without_vectors(numpy_datastore, monkeypatch):
+    datastore, chunks = numpy_datastore
+    await datastore._upsert({chunk.id: [chunk] for chunk in chunks}, SOURCE_ID)
+
+    async def not_stored(source_id, chunk_ids):
+        return {}
+
+    async def fail_embeddings(texts, embedding_model=None):
+        raise AssertionError("candidates must not be embedded again")
+
+    monkeypatch.setattr(datastore, "_get_chunk_embeddings", not_stored)
+    monkeypatch.setattr(embeddings_module, "get_embeddings_async", fail_embeddings)
+
+    # The over-fetched candidates are cut back to top_k by relevance
+    assert sorted(await result_ids(datastore, mmr_lambda=0.5)) == ["near", "near_copy"]
+
+
+@pytest.mark.asyncio
+async def test_stored_vectors_of_deleted_chunks(numpy_datastore):
+    datastore, chunks = numpy_datastore
+    await datastore._upsert({chunk.id: [chunk] for chunk in chunks}, SOURCE_ID)
+    await datastore._delete_chunks(SOURCE_ID, ["near"])
+
+    vectors = await datastore._get_chunk_embeddings(SOURCE_ID, ["near", "diverse", "unknown"])
+
+    assert list(vectors) == ["diverse"]
+    np.testing.assert_allclose(vectors["diverse"], np.array(VECTORS["diverse"]) / np.linalg.norm(VECTORS["diverse"]))
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from datastore import datastore as datastore_module
+from datastore.providers.numpy_datastore import NumpyDataStore
+from models.models import Document, DocumentChunkMetadata, Source
+from services.chunks import get_content_chunk_ids
+
+OUTPUT_DIM = 8
+SOURCE_ID = "test"
+CHUNK_TOKEN_SIZE = 50
+
+
+@pytest.fixture
+def numpy_datastore(tmp_path):
+    return NumpyDataStore(path=str(tmp_path), dimension=OUTPUT_DIM)
+
+
+@pytest.fixture
+def embedded(monkeypatch):
+    """Replace the embedding of chunks with fixed vectors and record the ids of the chunks embedded."""
+    calls = []
+
+    async def fake_embed_chunks(chunks):
+        calls.append([chunk.id for chunk in chunks])
+        for chunk in chunks:
+            chunk.embedding = np.ones(OUTPUT_DIM, dtype=np.float32)
+
+    monkeypatch.setattr(datastore_module, "embed_chunks", fake_embed_chunks)
+    return calls
+
+
+def document_text(last_word: str = "end") -> str:
+    paragraphs = [f"Paragraph {i}. " + " ".join(f"word{i}x{j}" for j in range(40)) + "." for i in range(3)]
+    return "\n\n".join(paragraphs) + f" {last_word}."
+
+
+async def stored_ids(datastore: NumpyDataStore, document_id: str = "doc"):
+    return (await datastore._get_chunk_ids(SOURCE_ID, [document_id])).get(document_id, set())
+
+
+def test_content_chunk_ids_are_stable():
+    metadata = DocumentChunkMetadata(document_id="doc", source=Source.file)
+
+    ids = get_content_chunk_ids("doc", ["one", "two"], metadata)
+
+    assert ids == get_content_chunk_ids("doc", ["one", "two"], metadata)
+    assert all(chunk_id.startswith("doc_") for chunk_id in ids)
+    assert len(set(ids)) == 2
+
+
+def test_content_chunk_ids_change_with_text_and_metadata():
+    metadata = DocumentChunkMetadata(document_id="doc", source=Source.file)
+    chunk_id = get_content_chunk_ids("doc", ["one"], metadata)[0]
+
+    assert get_content_chunk_ids("doc", ["one!"], metadata)[0] != chunk_id
+    assert get_content_chunk_ids("doc", ["one"], DocumentChunkMetadata(document_id="doc", source=Source.email))[0] != chunk_id
+
+
+def test_content_chunk_ids_suffix_repeated_chunks():
+    metadata = DocumentChunkMetadata(document_id="doc")
+
+    first, second, third = get_content_chunk_ids("doc", ["same", "same", "other"], metadata)
+
+    assert second == f"{first}_1"
+    assert not third.endswith("_1")
+
+
+@pytest.mark.asyncio
+async def test_upsert_delta_inserts_every_chunk_of_a_new_document(numpy_datastore, embedded):
+    await numpy_datastore.upsert_delta([Document(id="doc", text=document_text())], SOURCE_ID, CHUNK_TOKEN_SIZE)
+
+    assert len(embedded) == 1
+    assert len(embedded[0]) > 1
+    assert await stored_ids(numpy_datastore) == set(embedded[0])
+
+
+@pytest.mark.asyncio
+async def test_upsert_delta_skips_unchanged_document(numpy_datastore, embedded):
+    document = Document(id="doc", text=document_text())
+    await numpy_datastore.upsert_delta([document], SOURCE_ID, CHUNK_TOKEN_SIZE)
+    before = await stored_ids(numpy_datastore)
+
+    await numpy_datastore.upsert_delta([document], SOURCE_ID, CHUNK_TOKEN_SIZE)
+
+    assert embedded[1] == []
+    assert await stored_ids(numpy_datastore) == before
+
+
+@pytest.mark.asyncio
+async def test_upsert_delta_replaces_only_changed_chunks(numpy_datastore, embedded):
+    await numpy_datastore.upsert_delta([Document(id="doc", text=document_text())], SOURCE_ID, CHUNK_TOKEN_SIZE)
+    before = await stored_ids(numpy_datastore)
+
+    await numpy_datastore.upsert_delta(
+        [Document(id="doc", text=document_text("changed"))], SOURCE_ID, CHUNK_TOKEN_SIZE
+    )
+    after = await stored_ids(numpy_datastore)
+
+    # Only the chunks that are new after the edit are embedded, and the chunks they replace are deleted
+    assert set(embedded[1]) == after - before
+    assert 0 < len(embedded[1]) < len(after)
+    assert before & after
+    assert len(after) == len(before)
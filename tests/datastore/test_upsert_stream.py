@@ -0,0 +1,125 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from datastore import datastore as datastore_module
+from datastore.providers.numpy_datastore import NumpyDataStore
+from models.models import Document, DocumentChunk, DocumentChunkMetadata
+from services import chunks as chunks_module
+from services.chunks import iter_document_chunk_windows
+
+OUTPUT_DIM = 8
+SOURCE_ID = "test"
+
+
+@pytest.fixture
+def chunked(monkeypatch):
+    """Chunk each document into as many chunks as the number in its text, recording every document chunked."""
+    calls = []
+
+    def fake_create_document_chunks(doc, chunk_token_size):
+        calls.append(doc.id)
+        metadata = DocumentChunkMetadata(document_id=doc.id)
+        return [DocumentChunk(id=f"{doc.id}_{i}", text=f"chunk {i}", metadata=metadata) for i in range(int(doc.text))], doc.id
+
+    monkeypatch.setattr(chunks_module, "create_document_chunks", fake_create_document_chunks)
+    return calls
+
+
+@pytest.fixture
+def embedded(monkeypatch):
+    """Replace the embedding of chunks with fixed vectors and record the ids of the chunks embedded."""
+    calls = []
+
+    async def fake_embed_chunks(chunks):
+        calls.append([chunk.id for chunk in chunks])
+        for chunk in chunks:
+            chunk.embedding = np.ones(OUTPUT_DIM, dtype=np.float32)
+
+    monkeypatch.setattr(datastore_module, "embed_chunks", fake_embed_chunks)
+    return calls
+
+
+@pytest.fixture
+def numpy_datastore(tmp_path):
+    return NumpyDataStore(path=str(tmp_path), dimension=OUTPUT_DIM)
+
+
+def documents(*sizes: int):
+    return [Document(id=f"doc{i}", text=str(size)) for i, size in enumerate(sizes)]
+
+
+async def windows(docs, window_size):
+    return [
+        {doc_id: [chunk.id for chunk in doc_chunks] for doc_id, doc_chunks in window.items()}
+        async for window in iter_document_chunk_windows(docs, None, window_size)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_windows_split_documents_across_boundaries(chunked):
+    assert await windows(documents(3, 4, 1), 3) == [
+        {"doc0": ["doc0_0", "doc0_1", "doc0_2"]},
+        {"doc1": ["doc1_0", "doc1_1", "doc1_2"]},
+        {"doc1": ["doc1_3"], "doc2": ["doc2_0"]},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_windows_report_documents_without_chunks(chunked):
+    assert await windows(documents(2, 0, 1), 2) == [{"doc0": ["doc0_0", "doc0_1"]}, {"doc1": [], "doc2": ["doc2_0"]}]
+    assert await windows(documents(0), 2) == [{"doc0": []}]
+
+
+@pytest.mark.asyncio
+async def test_windows_of_no_documents(chunked):
+    assert await windows([], 3) == []
+
+
+@pytest.mark.asyncio
+async def test_upsert_stream_inserts_every_window(numpy_datastore, chunked, embedded):
+    doc_ids = await numpy_datastore.upsert_stream(documents(3, 4, 0, 2), SOURCE_ID, window_size=3)
+
+    # Documents without chunks are reported like the other upsert paths do
+    assert doc_ids == ["doc0", "doc1", "doc2", "doc3"]
+    assert [len(window) for window in embedded] == [3, 3, 3]
+    stored = await numpy_datastore._get_chunk_ids(SOURCE_ID, doc_ids)
+    assert {doc_id: len(chunk_ids) for doc_id, chunk_ids in stored.items()} == {"doc0": 3, "doc1": 4, "doc3": 2}
+
+
+@pytest.mark.asyncio
+async def test_upsert_stream_of_no_documents(numpy_datastore, chunked, embedded):
+    assert await numpy_datastore.upsert_stream([], SOURCE_ID) == []
+    assert embedded == []
+
+
+@pytest.mark.asyncio
+async def test_embed_failure_stops_the_pipeline(numpy_datastore, chunked, monkeypatch):
+    async def failing_embed_chunks(chunks):
+        raise RuntimeError("embedding failed")
+
+    monkeypatch.setattr(datastore_module, "embed_chunks", failing_embed_chunks)
+
+    with pytest.raises(RuntimeError, match="embedding failed"):
+        await asyncio.wait_for(numpy_datastore.upsert_stream(documents(*[1] * 20), SOURCE_ID, window_size=1), timeout=5)
+    await asyncio.sleep(0)
+
+    # The chunk stage was cancelled while blocked on the full queue instead of chunking every document
+    assert len(chunked) < 20
+    assert await numpy_datastore._get_chunk_ids(SOURCE_ID, ["doc0"]) == {}
+
+
+@pytest.mark.asyncio
+async def test_insert_failure_stops_the_pipeline(numpy_datastore, chunked, embedded, monkeypatch):
+    async def failing_upsert(chunks, source_id):
+        raise RuntimeError("insert failed")
+
+    monkeypatch.setattr(numpy_datastore, "_upsert", failing_upsert)
+
+    with pytest.raises(RuntimeError, match="insert failed"):
+        await asyncio.wait_for(numpy_datastore.upsert_stream(documents(*[1] * 20), SOURCE_ID, window_size=1), timeout=5)
+    await asyncio.sleep(0)
+
+    assert len(chunked) < 20
+    assert len(embedded) < 20
@@ -0,0 +1,101 @@
+import re
+
+import pytest
+
+from services import chunker
+from services.chunker import get_text_chunks
+from tools.benchmark_chunker import legacy_get_text_chunks, make_text
+
+EDGE_CASES = [
+    "",
+    "   \n\t ",
+    "short",
+    "One sentence only, no final punctuation",
+    "Ends with many marks?!... " * 80,
+    "Abbreviations e.g. i.e. 1.5 vs. 2.75 and B-204. " * 60,
+    "line\n" * 400,
+    "\n\n\n" + "Paragraph text here.\n\n" * 90,
+    "tabs\tand\t\tspaces   mixed.\t" * 120,
+    "Accents café naïve résumé Ünïcødé. " * 70,
+    "日本語のテキストです。句読点もあります。" * 60,
+    "Emoji 😀🏠🔑 in a lease! " * 90,
+    "Mixed ß—é…日本 text? Yes. " * 100,
+    "no spaces" * 500,
+]
+
+
+@pytest.mark.parametrize("text", EDGE_CASES)
+@pytest.mark.parametrize("chunk_token_size", [None, 17, 50])
+def test_matches_original_chunker_on_edge_cases(text, chunk_token_size):
+    assert get_text_chunks(text, chunk_token_size) == legacy_get_text_chunks(text, chunk_token_size)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_original_chunker_on_generated_text(seed):
+    text = make_text(20_000, seed)
+    # Every other text gets multibyte and tab suffixes, where re-encoded chunks can differ from their tokens
+    if seed % 2:
+        text = " ".join(word + ("é\t日本語😀"[i % 5] if i % 4 == 0 else "") for i, word in enumerate(text.split(" ")))
+
+    for chunk_token_size in (None, 50):
+        assert get_text_chunks(text, chunk_token_size) == legacy_get_text_chunks(text, chunk_token_size)
+
+
+class StubTokenizer:
+    """Tokenizes words and punctuation marks like a wordpiece tokenizer that has every word in its vocabulary."""
+
+    def __call__(self, text, add_special_tokens, return_offsets_mapping, **kwargs):
+        assert not add_special_tokens and return_offsets_mapping
+        return {"offset_mapping": [match.span() for match in re.finditer(r"\w+|[^\w\s]", text)]}
+
+    def num_special_tokens_to_add(self):
+        return 2
+
+    def count(self, text):
+        return len(re.findall(r"\w+|[^\w\s]", text))
+
+
+@pytest.fixture
+def model_tokenizer(monkeypatch):
+    """Give the model "stub" a stub tokenizer with a max sequence length of 66, leaving 64 text tokens."""
+    stub = StubTokenizer()
+    monkeypatch.setattr(chunker, "get_tokenizer", lambda embedding_model: (stub, 66))
+    return stub
+
+
+SENTENCE = "Apartments balconies courtyards elevators fireplaces gardens hallways kitchens laundries offices."  # 11 tokens
+
+
+def test_model_chunks_end_at_punctuation(model_tokenizer):
+    text = " ".join([SENTENCE] * 20)
+
+    chunks = chunker.get_model_text_chunks(text, 64, "stub")
+
+    # 64 tokens reach into the sixth sentence, so chunks are cut after the fifth period, past MIN_CHUNK_SIZE_CHARS
+    assert chunks == [" ".join([SENTENCE] * 5)] * 4
+
+
+def test_model_chunks_without_punctuation_fill_the_limit(model_tokenizer):
+    words = [f"w{i}" for i in range(150)]
+
+    chunks = chunker.get_model_text_chunks("  ".join(words), 40, "stub")
+
+    # Chunks are slices of the text at token offsets, so the original spacing is kept
+    assert chunks == ["  ".join(words[i : i + 40]) for i in range(0, 150, 40)]
+
+
+def test_model_chunks_are_capped_at_the_model_limit(model_tokenizer):
+    text = " ".join([SENTENCE] * 20) + "\n" + " ".join(f"w{i}" for i in range(300))
+
+    for chunk_token_size in (None, 64, 1000):
+        chunks = chunker.get_model_text_chunks(text, chunk_token_size, "stub")
+
+        assert max(model_tokenizer.count(chunk) for chunk in chunks) <= 64
+        assert " ".join(chunks) == text.replace("\n", " ")
+    assert chunker.get_model_text_chunks(text, None, "stub") == chunker.get_model_text_chunks(text, 1000, "stub")
+
+
+def test_model_chunks_of_short_and_empty_texts(model_tokenizer):
+    assert chunker.get_model_text_chunks("", None, "stub") == []
+    assert chunker.get_model_text_chunks("tiny", None, "stub") == []
+    assert chunker.get_model_text_chunks("Short text.\n", None, "stub") == ["Short text."]
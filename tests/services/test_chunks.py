@@ -0,0 +1,81 @@
+import subprocess
+import sys
+
+import pytest
+
+from models.models import Document, DocumentMetadata, Source
+from services import chunks
+
+
+def make_documents(count: int = 6):
+    documents = []
+    for i in range(count):
+        sentences = [f"Document {i} sentence {j} about unit B-{i}0{j} and its lease." for j in range(60 + i * 10)]
+        documents.append(
+            Document(
+                id=f"doc{i}" if i % 3 else None,
+                text="\n".join(sentences),
+                metadata=DocumentMetadata(source=Source.file, author=f"author {i}"),
+            )
+        )
+    return documents
+
+
+@pytest.fixture
+def chunk_workers(monkeypatch):
+    """Chunk every multi-document batch on two worker processes."""
+    monkeypatch.setattr(chunks, "CHUNK_WORKERS", 2)
+    monkeypatch.setattr(chunks, "CHUNK_PARALLEL_MIN_CHARS", 1)
+    yield
+    chunks.shutdown_chunk_workers()
+
+
+def chunk_summary(result):
+    by_document, all_chunks = result
+    return list(by_document), [(chunk.id, chunk.text, chunk.metadata) for chunk in all_chunks]
+
+
+@pytest.mark.parametrize("content_ids", [False, True])
+def test_worker_chunks_match_in_process(chunk_workers, content_ids):
+    documents = make_documents()
+    # Documents without ids get random ones, so both paths are given the same ids
+    documents = [doc if doc.id else doc.copy(update={"id": f"generated{i}"}) for i, doc in enumerate(documents)]
+    assert chunks._use_chunk_workers(documents)
+
+    pooled = chunks.chunk_documents(documents, 50, content_ids)
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(chunks, "CHUNK_WORKERS", 0)
+        in_process = chunks.chunk_documents(documents, 50, content_ids)
+
+    assert chunk_summary(pooled) == chunk_summary(in_process)
+    assert len(pooled[1]) > len(documents)
+
+
+def test_worker_chunks_get_document_ids(chunk_workers):
+    documents = make_documents()
+
+    by_document, all_chunks = chunks.chunk_documents(documents, 50)
+
+    assert len(by_document) == len(documents)
+    for doc_id, doc_chunks in by_document.items():
+        assert doc_chunks
+        assert all(chunk.metadata.document_id == doc_id for chunk in doc_chunks)
+        assert [chunk.id for chunk in doc_chunks] == [f"{doc_id}_{i}" for i in range(len(doc_chunks))]
+
+
+def test_small_batches_chunk_in_process(monkeypatch):
+    monkeypatch.setattr(chunks, "CHUNK_WORKERS", 2)
+
+    assert not chunks._use_chunk_workers(make_documents())
+    assert not chunks._use_chunk_workers(make_documents(1))
+
+
+def test_chunking_module_does_not_load_the_embedding_stack():
+    # Chunking processes unpickle functions of services.chunker, so they import nothing more than it does
+    code = (
+        "import sys, services.chunker; "
+        "print(sorted({name.split('.')[0] for name in sys.modules} & {'torch', 'sentence_transformers', 'openai'}))"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+
+    assert output.strip() == "[]"
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from services.embedding_cache import EmbeddingCache
+
+MODEL = "test-model"
+
+
+def embeddings(count: int, dim: int = 4) -> np.ndarray:
+    return np.arange(count * dim, dtype=np.float32).reshape(count, dim)
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "cache" / "embeddings.sqlite3")
+
+
+def test_memory_round_trip():
+    cache = EmbeddingCache()
+    cache.put_many(MODEL, ["a", "b"], embeddings(2))
+
+    results = cache.get_many(MODEL, ["b", "c", "a"])
+
+    np.testing.assert_array_equal(results[0], embeddings(2)[1])
+    assert results[1] is None
+    np.testing.assert_array_equal(results[2], embeddings(2)[0])
+    assert results[0].dtype == np.float32
+    assert cache.stats()["memory_hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+
+def test_keys_include_model():
+    cache = EmbeddingCache()
+    cache.put_many(MODEL, ["a"], embeddings(1))
+
+    assert cache.get_many("other-model", ["a"]) == [None]
+
+
+def test_lru_evicts_least_recently_used():
+    cache = EmbeddingCache(max_memory_items=2)
+    cache.put_many(MODEL, ["a", "b"], embeddings(2))
+    # Reading "a" makes "b" the least recently used entry
+    cache.get_many(MODEL, ["a"])
+    cache.put_many(MODEL, ["c"], embeddings(1))
+
+    results = cache.get_many(MODEL, ["a", "b", "c"])
+
+    assert results[0] is not None
+    assert results[1] is None
+    assert results[2] is not None
+    assert cache.stats()["memory_items"] == 2
+
+
+def test_sqlite_round_trip(cache_path):
+    cache = EmbeddingCache(path=cache_path)
+    cache.put_many(MODEL, ["a", "b"], embeddings(2))
+
+    # A new cache on the same file starts with an empty memory tier
+    reopened = EmbeddingCache(path=cache_path)
+    results = reopened.get_many(MODEL, ["a", "b", "c"])
+
+    np.testing.assert_array_equal(results[0], embeddings(2)[0])
+    np.testing.assert_array_equal(results[1], embeddings(2)[1])
+    assert results[2] is None
+    assert reopened.stats()["disk_hits"] == 2
+
+    # Disk hits are promoted to the memory tier
+    reopened.get_many(MODEL, ["a"])
+    assert reopened.stats()["memory_hits"] == 1
+
+
+def test_sqlite_serves_memory_evictions(cache_path):
+    cache = EmbeddingCache(path=cache_path, max_memory_items=1)
+    cache.put_many(MODEL, ["a", "b"], embeddings(2))
+
+    results = cache.get_many(MODEL, ["a"])
+
+    np.testing.assert_array_equal(results[0], embeddings(2)[0])
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_sqlite_lookup_beyond_variable_limit(cache_path):
+    texts = [f"text {i}" for i in range(1200)]
+    cache = EmbeddingCache(path=cache_path)
+    cache.put_many(MODEL, texts, embeddings(len(texts)))
+
+    results = EmbeddingCache(path=cache_path).get_many(MODEL, texts)
+
+    np.testing.assert_array_equal(np.stack(results), embeddings(len(texts)))
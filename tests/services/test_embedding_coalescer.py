@@ -0,0 +1,113 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from services.embedding_coalescer import EmbeddingCoalescer
+
+
+class FakeEmbed:
+    """Embeds each text as a one-element vector of its length and records every batch call."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, texts, embedding_model):
+        self.calls.append((list(texts), embedding_model))
+        return np.array([[len(text)] for text in texts], dtype=np.float32)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_batch():
+    embed = FakeEmbed()
+    coalescer = EmbeddingCoalescer(embed, window_ms=20)
+
+    results = await asyncio.gather(
+        coalescer.embed(["a", "bb"], "m"),
+        coalescer.embed(["ccc"], "m"),
+        coalescer.embed(["dddd"], "m"),
+    )
+
+    assert embed.calls == [(["a", "bb", "ccc", "dddd"], "m")]
+    assert [result[:, 0].tolist() for result in results] == [[1, 2], [3], [4]]
+    assert coalescer.stats()["avg_callers_per_batch"] == 3
+
+
+@pytest.mark.asyncio
+async def test_window_timeout_flushes_pending_texts():
+    embed = FakeEmbed()
+    coalescer = EmbeddingCoalescer(embed, window_ms=5)
+
+    first = await coalescer.embed(["a"], "m")
+    # A caller arriving after the window expired gets a batch of its own
+    second = await coalescer.embed(["bb"], "m")
+
+    assert embed.calls == [(["a"], "m"), (["bb"], "m")]
+    assert first[:, 0].tolist() == [1]
+    assert second[:, 0].tolist() == [2]
+
+
+@pytest.mark.asyncio
+async def test_max_batch_size_flushes_before_window():
+    embed = FakeEmbed()
+    # A window far longer than the test means only the size limit can flush the batch
+    coalescer = EmbeddingCoalescer(embed, window_ms=60000, max_batch_size=3)
+
+    results = await asyncio.wait_for(
+        asyncio.gather(coalescer.embed(["a", "b"], "m"), coalescer.embed(["c"], "m")), timeout=1
+    )
+
+    assert embed.calls == [(["a", "b", "c"], "m")]
+    assert [len(result) for result in results] == [2, 1]
+
+
+@pytest.mark.asyncio
+async def test_models_are_batched_separately():
+    embed = FakeEmbed()
+    coalescer = EmbeddingCoalescer(embed, window_ms=20)
+
+    await asyncio.gather(coalescer.embed(["a"], "m1"), coalescer.embed(["b"], "m2"), coalescer.embed(["c"], "m1"))
+
+    assert sorted(embed.calls) == [(["a", "c"], "m1"), (["b"], "m2")]
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_caller():
+    async def failing_embed(texts, embedding_model):
+        raise RuntimeError("embedding failed")
+
+    coalescer = EmbeddingCoalescer(failing_embed, window_ms=5)
+
+    results = await asyncio.gather(
+        coalescer.embed(["a"], "m"), coalescer.embed(["b"], "m"), return_exceptions=True
+    )
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_empty_request_skips_embedding():
+    embed = FakeEmbed()
+    coalescer = EmbeddingCoalescer(embed)
+
+    assert len(await coalescer.embed([], "m")) == 0
+    assert embed.calls == []
+
+
+@pytest.mark.asyncio
+async def test_running_batches_are_referenced_until_done():
+    release = asyncio.Event()
+
+    async def slow_embed(texts, embedding_model):
+        await release.wait()
+        return np.zeros((len(texts), 1), dtype=np.float32)
+
+    coalescer = EmbeddingCoalescer(slow_embed, max_batch_size=1)
+    caller = asyncio.ensure_future(coalescer.embed(["a"], "m"))
+    await asyncio.sleep(0)
+
+    assert len(coalescer._tasks) == 1
+    release.set()
+    await caller
+    await asyncio.sleep(0)
+    assert not coalescer._tasks
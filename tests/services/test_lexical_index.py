@@ -0,0 +1,157 @@
+import pytest
+
+from datastore.providers.numpy_datastore import NumpyDataStore
+from models.models import (
+    DocumentChunk,
+    DocumentChunkMetadata,
+    DocumentChunkWithScore,
+    DocumentMetadataFilter,
+    Source,
+)
+from services import lexical_index as lexical_index_module
+from services.lexical_index import LexicalIndex
+from services.rank_fusion import reciprocal_rank_fusion
+
+SOURCE_ID = "test"
+
+
+def chunk(chunk_id: str, text: str, document_id: str, **metadata) -> DocumentChunk:
+    return DocumentChunk(
+        id=chunk_id,
+        text=text,
+        metadata=DocumentChunkMetadata(document_id=document_id, **metadata),
+    )
+
+
+def scored(chunk_id: str, score: float = 0.0) -> DocumentChunkWithScore:
+    return DocumentChunkWithScore(id=chunk_id, text=chunk_id, metadata=DocumentChunkMetadata(), score=score)
+
+
+@pytest.fixture
+def index():
+    index = LexicalIndex(":memory:")
+    index.add(
+        SOURCE_ID,
+        {
+            "doc1": [
+                chunk("doc1_0", "Unit B-204 has a leaking faucet", "doc1", source=Source.email, author="Ann",
+                      created_at=1611223200, json_data={"property_ids": [1, 2]}),
+                chunk("doc1_1", "The faucet was replaced", "doc1", source=Source.email, author="Ann",
+                      created_at=1611223200, json_data={"property_ids": [1, 2]}),
+            ],
+            "doc2": [
+                chunk("doc2_0", "Faucet repair in unit B-205", "doc2", source=Source.file, author="Bob",
+                      created_at=1685613600, json_data={"property_ids": [12]}),
+            ],
+        },
+    )
+    index.add("other", {"doc3": [chunk("doc3_0", "faucet", "doc3")]})
+    return index
+
+
+def ids(results):
+    return sorted(result.id for result in results)
+
+
+def test_search_ranks_by_bm25(index):
+    results = index.search(SOURCE_ID, "leaking faucet", top_k=10)
+
+    assert results[0].id == "doc1_0"
+    assert ids(results) == ["doc1_0", "doc1_1", "doc2_0"]
+    assert results[0].score >= results[-1].score
+    assert results[0].metadata.author == "Ann"
+
+
+def test_search_keeps_codes_as_single_tokens(index):
+    assert ids(index.search(SOURCE_ID, "B-205", top_k=10)) == ["doc2_0"]
+
+
+def test_search_ignores_fts_syntax(index):
+    assert ids(index.search(SOURCE_ID, 'faucet" OR NOT (', top_k=10)) == ["doc1_0", "doc1_1", "doc2_0"]
+
+
+@pytest.mark.parametrize(
+    "filter, expected",
+    [
+        (DocumentMetadataFilter(document_id="doc2"), ["doc2_0"]),
+        (DocumentMetadataFilter(author="Ann"), ["doc1_0", "doc1_1"]),
+        (DocumentMetadataFilter(source=Source.file), ["doc2_0"]),
+        (DocumentMetadataFilter(start_date="2022-01-01T00:00:00"), ["doc2_0"]),
+        (DocumentMetadataFilter(end_date="2022-01-01T00:00:00"), ["doc1_0", "doc1_1"]),
+        # Property ids match whole ids only, 1 does not match 12
+        (DocumentMetadataFilter(property_ids=[1]), ["doc1_0", "doc1_1"]),
+        (DocumentMetadataFilter(property_ids=[2, 12]), ["doc1_0", "doc1_1", "doc2_0"]),
+        (DocumentMetadataFilter(property_ids=[]), ["doc1_0", "doc1_1", "doc2_0"]),
+    ],
+)
+def test_search_filters(index, filter, expected):
+    assert ids(index.search(SOURCE_ID, "faucet", top_k=10, filter=filter)) == expected
+
+
+def test_sources_are_partitioned(index):
+    assert ids(index.search("other", "faucet", top_k=10)) == ["doc3_0"]
+
+
+def test_add_replaces_chunks_with_same_id(index):
+    index.add(SOURCE_ID, {"doc2": [chunk("doc2_0", "Window repair", "doc2")]})
+
+    assert ids(index.search(SOURCE_ID, "faucet", top_k=10)) == ["doc1_0", "doc1_1"]
+    assert ids(index.search(SOURCE_ID, "window", top_k=10)) == ["doc2_0"]
+
+
+def test_delete(index):
+    assert index.delete(SOURCE_ID, ids=["doc1"]) == 2
+    assert ids(index.search(SOURCE_ID, "faucet", top_k=10)) == ["doc2_0"]
+
+    assert index.delete(SOURCE_ID, filter=DocumentMetadataFilter(author="Bob")) == 1
+    assert index.search(SOURCE_ID, "faucet", top_k=10) == []
+    assert ids(index.search("other", "faucet", top_k=10)) == ["doc3_0"]
+
+
+def test_delete_all_and_chunks(index):
+    index.delete_chunks(SOURCE_ID, ["doc1_1"])
+    assert ids(index.search(SOURCE_ID, "faucet", top_k=10)) == ["doc1_0", "doc2_0"]
+
+    index.delete(SOURCE_ID, delete_all=True)
+    assert index.search(SOURCE_ID, "faucet", top_k=10) == []
+
+
+@pytest.mark.asyncio
+async def test_datastore_delete_removes_lexical_chunks(index, tmp_path, monkeypatch):
+    monkeypatch.setenv("HYBRID_SEARCH_ENABLED", "true")
+    monkeypatch.setattr(lexical_index_module, "_lexical_index", index)
+
+    await NumpyDataStore(path=str(tmp_path), dimension=8).delete(source_id=SOURCE_ID, ids=["doc2"])
+
+    assert ids(index.search(SOURCE_ID, "faucet", top_k=10)) == ["doc1_0", "doc1_1"]
+
+
+def test_rank_fusion_sums_reciprocal_ranks():
+    fused = reciprocal_rank_fusion([[scored("a"), scored("b")], [scored("b"), scored("c")]], [1.0, 1.0], top_k=10, k=60)
+
+    assert [chunk.id for chunk in fused] == ["b", "a", "c"]
+    assert fused[0].score == pytest.approx(1 / 62 + 1 / 61)
+    assert fused[1].score == pytest.approx(1 / 61)
+
+
+def test_rank_fusion_weights():
+    vector = [scored("a"), scored("b")]
+    lexical = [scored("b"), scored("a")]
+
+    assert [chunk.id for chunk in reciprocal_rank_fusion([vector, lexical], [2.0, 1.0], top_k=10)] == ["a", "b"]
+    assert [chunk.id for chunk in reciprocal_rank_fusion([vector, lexical], [1.0, 2.0], top_k=10)] == ["b", "a"]
+
+
+def test_rank_fusion_zero_weight_drops_list():
+    fused = reciprocal_rank_fusion([[scored("a")], [scored("b")]], [1.0, 0.0], top_k=10)
+
+    assert [chunk.id for chunk in fused] == ["a"]
+
+
+def test_rank_fusion_top_k():
+    fused = reciprocal_rank_fusion([[scored("a", 0.9)], [scored("a", 12.0), scored("b")]], [1.0, 1.0], top_k=1)
+
+    assert len(fused) == 1
+    assert fused[0].id == "a"
+    # The fused score replaces the list scores
+    assert fused[0].score == pytest.approx(2 / 61)
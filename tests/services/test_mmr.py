@@ -0,0 +1,43 @@
+import numpy as np
+
+from services.mmr import maximal_marginal_relevance
+
+QUERY = np.array([1.0, 0.0, 0.0])
+# Two near duplicates closest to the query, then a diverse candidate and one orthogonal to the query
+CANDIDATES = np.array(
+    [
+        [1.0, 0.1, 0.0],
+        [1.0, 0.12, 0.0],
+        [0.7, 0.0, 0.7],
+        [0.0, 1.0, 0.0],
+    ]
+)
+
+
+def test_lambda_one_ranks_by_relevance():
+    assert maximal_marginal_relevance(QUERY, CANDIDATES, top_k=4, lambda_mult=1.0) == [0, 1, 2, 3]
+
+
+def test_lambda_zero_maximizes_diversity():
+    selected = maximal_marginal_relevance(QUERY, CANDIDATES, top_k=3, lambda_mult=0.0)
+
+    # The first pick is the most relevant, then the candidates least similar to the picks follow
+    assert selected[0] == 0
+    assert selected[1] == 3
+    assert 1 not in selected
+
+
+def test_balanced_lambda_skips_near_duplicate():
+    assert maximal_marginal_relevance(QUERY, CANDIDATES, top_k=2, lambda_mult=0.5) == [0, 2]
+
+
+def test_ignores_vector_scale():
+    scaled = CANDIDATES * np.array([[1.0], [10.0], [0.1], [5.0]])
+
+    assert maximal_marginal_relevance(QUERY * 3, scaled, top_k=4, lambda_mult=1.0) == [0, 1, 2, 3]
+
+
+def test_top_k_bounds():
+    assert sorted(maximal_marginal_relevance(QUERY, CANDIDATES, top_k=10)) == [0, 1, 2, 3]
+    assert maximal_marginal_relevance(QUERY, CANDIDATES, top_k=0) == []
+    assert maximal_marginal_relevance(QUERY, np.empty((0, 3)), top_k=3) == []
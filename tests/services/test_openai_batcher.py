@@ -0,0 +1,79 @@
+import pytest
+
+from services import openai_batcher
+from services.openai_batcher import RateLimiter, pack_batches
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fake monotonic clock that asyncio.sleep in the batcher advances instead of waiting."""
+    state = {"now": 1000.0, "sleeps": []}
+
+    async def fake_sleep(seconds):
+        state["sleeps"].append(seconds)
+        state["now"] += seconds
+
+    monkeypatch.setattr(openai_batcher.time, "monotonic", lambda: state["now"])
+    monkeypatch.setattr(openai_batcher.asyncio, "sleep", fake_sleep)
+    return state
+
+
+def test_pack_batches_token_limit():
+    assert pack_batches([3, 4, 2, 5, 1], max_tokens=7, max_items=10) == [[0, 1], [2, 3], [4]]
+
+
+def test_pack_batches_item_limit():
+    assert pack_batches([1] * 5, max_tokens=100, max_items=2) == [[0, 1], [2, 3], [4]]
+
+
+def test_pack_batches_oversized_text_alone():
+    assert pack_batches([2, 10, 2], max_tokens=5, max_items=10) == [[0], [1], [2]]
+
+
+def test_pack_batches_empty():
+    assert pack_batches([], max_tokens=5, max_items=10) == []
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_requests_per_minute(clock):
+    limiter = RateLimiter(requests_per_minute=2)
+    await limiter.acquire(1)
+    clock["now"] += 10
+    await limiter.acquire(1)
+    assert clock["sleeps"] == []
+
+    # The third request waits until the first leaves the window
+    await limiter.acquire(1)
+    assert clock["sleeps"] == [pytest.approx(50)]
+    assert len(limiter._events) == 2
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_tokens_per_minute(clock):
+    limiter = RateLimiter(tokens_per_minute=100)
+    await limiter.acquire(60)
+    await limiter.acquire(40)
+    assert limiter._tokens_in_window == 100
+
+    clock["now"] += 30
+    await limiter.acquire(50)
+    # Both earlier requests were sent at the same time, so both leave the window after 30 more seconds
+    assert clock["sleeps"] == [pytest.approx(30)]
+    assert limiter._tokens_in_window == 50
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_oversized_request_waits_for_empty_window(clock):
+    limiter = RateLimiter(tokens_per_minute=100)
+    await limiter.acquire(10)
+    await limiter.acquire(500)
+    assert clock["sleeps"] == [pytest.approx(60)]
+    assert limiter._tokens_in_window == 500
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_unlimited(clock):
+    limiter = RateLimiter()
+    for _ in range(100):
+        await limiter.acquire(10**6)
+    assert clock["sleeps"] == []
@@ -0,0 +1,93 @@
+import pytest
+
+from datastore.providers.numpy_datastore import NumpyDataStore
+from models.models import Query, QueryResult
+from services import query_cache as query_cache_module
+from services.query_cache import QueryResultCache
+
+MODEL = "test-model"
+
+
+def query(text: str = "lorem", source_id: str = "a") -> Query:
+    return Query(query=text, source_id=source_id, top_k=3)
+
+
+def result(text: str = "lorem") -> QueryResult:
+    return QueryResult(query=text, results=[])
+
+
+def test_get_returns_put_result():
+    cache = QueryResultCache()
+    key = cache.key(query(), MODEL)
+    cache.put(key, result())
+
+    assert cache.get(key) == result()
+    assert cache.get(cache.key(query("other"), MODEL)) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_invalidate_source_only_affects_that_source():
+    cache = QueryResultCache()
+    key_a = cache.key(query(source_id="a"), MODEL)
+    key_b = cache.key(query(source_id="b"), MODEL)
+    cache.put(key_a, result())
+    cache.put(key_b, result())
+
+    cache.invalidate("a")
+
+    assert cache.get(cache.key(query(source_id="a"), MODEL)) is None
+    assert cache.get(cache.key(query(source_id="b"), MODEL)) == result()
+
+
+def test_key_taken_before_invalidation_is_never_served():
+    cache = QueryResultCache()
+    # A query reads the datastore, a write invalidates the source, then the query stores its stale result
+    stale_key = cache.key(query(), MODEL)
+    cache.invalidate("a")
+    cache.put(stale_key, result())
+
+    assert cache.get(cache.key(query(), MODEL)) is None
+
+
+def test_invalidate_all_never_reuses_generations():
+    cache = QueryResultCache()
+    stale_key = cache.key(query(), MODEL)
+
+    cache.invalidate(None)
+    cache.put(stale_key, result())
+
+    assert cache.get(cache.key(query(), MODEL)) is None
+    assert cache.stats()["items"] == 1
+
+
+def test_ttl_expires_entries():
+    cache = QueryResultCache(ttl_seconds=0)
+    key = cache.key(query(), MODEL)
+    cache.put(key, result())
+
+    assert cache.get(key) is None
+
+
+def test_lru_bound():
+    cache = QueryResultCache(max_items=1)
+    first = cache.key(query("first"), MODEL)
+    second = cache.key(query("second"), MODEL)
+    cache.put(first, result("first"))
+    cache.put(second, result("second"))
+
+    assert cache.get(first) is None
+    assert cache.get(second) == result("second")
+
+
+@pytest.mark.asyncio
+async def test_datastore_delete_invalidates_source(tmp_path, monkeypatch):
+    monkeypatch.setenv("QUERY_CACHE_ENABLED", "true")
+    monkeypatch.setattr(query_cache_module, "_query_cache", QueryResultCache())
+    cache = query_cache_module.get_query_cache()
+    key = cache.key(query(), MODEL)
+    cache.put(key, result())
+
+    await NumpyDataStore(path=str(tmp_path), dimension=8).delete(source_id="a", delete_all=True)
+
+    assert cache.get(cache.key(query(), MODEL)) is None
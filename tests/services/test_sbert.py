@@ -0,0 +1,246 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from services import sbert
+from services.sbert import ModelRegistry
+
+MB = 2**20
+
+
+class StubModel:
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.model_bytes = size
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """Replace model loading with stub models of 100 MB each, recording every load."""
+    calls = []
+
+    def fake_load_model(model_name, backend):
+        calls.append((model_name, backend))
+        return StubModel(model_name, 100 * MB)
+
+    monkeypatch.setattr(sbert, "_load_model", fake_load_model)
+    return calls
+
+
+def test_registry_hit_and_miss(loads):
+    registry = ModelRegistry()
+
+    first = registry.get("a")
+    second = registry.get("a")
+
+    assert first is second
+    assert loads == [("a", "torch")]
+    stats = registry.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    assert stats["loaded_bytes"] == 100 * MB
+
+
+def test_registry_keys_include_backend(loads):
+    registry = ModelRegistry()
+
+    assert registry.get("a") is not registry.get("a", backend="onnx")
+    assert registry.stats()["models"] == ["a", "a (onnx)"]
+
+
+def test_registry_evicts_least_recently_used_over_max_bytes(loads):
+    registry = ModelRegistry(max_bytes=250 * MB)
+    registry.get("a")
+    registry.get("b")
+    # Using "a" again makes "b" the least recently used model
+    registry.get("a")
+    registry.get("c")
+
+    stats = registry.stats()
+    assert stats["models"] == ["a", "c"]
+    assert stats["evictions"] == 1
+    assert stats["loaded_bytes"] == 200 * MB
+    assert set(stats["load_seconds"]) == {"a", "c"}
+
+
+def test_registry_keeps_most_recent_model_over_max_bytes(loads):
+    registry = ModelRegistry(max_bytes=50 * MB)
+    registry.get("a")
+    registry.get("b")
+
+    assert registry.stats()["models"] == ["b"]
+
+
+def test_registry_clear(loads):
+    registry = ModelRegistry()
+    registry.get("a")
+
+    registry.clear()
+
+    stats = registry.stats()
+    assert stats["models"] == []
+    assert stats["load_seconds"] == {}
+    assert stats["loaded_bytes"] == 0
+
+
+def test_registry_slow_load_does_not_block_other_models(monkeypatch):
+    release = threading.Event()
+
+    def fake_load_model(model_name, backend):
+        if model_name == "slow":
+            release.wait(5)
+        return StubModel(model_name, MB)
+
+    monkeypatch.setattr(sbert, "_load_model", fake_load_model)
+    registry = ModelRegistry()
+    registry.get("fast")
+
+    slow = threading.Thread(target=registry.get, args=("slow",))
+    slow.start()
+    time.sleep(0.05)
+    start = time.perf_counter()
+    registry.get("fast")
+    assert time.perf_counter() - start < 1
+
+    release.set()
+    slow.join()
+    assert registry.stats()["models"] == ["fast", "slow"]
+
+
+def test_registry_concurrent_requests_load_once(monkeypatch):
+    calls = []
+
+    def fake_load_model(model_name, backend):
+        calls.append(model_name)
+        time.sleep(0.05)
+        return StubModel(model_name, MB)
+
+    monkeypatch.setattr(sbert, "_load_model", fake_load_model)
+    registry = ModelRegistry()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("a"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["a"]
+    assert len({id(model) for model in results}) == 1
+
+
+def test_registry_failed_load_is_retried(monkeypatch):
+    attempts = []
+
+    def fake_load_model(model_name, backend):
+        attempts.append(model_name)
+        if len(attempts) == 1:
+            raise OSError("download failed")
+        return StubModel(model_name, MB)
+
+    monkeypatch.setattr(sbert, "_load_model", fake_load_model)
+    registry = ModelRegistry()
+
+    with pytest.raises(OSError):
+        registry.get("a")
+    assert registry.get("a").name == "a"
+    assert len(attempts) == 2
+
+
+class StubEncoder:
+    """Embeds each text as [length, first character code] and records the texts of every encode batch."""
+
+    def __init__(self, scale: float = 1.0):
+        self.scale = scale
+        self.batches = []
+
+    def get_sentence_embedding_dimension(self):
+        return 2
+
+    def _embed(self, texts):
+        return np.array([[len(text), ord(text[0]) * self.scale] for text in texts], dtype=np.float32)
+
+    def encode(self, texts, batch_size, show_progress_bar, convert_to_numpy):
+        self.batches.append(list(texts))
+        return self._embed(texts)
+
+    def start_multi_process_pool(self, target_devices):
+        return {"devices": target_devices}
+
+    def encode_multi_process(self, texts, pool, batch_size):
+        self.batches.append(list(texts))
+        return self._embed(texts)
+
+
+TEXTS = ["ccc", "a", "eeeee", "bb", "dddd", "ffffff"]
+
+
+def test_encode_length_sorted_restores_input_order():
+    model = StubEncoder()
+
+    embeddings = sbert.encode_length_sorted(model, TEXTS, batch_size=2)
+
+    np.testing.assert_array_equal(embeddings, model._embed(TEXTS))
+    # Batches hold texts of similar length, longest first
+    assert model.batches == [["ffffff", "eeeee"], ["dddd", "ccc"], ["bb", "a"]]
+
+
+def test_encode_length_sorted_empty():
+    assert sbert.encode_length_sorted(StubEncoder(), []).shape == (0, 2)
+
+
+def test_encode_pool_restores_input_order():
+    model = StubEncoder()
+    pool = sbert.EncodePool(workers=2)
+
+    embeddings = pool.encode("stub", model, TEXTS)
+
+    np.testing.assert_array_equal(embeddings, model._embed(TEXTS))
+    assert model.batches == [["ffffff", "eeeee", "dddd", "ccc", "bb", "a"]]
+
+
+class StubPool:
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.calls = 0
+
+    def encode(self, model_name, model, texts):
+        self.calls += 1
+        return model._embed(texts)
+
+
+@pytest.mark.parametrize(
+    "workers, backend, min_texts, uses_pool",
+    [
+        (0, "torch", 1, False),
+        (2, "onnx", 1, False),
+        (2, "torch", len(TEXTS) + 1, False),
+        (2, "torch", len(TEXTS), True),
+    ],
+)
+def test_pool_gate(monkeypatch, workers, backend, min_texts, uses_pool):
+    model = StubEncoder()
+    pool = StubPool(workers)
+    monkeypatch.setattr(sbert, "get_model", lambda embedding_model=None, backend=None: model)
+    monkeypatch.setattr(sbert, "encode_pool", pool)
+    monkeypatch.setattr(sbert, "SBERT_BACKEND", backend)
+    monkeypatch.setattr(sbert, "SBERT_POOL_MIN_TEXTS", min_texts)
+
+    embeddings = sbert.get_embeddings(TEXTS, "stub")
+
+    np.testing.assert_array_equal(embeddings, model._embed(TEXTS))
+    assert pool.calls == (1 if uses_pool else 0)
+    assert (len(model.batches) > 0) != uses_pool
+
+
+def test_check_backend_parity(monkeypatch):
+    models = {"torch": StubEncoder(), "same": StubEncoder(), "drifted": StubEncoder(scale=1.5)}
+    monkeypatch.setattr(sbert, "get_model", lambda embedding_model=None, backend=None: models[backend])
+
+    same = sbert.check_backend_parity(TEXTS, "stub", "same")
+    drifted = sbert.check_backend_parity(TEXTS, "stub", "drifted")
+
+    assert same["min_cosine"] == pytest.approx(1)
+    assert same["max_drift"] == pytest.approx(0, abs=1e-6)
+    assert drifted["max_drift"] > 0
+    assert drifted["mean_cosine"] < 1
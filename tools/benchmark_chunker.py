@@ -0,0 +1,108 @@
+import argparse
+import random
+import time
+from typing import List, Optional
+
+from services.chunks import (
+    CHUNK_SIZE,
+    MAX_NUM_CHUNKS,
+    MIN_CHUNK_LENGTH_TO_EMBED,
+    MIN_CHUNK_SIZE_CHARS,
+    get_text_chunks,
+    tokenizer,
+)
+
+SIZES = {"small": 10_000, "medium": 500_000, "large": 5_000_000}  # Input sizes in characters
+
+WORDS = (
+    "tenant lease rent unit property payment late fee notice renewal move in out deposit balance "
+    "maintenance request kitchen sink leak charge credit 1250.00 2021-06-01 B-204 Lakeside Main St"
+).split()
+
+
+def legacy_get_text_chunks(text: str, chunk_token_size: Optional[int]) -> List[str]:
+    """
+    The previous get_text_chunks, which re-slices the remaining tokens after every chunk.
+    """
+    if not text or text.isspace():
+        return []
+
+    tokens = tokenizer.encode(text, disallowed_special=())
+    chunks = []
+    chunk_size = chunk_token_size or CHUNK_SIZE
+    num_chunks = 0
+
+    while tokens and num_chunks < MAX_NUM_CHUNKS:
+        chunk = tokens[:chunk_size]
+        chunk_text = tokenizer.decode(chunk)
+
+        if not chunk_text or chunk_text.isspace():
+            tokens = tokens[len(chunk) :]
+            continue
+
+        last_punctuation = max(
+            chunk_text.rfind("."),
+            chunk_text.rfind("?"),
+            chunk_text.rfind("!"),
+            chunk_text.rfind("\n"),
+        )
+
+        if last_punctuation != -1 and last_punctuation > MIN_CHUNK_SIZE_CHARS:
+            chunk_text = chunk_text[: last_punctuation + 1]
+
+        chunk_text_to_append = chunk_text.replace("\n", " ").strip()
+
+        if len(chunk_text_to_append) > MIN_CHUNK_LENGTH_TO_EMBED:
+            chunks.append(chunk_text_to_append)
+
+        tokens = tokens[len(tokenizer.encode(chunk_text, disallowed_special=())) :]
+        num_chunks += 1
+
+    if tokens:
+        remaining_text = tokenizer.decode(tokens).replace("\n", " ").strip()
+        if len(remaining_text) > MIN_CHUNK_LENGTH_TO_EMBED:
+            chunks.append(remaining_text)
+
+    return chunks
+
+
+def make_text(size: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    while length < size:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 30)))
+        sentence = sentence.capitalize() + rng.choice([".", ".", ".", "?", "!", ";", ""]) + rng.choice([" ", " ", "\n", "\n\n"])
+        parts.append(sentence)
+        length += len(sentence)
+    return "".join(parts)[:size]
+
+
+def timed(fn, text: str, chunk_token_size: Optional[int]):
+    start = time.perf_counter()
+    chunks = fn(text, chunk_token_size)
+    return chunks, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the output and speed of get_text_chunks against the previous re-slicing chunker"
+    )
+    parser.add_argument("--sizes", default="small,medium,large", help="Comma separated sizes: small, medium, large")
+    parser.add_argument("--file", default=None, help="Optional text file to chunk instead of generated text")
+    parser.add_argument("--chunk-token-size", default=None, type=int, help="Chunk size in tokens, defaults to CHUNK_SIZE")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            inputs = {args.file: f.read()}
+    else:
+        inputs = {name: make_text(SIZES[name]) for name in args.sizes.split(",")}
+
+    for name, text in inputs.items():
+        legacy_chunks, legacy_seconds = timed(legacy_get_text_chunks, text, args.chunk_token_size)
+        chunks, seconds = timed(get_text_chunks, text, args.chunk_token_size)
+        print(
+            f"{name:>8}: {len(text)} chars, {len(chunks)} chunks, same output {chunks == legacy_chunks}, "
+            f"legacy {legacy_seconds:.3f}s, current {seconds:.3f}s, speedup {legacy_seconds / seconds:.1f}x"
+        )
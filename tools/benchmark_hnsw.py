@@ -0,0 +1,79 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from datastore.providers.numpy_datastore import ColumnFile
+from datastore.providers.numpy_hnsw import HnswIndex
+
+
+def make_vectors(rows: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Normalized vectors scattered around random cluster centers, closer to real embeddings than uniform noise.
+    """
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, rows)] + 0.5 * rng.standard_normal((rows, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def open_index(path: str, vectors: ColumnFile, lengths: dict, args) -> HnswIndex:
+    def column(name: str, dtype, row_shape: tuple = ()) -> ColumnFile:
+        return ColumnFile(os.path.join(path, name), dtype, lengths.get(name, 0), row_shape)
+
+    return HnswIndex(
+        vectors,
+        column,
+        os.path.join(path, "hnsw.npz"),
+        m=args.m,
+        ef_construction=args.ef_construction,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the recall@k and QPS of the HNSW index against exact search")
+    parser.add_argument("--rows", default=20000, type=int, help="Number of indexed vectors")
+    parser.add_argument("--dim", default=384, type=int, help="Vector dimension")
+    parser.add_argument("--clusters", default=100, type=int, help="Number of clusters the vectors are drawn around")
+    parser.add_argument("--queries", default=200, type=int, help="Number of queries")
+    parser.add_argument("--top-k", default=10, type=int, help="Neighbors per query")
+    parser.add_argument("--m", default=16, type=int, help="HNSW links per row on upper layers")
+    parser.add_argument("--ef-construction", default=100, type=int, help="HNSW candidate list size when linking")
+    parser.add_argument("--ef-search", default="16,32,64,128,256", help="Comma separated candidate list sizes to search with")
+    parser.add_argument("--seed", default=0, type=int, help="Random seed")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    data = make_vectors(args.rows + args.queries, args.dim, args.clusters, rng)
+    queries, data = data[: args.queries], data[args.queries :]
+
+    with tempfile.TemporaryDirectory() as path:
+        vectors = ColumnFile(os.path.join(path, "vectors.f32"), np.float32, 0, (args.dim,))
+        vectors.append(data)
+
+        start = time.perf_counter()
+        index = open_index(path, vectors, {}, args)
+        index.add(len(data))
+        index.save()
+        build_seconds = time.perf_counter() - start
+        print(f"build: {args.rows} rows in {build_seconds:.1f}s, {args.rows / build_seconds:.0f} rows/s")
+
+        lengths = {os.path.basename(f.path): f.length for f in index.files()}
+        start = time.perf_counter()
+        index = open_index(path, vectors, lengths, args)
+        print(f"reload: {time.perf_counter() - start:.3f}s, {index.count} rows")
+
+        start = time.perf_counter()
+        # The same argpartition top-k as the datastore's exact search, recall only compares the sets
+        exact = [np.argpartition(-(vectors.array @ query), args.top_k - 1)[: args.top_k] for query in queries]
+        exact_seconds = time.perf_counter() - start
+        print(f" exact: recall@{args.top_k} 1.000, {args.queries / exact_seconds:.0f} QPS")
+
+        for ef in [int(ef) for ef in args.ef_search.split(",")]:
+            start = time.perf_counter()
+            hits = [index.search(query, args.top_k, ef=ef)[0] for query in queries]
+            seconds = time.perf_counter() - start
+            recall = np.mean([len(np.intersect1d(h, e)) / args.top_k for h, e in zip(hits, exact)])
+            print(f"ef={ef:>5}: recall@{args.top_k} {recall:.3f}, {args.queries / seconds:.0f} QPS")
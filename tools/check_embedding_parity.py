@@ -0,0 +1,41 @@
+import argparse
+import json
+
+from services.sbert import SBERT_BACKENDS, check_backend_parity
+
+SAMPLE_TEXTS = [
+    "The Tenant John Doe performed Move In in unit 101 in property 12 Main St (main) with the rent amount of 1250.00 on the date 2021-06-01.",
+    "The Tenant Jane Roe performed Notice Given in unit B-204 in property Lakeside Apartments (lake) on the date 2022-11-15.",
+    "Rent was paid late three months in a row and a late fee of 75.00 was charged each time.",
+    "What is the current rent for the tenant in unit 3C?",
+    "Lease renewal offered with a 3% increase effective next month.",
+    "Maintenance request: the kitchen sink is leaking under the cabinet.",
+]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Report the cosine drift and encode time of the SBERT backends against the torch backend"
+    )
+    parser.add_argument("--model", default=None, help="The sentence-transformer model, defaults to all-MiniLM-L6-v2")
+    parser.add_argument("--backends", default="torch-int8,onnx,onnx-int8", help="Comma separated backends to check")
+    parser.add_argument("--texts", default=None, help="Optional path to a jsonl file with a 'text' field per line")
+    parser.add_argument("--repeat", default=20, type=int, help="How many times to repeat the sample texts")
+    args = parser.parse_args()
+
+    if args.texts:
+        with open(args.texts) as f:
+            texts = [json.loads(line)["text"] for line in f if line.strip()]
+    else:
+        texts = SAMPLE_TEXTS * args.repeat
+
+    for backend in args.backends.split(","):
+        if backend not in SBERT_BACKENDS:
+            print(f"Skipping unknown backend {backend}")
+            continue
+        # The first call per backend loads (and for onnx exports) the model, so time a second run
+        check_backend_parity(texts[:1], args.model, backend)
+        result = check_backend_parity(texts, args.model, backend)
+        print(
+            f"{backend:>10}: min cosine {result['min_cosine']:.6f}, mean cosine {result['mean_cosine']:.6f}, "
+            f"max drift {result['max_drift']:.2e}, speedup {result['reference_seconds'] / result['backend_seconds']:.2f}x"
+        )